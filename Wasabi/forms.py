@@ -1,17 +1,16 @@
 from django.contrib.auth.forms import UserCreationForm
-from django.contrib.auth.models import Group
+
+from takeaway.ruoli import CLIENTI, DIPENDENTI, id_gruppo
 
 
 class CreaUtenteCliente(UserCreationForm):
     def save(self, commit=True):
         user = super().save(commit) # Ottengo un riferimento all'utente
-        g = Group.objects.get(name='Clienti') # Cerco il gruppo
-        g.user_set.add(user) # Aggiungo l'utente al gruppo
+        user.groups.add(id_gruppo(CLIENTI)) # Aggiungo l'utente al gruppo (id in cache)
         return user
 
 class CreaUtenteDipendente(UserCreationForm):
     def save(self, commit=True):
         user = super().save(commit)  # Ottengo un riferimento all'utente
-        g = Group.objects.get(name='Dipendenti')  # Cerco il gruppo
-        g.user_set.add(user)  # Aggiungo l'utente al gruppo
+        user.groups.add(id_gruppo(DIPENDENTI))  # Aggiungo l'utente al gruppo (id in cache)
         return user
\ No newline at end of file
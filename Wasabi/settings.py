@@ -49,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'takeaway.ruoli.RuoloMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,6 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'takeaway.ruoli.ruolo',
             ],
         },
     },
@@ -80,10 +82,85 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Le transazioni prendono subito il lock di scrittura: i checkout concorrenti
+            # vengono serializzati invece di fallire con "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # DB di test su file: in memoria SQLite usa lock per tabella e i test concorrenti fallirebbero
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Con più processi usare 'django.core.cache.backends.filebased.FileBasedCache'
+# (con LOCATION) così l'invalidazione del menu è condivisa tra i worker
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Dati che devono essere uguali in tutti i worker (gruppi degli utenti, versioni): mai LocMemCache.
+    # Tabella creata con `manage.py createcachetable`; in produzione va bene anche Redis/Memcached
+    'condivisa': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'takeaway_cache_condivisa',
+    },
+    # Carrelli di CacheCarrelloStore: condivisa e senza eviction, un carrello scartato prima del salvataggio
+    # andrebbe perso (con Redis: maxmemory-policy noeviction)
+    'carrelli': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'takeaway_cache_carrelli',
+        'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+    },
+}
+
+# Durata (secondi) delle griglie del menu in cache
+MENU_CACHE_TIMEOUT = 60 * 15
+
+# Versioni del menu e dei premi (chiavi delle griglie, ETag delle API): alias in CACHES condiviso tra i processi,
+# e ogni quanti secondi, al massimo, un processo rilegge le modifiche fatte dagli altri
+VERSIONI_CACHE = 'condivisa'
+VERSIONI_CACHE_SECONDI = 5
+
+# Gruppi degli utenti in cache: alias in CACHES (condiviso tra i processi) e durata in secondi.
+# La cache viene svuotata quando i gruppi cambiano; la durata limita solo i casi sfuggiti all'invalidazione
+RUOLI_CACHE = 'condivisa'
+RUOLI_CACHE_TIMEOUT = 60 * 5
+
+# Ogni quanti secondi, al massimo, ogni processo rilegge i premi della carta fedeltà dal DB
+# (subito se la modifica avviene nello stesso processo)
+PREMI_FEDELTA_CACHE_SECONDI = 60
+
+
+# Dove vengono tenuti i carrelli dei clienti:
+#  - 'takeaway.carrelli.DBCarrelloStore': tabelle Carrello/PiattoCarrello
+#  - 'takeaway.carrelli.SessionCarrelloStore': sessione (con SESSION_ENGINE signed_cookies non usa il DB)
+#  - 'takeaway.carrelli.CacheCarrelloStore': cache, salvati nel DB al massimo ogni CARRELLO_WRITE_BEHIND_SECONDI
+CARRELLO_BACKEND = 'takeaway.carrelli.DBCarrelloStore'
+CARRELLO_WRITE_BEHIND_SECONDI = 30
+CARRELLO_CACHE = 'carrelli'  # Alias in CACHES usato da CacheCarrelloStore
+
+# Dopo quante ore le chiavi di checkout vengono eliminate da pulisci_chiavi_checkout
+CHECKOUT_CHIAVE_DURATA_ORE = 24
+
+# Fasce di ritiro create da genera_fasce_ritiro: (apertura, chiusura, ordini per fascia)
+FASCE_RITIRO = [
+    ("12:00", "14:30", 4),
+    ("19:00", "22:30", 6),
+]
+FASCIA_RITIRO_MINUTI = 15
+# Giorni di fasce create in automatico dal checkout (0: solo con genera_fasce_ritiro)
+FASCE_RITIRO_GIORNI = 7
+# Quante fasce libere proporre nella pagina di checkout
+FASCE_RITIRO_MOSTRATE = 12
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -121,9 +198,33 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 
+# In produzione serviti dal web server, con Cache-Control immutable per i nomi dati dal contenuto (vedi README.md)
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Thread usati per generare le rendition delle foto dei piatti
+RENDITION_WORKERS = 2
+
+# Coda dei job in background (worker: python manage.py esegui_job)
+JOB_WORKERS = 4
+JOB_TENTATIVI = 5
+JOB_RITARDO_BASE_SECONDI = 30  # Attesa prima del secondo tentativo, raddoppia ad ogni errore
+JOB_TIMEOUT_SECONDI = 600  # Dopo questo tempo un job "in corso" viene ripreso da un altro worker
+JOB_ATTESA_MASSIMA_SECONDI = 900  # Job in attesa da più tempo: probabilmente il worker non è avviato
+
+# Bacheca ordini in tempo reale (servire con ASGI, es. uvicorn Wasabi.asgi:application)
+BACHECA_POLLING_SECONDI = 2  # Ogni quanto leggere gli eventi scritti da altri processi
+BACHECA_KEEPALIVE_SECONDI = 20
+BACHECA_ATTESA_WSGI_SECONDI = 20  # Senza ASGI: attesa massima di una richiesta in long polling
+EVENTI_ORDINI_DURATA_ORE = 24  # Eventi più vecchi eliminati da pulisci_eventi_ordini
+
+# Gli ordini chiusi con ritiro più vecchio di così vengono spostati nell'archivio da archivia_ordini
+ARCHIVIO_ORDINI_GIORNI = 30
+
+# Statistiche di vendita: aggiorna_statistiche conta gli ordini chiusi da almeno questo tempo
+STATISTICHE_MARGINE_SECONDI = 60
+STATISTICHE_PERIODI_GIORNI = [7, 30, 90, 365]  # Periodi selezionabili nella dashboard
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,9 +1,12 @@
+from django.conf import settings
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.http import HttpResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
 from django.views.generic import CreateView
+from django.views.static import serve
 
+from takeaway.storage import NOME_IMMUTABILE
 from Wasabi.forms import CreaUtenteCliente, CreaUtenteDipendente
 
 
@@ -11,6 +14,15 @@ def homepage(request):
     return render(request, "home.html")
 
 
+# Media in sviluppo: i file con nome dato dal contenuto possono stare in cache per sempre
+# (in produzione lo stesso header va impostato sul web server per gli stessi nomi: vedi README.md)
+def media(request, path):
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if NOME_IMMUTABILE.search(path):
+        response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
 class ClienteCreateView(CreateView):
     form_class = CreaUtenteCliente
     template_name = "user_create.html"
@@ -2,4 +2,5 @@ from django.contrib import admin
 
 from takeaway.models import *
 
-admin.site.register(Piatto)
\ No newline at end of file
+admin.site.register(Piatto)
+admin.site.register(FasciaRitiro)
\ No newline at end of file
@@ -0,0 +1,148 @@
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
+
+from takeaway.cache import versione_menu
+from takeaway.models import Piatto
+
+# Campi esposti -> colonna da caricare (None se calcolato)
+CAMPI = {
+    'id': 'id',
+    'nome': 'nome',
+    'descrizione': 'descrizione',
+    'prezzo': 'prezzo',
+    'portata': 'portata',
+    'ingredienti': 'ingredienti',
+    'foto': 'foto',
+    'url': None,
+}
+
+LIMITE_DEFAULT = 20
+LIMITE_MASSIMO = 100
+
+
+class RichiestaNonValida(Exception):
+    pass
+
+
+def _campi_richiesti(request):
+    valore = request.GET.get('fields')
+    if not valore:
+        return list(CAMPI)
+
+    campi = list(dict.fromkeys(campo.strip() for campo in valore.split(',') if campo.strip()))
+    sconosciuti = [campo for campo in campi if campo not in CAMPI]
+    if sconosciuti:
+        raise RichiestaNonValida(f"Campi non validi: {', '.join(sconosciuti)}")
+    return campi
+
+
+def _colonne(campi):
+    return [CAMPI[campo] for campo in campi if CAMPI[campo]]
+
+
+def _serializza(request, piatto, campi):
+    dati = {}
+    for campo in campi:
+        if campo == 'prezzo':
+            dati[campo] = str(piatto.prezzo)
+        elif campo == 'foto':
+            dati[campo] = request.build_absolute_uri(piatto.foto.url) if piatto.foto else None
+        elif campo == 'url':
+            dati[campo] = request.build_absolute_uri(reverse('takeaway:piatto', args=[piatto.pk]))
+        else:
+            dati[campo] = getattr(piatto, campo)
+    return dati
+
+
+def _codifica_cursore(piatto):
+    return base64.urlsafe_b64encode(f"{piatto.portata_ordine}:{piatto.pk}".encode()).decode()
+
+
+def _decodifica_cursore(cursore):
+    try:
+        ordine, pk = base64.urlsafe_b64decode(cursore.encode()).decode().split(':')
+        return int(ordine), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise RichiestaNonValida("Cursore non valido")
+
+
+# Risposta JSON con ETag forte legato alla versione del menu:
+# se il client ha già questa versione -> 304 senza toccare il DB
+def _risposta_versionata(request, costruisci):
+    firma = f"{versione_menu()}|{request.build_absolute_uri()}"
+    etag = quote_etag(hashlib.sha256(firma.encode()).hexdigest())
+
+    non_modificato = get_conditional_response(request, etag=etag)
+    if non_modificato is not None:
+        return non_modificato
+
+    chiave = f"takeaway:api:{etag}"
+    corpo = cache.get(chiave)
+    if corpo is None:
+        try:
+            corpo = json.dumps(costruisci(), cls=DjangoJSONEncoder)
+        except RichiestaNonValida as e:
+            return JsonResponse({'errore': str(e)}, status=400)
+        cache.set(chiave, corpo, settings.MENU_CACHE_TIMEOUT)
+
+    response = HttpResponse(corpo, content_type="application/json")
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"  # Il client deve sempre rivalidare con If-None-Match
+    return response
+
+
+# Elenco piatti in ordine di menu, con paginazione a cursore
+@require_GET
+def api_piatti(request):
+    def costruisci():
+        campi = _campi_richiesti(request)
+        try:
+            limite = min(max(int(request.GET.get('limit', LIMITE_DEFAULT)), 1), LIMITE_MASSIMO)
+        except ValueError:
+            raise RichiestaNonValida("Limite non valido")
+
+        queryset = Piatto.objects.only('portata_ordine', *_colonne(campi)).order_by('portata_ordine', 'id')
+
+        portata = request.GET.get('portata')
+        if portata:
+            queryset = queryset.filter(portata=portata)
+        ingrediente = request.GET.get('ingrediente')
+        if ingrediente:
+            queryset = queryset.filter(ingredienti=ingrediente)
+
+        cursore = request.GET.get('cursor')
+        if cursore:
+            ordine, pk = _decodifica_cursore(cursore)
+            queryset = queryset.filter(Q(portata_ordine__gt=ordine) | Q(portata_ordine=ordine, id__gt=pk))
+
+        piatti = list(queryset[:limite + 1])
+        successivo = _codifica_cursore(piatti[limite - 1]) if len(piatti) > limite else None
+
+        return {
+            'risultati': [_serializza(request, piatto, campi) for piatto in piatti[:limite]],
+            'successivo': successivo,
+        }
+
+    return _risposta_versionata(request, costruisci)
+
+
+@require_GET
+def api_piatto(request, pk):
+    def costruisci():
+        campi = _campi_richiesti(request)
+        piatto = get_object_or_404(Piatto.objects.only('id', *_colonne(campi)), pk=pk)
+        return _serializza(request, piatto, campi)
+
+    return _risposta_versionata(request, costruisci)
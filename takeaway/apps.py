@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TakeawayConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'takeaway'
+
+    def ready(self):
+        from takeaway import checks, signals  # noqa: F401
@@ -0,0 +1,53 @@
+from django.db import transaction
+
+from takeaway.bacheca import senza_eventi
+from takeaway.models import Ordine, OrdineArchiviato, PiattoOrdine, PiattoOrdineArchiviato
+from takeaway.ordini import STATI_FINALI
+from takeaway.statistiche import aggiorna_statistiche, avanzamento_attivo, gia_contati
+
+CAMPI_ORDINE = ["id", "cliente_id", "orario_ritiro", "fascia_ritiro_id", "stato", "creato_il", "chiuso_il",
+                "sconto", "punti_assegnati", "totale"]
+CAMPI_RIGA = ["id", "ordine_id", "piatto_id", "quantita", "prezzo_unitario"]
+
+
+# Sposta nell'archivio gli ordini chiusi con ritiro prima di `prima_di`, a lotti:
+# ogni lotto è una transazione breve, così il resto del sito non resta bloccato.
+# Passano all'archivio solo ordini già contati nelle statistiche di vendita
+def archivia_ordini(prima_di, lotto=500):
+    aggiorna_statistiche(lotto)
+    contati = gia_contati(avanzamento_attivo())
+    archiviati = 0
+    while True:
+        with transaction.atomic():
+            ordini = list(Ordine.objects.filter(contati, stato__in=STATI_FINALI, orario_ritiro__lt=prima_di)
+                          .order_by("id").values(*CAMPI_ORDINE)[:lotto])
+            if not ordini:
+                return archiviati
+            ids = [ordine["id"] for ordine in ordini]
+
+            OrdineArchiviato.objects.bulk_create([OrdineArchiviato(**ordine) for ordine in ordini])
+            PiattoOrdineArchiviato.objects.bulk_create(
+                [PiattoOrdineArchiviato(**riga) for riga in PiattoOrdine.objects.filter(ordine_id__in=ids).values(*CAMPI_RIGA)],
+                batch_size=lotto,
+            )
+            with senza_eventi():  # Non sono eliminazioni da mostrare sulla bacheca
+                Ordine.objects.filter(pk__in=ids).delete()
+
+        archiviati += len(ids)
+
+
+# Riporta gli ordini archiviati nelle tabelle degli ordini (stesso id)
+def ripristina_ordini(ids):
+    with transaction.atomic():
+        ordini = list(OrdineArchiviato.objects.filter(pk__in=ids).values(*CAMPI_ORDINE))
+        Ordine.objects.bulk_create([Ordine(**ordine) for ordine in ordini])
+        for ordine in ordini:
+            # bulk_create riempie creato_il (auto_now_add) con l'ora attuale
+            Ordine.objects.filter(pk=ordine["id"]).update(creato_il=ordine["creato_il"])
+
+        PiattoOrdine.objects.bulk_create(
+            [PiattoOrdine(**riga) for riga in PiattoOrdineArchiviato.objects.filter(ordine_id__in=ids).values(*CAMPI_RIGA)]
+        )
+        OrdineArchiviato.objects.filter(pk__in=ids).delete()
+
+    return len(ordini)
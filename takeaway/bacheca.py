@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.urls import reverse
+from django.utils import timezone
+
+from takeaway.models import EventoOrdine
+
+logger = logging.getLogger(__name__)
+
+_eventi_sospesi = ContextVar("eventi_sospesi", default=False)
+
+
+def dati_evento(ordine):
+    return {
+        'id': ordine.pk,
+        'stato': ordine.stato,
+        'stato_display': ordine.get_stato_display(),
+        'cliente': ordine.cliente.username,
+        'orario_ritiro': timezone.localtime(ordine.orario_ritiro).strftime("%d/%m/%Y %H:%M"),
+        'totale': str(ordine.totale - ordine.sconto),
+        'url': reverse('takeaway:ordine', args=[ordine.pk]),
+    }
+
+
+# Scrive l'evento nella transazione della modifica e, a commit avvenuto,
+# sveglia la bacheca di questo processo (gli altri processi lo leggono al prossimo polling)
+def registra_evento(ordine_id, tipo, dati):
+    if _eventi_sospesi.get():
+        return
+    EventoOrdine.objects.create(ordine_id=ordine_id, tipo=tipo, dati=dati)
+    transaction.on_commit(bacheca.notifica)
+
+
+# Come registra_evento per più ordini (aggiornamenti in blocco, che non inviano segnali)
+def registra_eventi(ordini, tipo):
+    EventoOrdine.objects.bulk_create([EventoOrdine(ordine_id=ordine.pk, tipo=tipo, dati=dati_evento(ordine))
+                                      for ordine in ordini])
+    transaction.on_commit(bacheca.notifica)
+
+
+# Modifiche che non devono comparire sulla bacheca (es. archiviazione degli ordini chiusi)
+@contextmanager
+def senza_eventi():
+    token = _eventi_sospesi.set(True)
+    try:
+        yield
+    finally:
+        _eventi_sospesi.reset(token)
+
+
+def ultimo_evento():
+    return EventoOrdine.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+
+
+LIMITE_EVENTI = 500  # Eventi letti dal DB per volta
+
+
+def eventi_dopo(ultimo_id, limite=LIMITE_EVENTI):
+    return list(EventoOrdine.objects.filter(id__gt=ultimo_id).order_by('id')[:limite])
+
+
+# Pub/sub in processo: un solo thread per processo legge i nuovi eventi dal DB
+# (subito dopo una modifica fatta qui, o ogni BACHECA_POLLING_SECONDI per quelle fatte da altri worker)
+# e li distribuisce alle code dei client collegati. Senza client collegati il thread si ferma
+class Bacheca:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._iscritti = {}  # coda -> (event loop del client, ultimo evento già letto dal client)
+        self._sveglia = threading.Event()
+        self._thread = None
+
+    # ultimo_id: ultimo evento che il client ha già letto (o leggerà con l'arretrato)
+    def iscrivi(self, ultimo_id):
+        coda = asyncio.Queue()
+        with self._lock:
+            self._iscritti[coda] = (asyncio.get_running_loop(), ultimo_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._ascolta, daemon=True)
+                self._thread.start()
+        return coda
+
+    def disiscrivi(self, coda):
+        with self._lock:
+            self._iscritti.pop(coda, None)
+
+    def notifica(self):
+        self._sveglia.set()
+
+    def _ascolta(self):
+        try:
+            # Parto dal client più indietro: un evento scritto dopo che ha letto l'arretrato non va perso
+            with self._lock:
+                ultimo_id = min((cursore for loop, cursore in self._iscritti.values()), default=0)
+            while True:
+                self._sveglia.wait(settings.BACHECA_POLLING_SECONDI)
+                self._sveglia.clear()
+
+                with self._lock:
+                    if not self._iscritti:
+                        # Nello stesso blocco: chi si iscrive da qui in poi avvia un nuovo thread
+                        self._thread = None
+                        return
+                    iscritti = [(coda, loop) for coda, (loop, cursore) in self._iscritti.items()]
+
+                eventi = eventi_dopo(ultimo_id, LIMITE_EVENTI)
+                if eventi:
+                    ultimo_id = eventi[-1].id
+                    if len(eventi) == LIMITE_EVENTI:
+                        self._sveglia.set()  # Altri eventi da leggere: senza aspettare il polling
+                    for coda, loop in iscritti:
+                        for evento in eventi:
+                            try:
+                                loop.call_soon_threadsafe(coda.put_nowait, evento)
+                            except RuntimeError:
+                                self.disiscrivi(coda)  # Event loop del client già chiuso
+                                break
+        except Exception:
+            logger.exception("Lettura degli eventi della bacheca fallita")
+        finally:
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+            connection.close()  # Connessione del thread
+
+
+bacheca = Bacheca()
+
+
+def formatta_evento(evento):
+    dati = dict(evento.dati, tipo=evento.tipo)
+    return f"id: {evento.id}\nevent: ordine\ndata: {json.dumps(dati)}\n\n"
+
+
+# Flusso Server-Sent Events: prima gli eventi persi dopo ultimo_id (riconnessione),
+# poi quelli nuovi. Se non succede niente manda solo un commento ogni BACHECA_KEEPALIVE_SECONDI
+async def flusso_eventi(ultimo_id):
+    coda = bacheca.iscrivi(ultimo_id)  # Prima dell'arretrato: nessun evento può andare perso nel mezzo
+    try:
+        for evento in await sync_to_async(eventi_dopo)(ultimo_id):
+            ultimo_id = evento.id
+            yield formatta_evento(evento)
+
+        while True:
+            try:
+                evento = await asyncio.wait_for(coda.get(), settings.BACHECA_KEEPALIVE_SECONDI)
+            except TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if evento.id > ultimo_id:  # Già mandato con l'arretrato
+                ultimo_id = evento.id
+                yield formatta_evento(evento)
+    finally:
+        bacheca.disiscrivi(coda)
+
+
+# Senza ASGI (WSGI, runserver) un flusso infinito terrebbe occupato un thread per sempre e StreamingHttpResponse
+# non invierebbe nulla: long polling. Gli eventi dopo ultimo_id appena ci sono (al più BACHECA_ATTESA_WSGI_SECONDI
+# di attesa), poi la risposta finisce e EventSource si ricollega da solo con Last-Event-ID
+def eventi_long_polling(ultimo_id):
+    fine = time.monotonic() + settings.BACHECA_ATTESA_WSGI_SECONDI
+    yield "retry: 1000\n\n"  # Riconnessione dopo un secondo
+    while True:
+        eventi = eventi_dopo(ultimo_id)
+        if eventi:
+            for evento in eventi:
+                yield formatta_evento(evento)
+            return
+        rimanente = fine - time.monotonic()
+        if rimanente <= 0:
+            return
+        time.sleep(min(settings.BACHECA_POLLING_SECONDI, rimanente))
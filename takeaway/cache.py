@@ -0,0 +1,75 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+CHIAVE_VERSIONE_MENU = "takeaway:menu:versione"
+CHIAVE_VERSIONE_SOGLIE = "takeaway:soglie:versione"
+
+_versioni = {}  # chiave -> (versione, scadenza): copia locale delle versioni lette da VERSIONI_CACHE
+
+
+def cache_versioni():
+    return caches[settings.VERSIONI_CACHE]
+
+
+# Le versioni stanno nella cache condivisa VERSIONI_CACHE, così le modifiche fatte da un altro processo
+# (altri worker, comandi come importa_menu, la shell) arrivano anche qui. Ogni processo ne tiene una copia
+# per VERSIONI_CACHE_SECONDI: nessuna lettura della cache condivisa ad ogni richiesta
+def _versione(chiave):
+    versione, scadenza = _versioni.get(chiave, (None, 0))
+    adesso = time.monotonic()
+    if adesso >= scadenza:
+        # Se la chiave non c'è (riavvio, eviction) riparto da un valore mai usato prima
+        versione = cache_versioni().get_or_set(chiave, time.time_ns, timeout=None)
+        _versioni[chiave] = (versione, adesso + settings.VERSIONI_CACHE_SECONDI)
+    return versione
+
+
+# Dimentica le copie locali: la prossima lettura va alla cache condivisa
+def rileggi_versioni():
+    _versioni.clear()
+
+
+# Nuovo valore (non un incremento: due processi che cambiano versione insieme non finiscono sullo stesso numero)
+def _incrementa_versione(chiave):
+    versione = time.time_ns()
+    cache_versioni().set(chiave, versione, timeout=None)
+    _versioni[chiave] = (versione, time.monotonic() + settings.VERSIONI_CACHE_SECONDI)
+
+
+# Versione corrente del menu: cambia ogni volta che un piatto viene salvato o eliminato
+def versione_menu():
+    return _versione(CHIAVE_VERSIONE_MENU)
+
+
+def incrementa_versione_menu():
+    _incrementa_versione(CHIAVE_VERSIONE_MENU)
+
+
+# Versione dei premi della carta fedeltà: cambia ogni volta che una soglia viene salvata o eliminata
+def versione_soglie():
+    return _versione(CHIAVE_VERSIONE_SOGLIE)
+
+
+def incrementa_versione_soglie():
+    _incrementa_versione(CHIAVE_VERSIONE_SOGLIE)
+
+
+# Parametri che decidono il contenuto della griglia del menu, normalizzati: la chiave in cache e i link
+# della griglia dipendono solo da questi
+def parametri_menu(parametri):
+    return {
+        'portata': parametri.get('portata', 'tutti'),
+        'ingrediente': parametri.get('ingrediente', 'tutti'),
+        'page': parametri.get('page', '1'),
+        'q': " ".join(parametri.get('q', '').lower().split()),
+    }
+
+
+# Chiave della griglia del menu per una combinazione di filtri e ruolo
+def chiave_menu(ruolo, parametri):
+    filtri = "|".join([ruolo, *parametri_menu(parametri).values()])
+    digest = hashlib.md5(filtri.encode(), usedforsecurity=False).hexdigest()
+    return f"takeaway:menu:{versione_menu()}:{digest}"
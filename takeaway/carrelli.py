@@ -0,0 +1,264 @@
+import abc
+import atexit
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from takeaway.models import Carrello, Piatto, PiattoCarrello
+
+logger = logging.getLogger(__name__)
+
+
+# Carrello del cliente, indipendente da dove viene salvato (CARRELLO_BACKEND)
+def get_carrello(request):
+    return import_string(settings.CARRELLO_BACKEND)(request.user, request)
+
+
+# Un backend deve implementare tutti i metodi astratti: uno incompleto fallisce già alla creazione
+class CarrelloStore(abc.ABC):
+    def __init__(self, user, request=None):
+        self.user = user
+        self.request = request
+
+    # Righe del carrello (PiattoCarrello con il piatto caricato)
+    @abc.abstractmethod
+    def righe(self):
+        pass
+
+    @abc.abstractmethod
+    def aggiungi(self, id_piatto, quantita=1):
+        pass
+
+    # Imposta le quantità {id_piatto: quantita}; 0 rimuove il piatto
+    @abc.abstractmethod
+    def applica(self, quantita):
+        pass
+
+    def rimuovi(self, id_piatto):
+        self.applica({id_piatto: 0})
+
+    @abc.abstractmethod
+    def svuota(self):
+        pass
+
+    # Chiave di checkout legata al contenuto del carrello, per i carrelli che una richiesta legge una volta
+    # sola e non dentro la transazione del checkout (None: si usa la chiave del form)
+    def chiave_checkout(self):
+        return None
+
+
+# Carrello salvato nelle tabelle Carrello/PiattoCarrello
+class DBCarrelloStore(CarrelloStore):
+    def carrello(self):
+        if not hasattr(self, '_carrello'):
+            self._carrello, created = Carrello.objects.get_or_create(cliente=self.user)
+        return self._carrello
+
+    def righe(self):
+        return list(self.carrello().righe())
+
+    def aggiungi(self, id_piatto, quantita=1):
+        self.carrello().aggiungi(id_piatto, quantita)
+
+    def applica(self, quantita):
+        self.carrello().applica(quantita)
+
+    def svuota(self):
+        self.carrello().piatti.all().delete()
+
+
+# Carrello tenuto in un dizionario {id_piatto: quantita}; le sottoclassi decidono dove salvarlo
+class MemoriaCarrelloStore(CarrelloStore):
+    @abc.abstractmethod
+    def leggi(self):
+        pass
+
+    @abc.abstractmethod
+    def scrivi(self, dati):
+        pass
+
+    # Protegge lettura e scrittura del dizionario dalle richieste parallele dello stesso cliente
+    def blocco(self):
+        return nullcontext()
+
+    def righe(self):
+        dati = self.leggi()
+        piatti = Piatto.objects.in_bulk([int(id_piatto) for id_piatto in dati])
+        return [PiattoCarrello(piatto=piatti[int(id_piatto)], quantita=quantita)
+                for id_piatto, quantita in dati.items() if int(id_piatto) in piatti]
+
+    def aggiungi(self, id_piatto, quantita=1):
+        with self.blocco():
+            dati = self.leggi()
+            dati[str(id_piatto)] = dati.get(str(id_piatto), 0) + quantita
+            self.scrivi(dati)
+
+    def applica(self, quantita):
+        with self.blocco():
+            dati = self.leggi()
+            for id_piatto, q in quantita.items():
+                if q < 1:
+                    dati.pop(str(id_piatto), None)
+                else:
+                    dati[str(id_piatto)] = q
+            self.scrivi(dati)
+
+    def svuota(self):
+        with self.blocco():
+            self.scrivi({})
+
+
+# Carrello nella sessione: con SESSION_ENGINE signed_cookies non tocca né DB né cache.
+# La sessione viene salvata per intero a fine richiesta, quindi due richieste parallele dello stesso
+# cliente possono sovrascriversi a vicenda (ad es. un doppio click conta una sola aggiunta)
+class SessionCarrelloStore(MemoriaCarrelloStore):
+    CHIAVE = 'carrello'
+    CHIAVE_VERSIONE = 'carrello_versione'
+
+    def leggi(self):
+        return dict(self.request.session.get(self.CHIAVE, {}))
+
+    def scrivi(self, dati):
+        self.request.session[self.CHIAVE] = dati
+        self.request.session[self.CHIAVE_VERSIONE] = str(uuid.uuid4())
+
+    # Ogni richiesta ha la sua copia del carrello: due checkout paralleli troverebbero entrambi il carrello
+    # pieno. La chiave cambia ad ogni modifica, quindi lo stesso contenuto crea un solo ordine
+    def chiave_checkout(self):
+        if self.CHIAVE_VERSIONE not in self.request.session:
+            self.request.session[self.CHIAVE_VERSIONE] = str(uuid.uuid4())
+        return uuid.UUID(self.request.session[self.CHIAVE_VERSIONE])
+
+
+# Carrello in cache con salvataggio ritardato (write-behind) nelle tabelle del DB:
+# le modifiche vengono raccolte e scritte al massimo ogni CARRELLO_WRITE_BEHIND_SECONDI.
+# La cache (CARRELLO_CACHE) deve essere condivisa tra i processi e non deve scartare chiavi; i carrelli
+# da salvare sono segnati nel DB (Carrello.modifiche_in_sospeso), così li salva qualunque processo
+class CacheCarrelloStore(MemoriaCarrelloStore):
+    def leggi(self):
+        dati = cache_carrelli().get(chiave_carrello(self.user.pk))
+        if dati is None:
+            # Non in cache -> riparto dall'ultima versione salvata nel DB
+            dati = {str(id_piatto): quantita for id_piatto, quantita in
+                    PiattoCarrello.objects.filter(carrello__cliente=self.user).values_list('piatto_id', 'quantita')}
+            cache_carrelli().set(chiave_carrello(self.user.pk), dati, None)
+        return dati
+
+    def scrivi(self, dati):
+        cache_carrelli().set(chiave_carrello(self.user.pk), dati, None)
+        segna_da_salvare(self.user.pk)
+
+    # Lock nella cache condivisa: scade da solo se il processo che lo tiene muore
+    @contextmanager
+    def blocco(self):
+        chiave = f"{chiave_carrello(self.user.pk)}:blocco"
+        while not cache_carrelli().add(chiave, 1, BLOCCO_SECONDI):
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            cache_carrelli().delete(chiave)
+
+    def svuota(self):
+        super().svuota()
+        salva_carrelli([self.user.pk])  # Dopo il checkout il carrello nel DB va svuotato subito
+
+
+BLOCCO_SECONDI = 5
+
+
+def cache_carrelli():
+    return caches[settings.CARRELLO_CACHE]
+
+
+def chiave_carrello(id_utente):
+    return f"takeaway:carrello:{id_utente}"
+
+
+# Presente finché il carrello ha modifiche non ancora contate in Carrello.modifiche_in_sospeso
+def chiave_sporco(id_utente):
+    return f"takeaway:carrello:{id_utente}:sporco"
+
+
+_lock = threading.Lock()
+_timer = None
+
+
+# Segna il carrello da salvare: una scrittura nel DB solo alla prima modifica dopo l'ultimo salvataggio
+def segna_da_salvare(id_utente):
+    if cache_carrelli().add(chiave_sporco(id_utente), 1, None):
+        if not Carrello.objects.filter(cliente_id=id_utente).update(modifiche_in_sospeso=F('modifiche_in_sospeso') + 1):
+            Carrello.objects.get_or_create(cliente_id=id_utente)
+            Carrello.objects.filter(cliente_id=id_utente).update(modifiche_in_sospeso=F('modifiche_in_sospeso') + 1)
+    programma_salvataggio()
+
+
+def programma_salvataggio():
+    global _timer
+    with _lock:
+        if _timer is None:
+            _timer = threading.Timer(settings.CARRELLO_WRITE_BEHIND_SECONDI, _salva_in_background)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _salva_in_background():
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        if not salva_carrelli():
+            programma_salvataggio()  # Qualche carrello non è stato salvato: nuovo tentativo più tardi
+    except Exception:
+        logger.exception("Salvataggio dei carrelli fallito")
+        programma_salvataggio()
+    finally:
+        connection.close()  # Connessione del thread del timer
+
+
+# Scrive nel DB i carrelli modificati in cache (tutti quelli in attesa, anche di altri processi, se ids è None).
+# Un carrello resta segnato finché la scrittura non riesce; restituisce False se qualcuno è rimasto indietro
+def salva_carrelli(ids=None):
+    da_salvare = Carrello.objects.filter(modifiche_in_sospeso__gt=0)
+    if ids is not None:
+        da_salvare = da_salvare.filter(cliente_id__in=ids)
+
+    salvati = True
+    for carrello in da_salvare:
+        try:
+            salvati &= _salva_carrello(carrello)
+        except Exception:
+            logger.exception("Salvataggio del carrello di %s fallito", carrello.cliente_id)
+            salvati = False
+    return salvati
+
+
+def _salva_carrello(carrello):
+    # Ordine delle operazioni: chi modifica il carrello scrive la cache e poi lo segna. Tolto il segno in cache
+    # prima di leggere i dati, una modifica successiva incrementa di nuovo il contatore nel DB e l'azzeramento
+    # qui sotto non va a buon fine: il carrello resta da salvare
+    cache_carrelli().delete(chiave_sporco(carrello.cliente_id))
+    dati = cache_carrelli().get(chiave_carrello(carrello.cliente_id))
+    if dati is None:
+        logger.error("Carrello di %s da salvare ma assente dalla cache: modifiche perse", carrello.cliente_id)
+        Carrello.objects.filter(pk=carrello.pk, modifiche_in_sospeso=carrello.modifiche_in_sospeso).update(modifiche_in_sospeso=0)
+        return True
+    with transaction.atomic():
+        carrello.sostituisci({int(id_piatto): quantita for id_piatto, quantita in dati.items()})
+        return bool(Carrello.objects.filter(pk=carrello.pk, modifiche_in_sospeso=carrello.modifiche_in_sospeso)
+                    .update(modifiche_in_sospeso=0))
+
+
+# All'uscita salvo subito se questo processo ha un salvataggio in programma
+@atexit.register
+def _salva_in_uscita():
+    if _timer is not None:
+        salva_carrelli()
@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from takeaway.fedelta import premi_fedelta
+from takeaway.models import CartaFedelta, ChiaveCheckout, FasciaRitiro, Ordine, PiattoOrdine
+
+
+# Sconto applicabile e punti da scalare per un carrello con questo totale (premio più alto raggiunto)
+def calcola_sconto(totale, punti, premi):
+    soglia_sconto = premi.premio(punti)
+    if soglia_sconto is None:
+        return Decimal(0), 0
+    return min(soglia_sconto.valore_buono, totale), soglia_sconto.punti_richiesti
+
+
+# Ordine già creato con questa chiave di checkout (None se la chiave non è stata usata)
+def ordine_da_chiave(cliente, chiave):
+    if chiave is None:
+        return None
+    return Ordine.objects.filter(chiave_checkout__chiave=chiave, chiave_checkout__cliente=cliente).first()
+
+
+# Chiave con cui confermare l'ordine: quella del carrello se ne ha una (vedi CarrelloStore.chiave_checkout),
+# altrimenti quella del form
+def chiave_ordine(carrello, chiave):
+    return carrello.chiave_checkout() or chiave
+
+
+# Ordine già creato con la chiave di questo checkout. Se la chiave è quella del carrello, la copia del carrello
+# letta da questa richiesta è già stata ordinata e viene svuotata
+def ordine_gia_confermato(cliente, carrello, chiave):
+    ordine = ordine_da_chiave(cliente, chiave_ordine(carrello, chiave))
+    if ordine is not None and carrello.chiave_checkout() is not None:
+        carrello.svuota()
+    return ordine
+
+
+# Crea l'ordine dal carrello in un'unica transazione.
+# Con la stessa chiave restituisce l'ordine del primo invio senza rifare il lavoro.
+# Ritorna None se nel frattempo il carrello è stato svuotato (es. checkout parallelo),
+# solleva ValidationError se la fascia di ritiro si è riempita
+def conferma_ordine(cliente, carrello, form, chiave=None):
+    with transaction.atomic():
+        # I checkout dello stesso cliente vengono serializzati: con SQLite da transaction_mode IMMEDIATE
+        # (il lock di scrittura del DB viene preso all'inizio della transazione, select_for_update non fa
+        # nulla), con gli altri DB dal lock sulla riga della carta fedeltà
+        carta_fedelta, created = CartaFedelta.objects.select_for_update().get_or_create(cliente=cliente)
+
+        # Ricontrollo dentro la transazione: un invio parallelo con la stessa chiave può aver appena finito
+        ordine = ordine_gia_confermato(cliente, carrello, chiave)
+        if ordine is not None:
+            return ordine
+        chiave = chiave_ordine(carrello, chiave)
+
+        righe = carrello.righe()  # Piatti e prezzi letti con una sola query
+        if not righe:
+            return None
+
+        totale = sum(riga.subtotale() for riga in righe)
+        sconto, punti_usati = calcola_sconto(totale, carta_fedelta.punti, premi_fedelta())
+
+        # Posto nella fascia di ritiro: contatore incrementato solo se c'è ancora capienza
+        if not FasciaRitiro.objects.prenota(form.cleaned_data['fascia_ritiro'].pk):
+            raise ValidationError("La fascia di ritiro scelta è al completo.")
+
+        ordine = form.save(commit=False)  # Non salvo subito
+        ordine.cliente = cliente
+        ordine.sconto = sconto
+        ordine.totale = totale  # Salvato una volta: le liste ordini non ricalcolano dalle righe
+        ordine.save()
+
+        if chiave is not None:
+            ChiaveCheckout.objects.create(chiave=chiave, cliente=cliente, ordine=ordine)
+
+        # Copia piatti dal carrello all'ordine
+        PiattoOrdine.objects.bulk_create([
+            PiattoOrdine(ordine=ordine, piatto=riga.piatto, quantita=riga.quantita, prezzo_unitario=riga.piatto.prezzo)
+            for riga in righe
+        ])
+
+        if punti_usati:
+            carta_fedelta.rimuovi_punti(punti_usati, ordine_id=ordine.pk)
+
+        # Svuota il carrello
+        carrello.svuota()
+
+    return ordine
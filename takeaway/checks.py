@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+
+# I gruppi degli utenti vanno tenuti in una cache condivisa: con LocMemCache ogni processo ha la sua copia
+# e un gruppo tolto in un worker (o dalla shell) resterebbe valido negli altri
+@register()
+def controlla_cache_ruoli(app_configs, **kwargs):
+    return _cache_condivisa("RUOLI_CACHE", "takeaway.E001")
+
+
+# Stesso discorso per le versioni del menu e dei premi: una modifica fatta da importa_menu o da un altro
+# worker non cambierebbe le chiavi delle griglie né gli ETag delle API in questo processo
+@register()
+def controlla_cache_versioni(app_configs, **kwargs):
+    return _cache_condivisa("VERSIONI_CACHE", "takeaway.E003")
+
+
+def _cache_condivisa(impostazione, id_errore):
+    alias = getattr(settings, impostazione)
+    if isinstance(caches[alias], LocMemCache):
+        return [Error(
+            f"{impostazione} ('{alias}') usa LocMemCache, che non è condivisa tra i processi.",
+            hint="Usare una cache condivisa (DatabaseCache, Redis, Memcached).",
+            id=id_errore,
+        )]
+    return []
+
+
+# Il carrello in cache viene salvato nel DB in differita: con una cache locale gli altri processi non
+# vedrebbero le modifiche, e le chiavi scartate per fare spazio sarebbero carrelli persi
+@register()
+def controlla_cache_carrelli(app_configs, **kwargs):
+    if settings.CARRELLO_BACKEND == 'takeaway.carrelli.CacheCarrelloStore' and \
+            isinstance(caches[settings.CARRELLO_CACHE], LocMemCache):
+        return [Error(
+            f"CARRELLO_CACHE ('{settings.CARRELLO_CACHE}') usa LocMemCache, che non è condivisa tra i processi.",
+            hint="Usare una cache condivisa e senza eviction (DatabaseCache, Redis con noeviction).",
+            id="takeaway.E002",
+        )]
+    return []
@@ -0,0 +1,83 @@
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from takeaway.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+# Segna una funzione come eseguibile dalla coda
+def job(funzione):
+    funzione.job = True
+    return funzione
+
+
+# Mette in coda funzione(**argomenti). Il job viene scritto nella transazione corrente:
+# se la transazione viene annullata il job sparisce insieme alle altre modifiche
+def accoda(funzione, ritardo=None, **argomenti):
+    if not getattr(funzione, "job", False):
+        raise ValueError(f"{funzione.__qualname__} non è un job (manca @job)")
+    return Job.objects.create(
+        funzione=f"{funzione.__module__}.{funzione.__qualname__}",
+        argomenti=argomenti,
+        eseguire_dopo=timezone.now() + (ritardo or timedelta()),
+    )
+
+
+# Numero di job che aspettano da più di JOB_ATTESA_MASSIMA_SECONDI: se sono più di zero
+# il worker (python manage.py esegui_job) non è avviato o non riesce a stare al passo
+def job_in_ritardo():
+    limite = timezone.now() - timedelta(seconds=settings.JOB_ATTESA_MASSIMA_SECONDI)
+    in_ritardo = Job.objects.filter(stato=Job.IN_ATTESA, eseguire_dopo__lt=limite).count()
+    if in_ritardo:
+        logger.warning("%s job in attesa da più di %s secondi: il worker esegui_job è avviato?",
+                       in_ritardo, settings.JOB_ATTESA_MASSIMA_SECONDI)
+    return in_ritardo
+
+
+# Prende fino a `quanti` job con un unico UPDATE condizionato: due worker non possono
+# prendere lo stesso job (l'UPDATE di uno dei due non trova più la riga nello stato atteso).
+# Vengono ripresi anche i job "in corso" da più di JOB_TIMEOUT_SECONDI (worker terminato)
+def prendi_job(quanti):
+    adesso = timezone.now()
+    disponibili = (Q(stato=Job.IN_ATTESA, eseguire_dopo__lte=adesso) |
+                   Q(stato=Job.IN_CORSO, preso_il__lt=adesso - timedelta(seconds=settings.JOB_TIMEOUT_SECONDI)))
+
+    lotto = uuid.uuid4()
+    candidati = Job.objects.filter(disponibili).order_by("eseguire_dopo", "id").values("id")[:quanti]
+    presi = Job.objects.filter(disponibili, id__in=candidati).update(stato=Job.IN_CORSO, lotto=lotto, preso_il=adesso)
+    if not presi:
+        return []
+    return list(Job.objects.filter(lotto=lotto))
+
+
+# Esegue un job preso con prendi_job: se riesce viene eliminato,
+# altrimenti viene rimesso in coda con un'attesa crescente fino a JOB_TENTATIVI tentativi
+def esegui_job(job):
+    try:
+        funzione = import_string(job.funzione)
+        if not getattr(funzione, "job", False):
+            raise ValueError(f"{job.funzione} non è un job")
+        funzione(**job.argomenti)
+    except Exception:
+        logger.exception("Job #%s (%s) fallito", job.pk, job.funzione)
+        tentativi = job.tentativi + 1
+        if tentativi < settings.JOB_TENTATIVI:
+            stato = Job.IN_ATTESA
+            ritardo = timedelta(seconds=settings.JOB_RITARDO_BASE_SECONDI * 2 ** (tentativi - 1))
+        else:
+            stato = Job.FALLITO
+            ritardo = timedelta()
+        # Solo se il job è ancora nostro (non ripreso da un altro worker dopo il timeout)
+        Job.objects.filter(pk=job.pk, lotto=job.lotto).update(
+            stato=stato, tentativi=tentativi, errore=traceback.format_exc(),
+            eseguire_dopo=timezone.now() + ritardo, lotto=None, preso_il=None)
+    else:
+        Job.objects.filter(pk=job.pk).delete()
@@ -0,0 +1,101 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from django.utils import timezone
+
+from takeaway.models import Ordine, OrdineArchiviato, PiattoOrdine, PiattoOrdineArchiviato
+
+# Colonne esportate: nome nel file -> campo letto con values_list
+CAMPI = {
+    "ordini": {
+        "id": "id",
+        "cliente": "cliente__username",
+        "stato": "stato",
+        "creato_il": "creato_il",
+        "chiuso_il": "chiuso_il",
+        "orario_ritiro": "orario_ritiro",
+        "totale": "totale",
+        "sconto": "sconto",
+        "totale_scontato": "totale_scontato",
+    },
+    "righe": {
+        "ordine": "ordine_id",
+        "orario_ritiro": "ordine__orario_ritiro",
+        "piatto_id": "piatto_id",
+        "piatto": "piatto__nome",
+        "quantita": "quantita",
+        "prezzo_unitario": "prezzo_unitario",
+        "subtotale": "subtotale",
+    },
+}
+
+RIGHE_PER_LETTURA = 2000
+
+
+# Valori delle righe con ritiro tra le date `dal` e `al` (comprese, ora locale), dagli ordini correnti e
+# dall'archivio in ordine di ritiro. Letti a blocchi con iterator(): la memoria usata non dipende da quante
+# righe ci sono. Le due tabelle sono lette con un'unica SELECT (UNION ALL), che in SQLite vede i dati in un solo
+# stato: un ordine spostato nel frattempo da archivia_ordini (inserimento nell'archivio ed eliminazione nella
+# stessa transazione) compare una sola volta, senza tenere in memoria gli id già letti. L'ordinamento finale
+# viene fatto da SQLite, che oltre la sua cache usa file temporanei
+def righe_esportazione(tipo, dal, al):
+    inizio = timezone.make_aware(datetime.combine(dal, time.min))
+    fine = timezone.make_aware(datetime.combine(al + timedelta(days=1), time.min))
+
+    campi = list(CAMPI[tipo].values())
+    if tipo == "ordini":
+        correnti, archiviati = [modello.objects.filter(orario_ritiro__gte=inizio, orario_ritiro__lt=fine)
+                                .values_list(*campi) for modello in (Ordine, OrdineArchiviato)]
+        ordinamento = ("orario_ritiro", "id")
+    else:
+        correnti, archiviati = [modello.objects.filter(ordine__orario_ritiro__gte=inizio, ordine__orario_ritiro__lt=fine)
+                                .annotate(subtotale=F("quantita") * F("prezzo_unitario")).values_list(*campi)
+                                for modello in (PiattoOrdine, PiattoOrdineArchiviato)]
+        ordinamento = ("ordine__orario_ritiro", "ordine_id", "piatto_id")
+
+    righe = correnti.union(archiviati, all=True).order_by(*ordinamento)
+    yield from righe.iterator(chunk_size=RIGHE_PER_LETTURA)
+
+
+def _valore(valore):
+    if isinstance(valore, datetime):
+        return timezone.localtime(valore).isoformat()
+    if isinstance(valore, Decimal):
+        return f"{valore:.2f}"  # Importi esatti, senza passare dai float
+    return valore
+
+
+# csv.writer scrive in un oggetto con write(): qui write() restituisce la riga invece di accumularla
+class _Riga:
+    def write(self, valore):
+        return valore
+
+
+# Testo del file riga per riga (generatore), in formato "csv" o "jsonl"
+def esporta(tipo, formato, dal, al):
+    colonne = list(CAMPI[tipo])
+    righe = righe_esportazione(tipo, dal, al)
+    if formato == "jsonl":
+        for riga in righe:
+            yield json.dumps(dict(zip(colonne, map(_valore, riga))), ensure_ascii=False) + "\n"
+    else:
+        writer = csv.writer(_Riga())
+        yield writer.writerow(colonne)
+        for riga in righe:
+            yield writer.writerow(map(_valore, riga))
+
+
+# Stessa esportazione come generatore asincrono, per lo streaming con ASGI: con un iteratore sincrono
+# StreamingHttpResponse leggerebbe tutto il file in memoria prima di inviarlo. I blocchi di righe vengono
+# letti sempre nello stesso thread (thread_sensitive), che tiene aperto il cursore del DB
+async def esporta_async(tipo, formato, dal, al):
+    righe = esporta(tipo, formato, dal, al)
+    leggi_blocco = sync_to_async(lambda: list(islice(righe, RIGHE_PER_LETTURA)), thread_sensitive=True)
+    while blocco := await leggi_blocco():
+        for riga in blocco:
+            yield riga
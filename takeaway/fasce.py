@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from takeaway.models import FasciaRitiro
+
+
+def fasce_del_giorno(giorno):
+    durata = timedelta(minutes=settings.FASCIA_RITIRO_MINUTI)
+    for apertura, chiusura, capienza in settings.FASCE_RITIRO:
+        inizio = timezone.make_aware(datetime.combine(giorno, datetime.strptime(apertura, "%H:%M").time()))
+        fine = timezone.make_aware(datetime.combine(giorno, datetime.strptime(chiusura, "%H:%M").time()))
+        while inizio < fine:
+            yield FasciaRitiro(inizio=inizio, capienza=capienza)
+            inizio += durata
+
+
+# Crea le fasce dei prossimi `giorni` giorni da oggi secondo FASCE_RITIRO; ritorna quante ne ha create
+def crea_fasce(giorni):
+    oggi = timezone.localdate()
+    fasce = [fascia for giorno in range(giorni) for fascia in fasce_del_giorno(oggi + timedelta(days=giorno))]
+
+    prima = FasciaRitiro.objects.count()
+    # ignore_conflicts: le fasce già presenti mantengono capienza e prenotazioni
+    FasciaRitiro.objects.bulk_create(fasce, batch_size=500, ignore_conflicts=True)
+    return FasciaRitiro.objects.count() - prima
+
+
+# Fasce dei prossimi FASCE_RITIRO_GIORNI giorni create al bisogno (dal checkout): una volta al giorno per processo,
+# così anche senza genera_fasce_ritiro nel cron il checkout ha sempre degli orari da proporre
+def prepara_fasce():
+    if settings.FASCE_RITIRO_GIORNI and cache.add(f"takeaway:fasce:{timezone.localdate()}", True, 60 * 60 * 24):
+        crea_fasce(settings.FASCE_RITIRO_GIORNI)
@@ -0,0 +1,81 @@
+import time
+from bisect import bisect_right
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from takeaway.cache import versione_soglie
+from takeaway.coda import job
+from takeaway.models import CartaFedelta, MovimentoPunti, Ordine, SogliaSconto
+
+
+# Assegna i punti di un ordine completato (1 punto per ogni euro).
+# Idempotente: se il job viene eseguito due volte i punti vengono assegnati una volta sola
+@job
+def assegna_punti_ordine(id_ordine):
+    with transaction.atomic():
+        if not Ordine.objects.filter(pk=id_ordine, stato="completed", punti_assegnati=False).update(punti_assegnati=True):
+            return
+        ordine = Ordine.objects.get(pk=id_ordine)
+        carta, created = CartaFedelta.objects.get_or_create(cliente=ordine.cliente)
+        carta.aggiungi_punti(int(ordine.totale_scontato), ordine_id=ordine.pk)
+
+
+# Accredita i punti di più ordini completati insieme: le carte mancanti vengono create in blocco,
+# poi un UPDATE F() per carta (punti sommati per cliente) e un movimento per ogni ordine
+def accredita_ordini(ordini):
+    ordini = [ordine for ordine in ordini if int(ordine.totale_scontato)]
+    punti = Counter()
+    for ordine in ordini:
+        punti[ordine.cliente_id] += int(ordine.totale_scontato)
+    if not punti:
+        return
+
+    with transaction.atomic():
+        esistenti = set(CartaFedelta.objects.filter(cliente_id__in=punti).values_list("cliente_id", flat=True))
+        CartaFedelta.objects.bulk_create([CartaFedelta(cliente_id=id_cliente) for id_cliente in punti
+                                          if id_cliente not in esistenti])
+        carte = dict(CartaFedelta.objects.filter(cliente_id__in=punti).values_list("cliente_id", "id"))
+
+        for id_cliente, valore in punti.items():
+            CartaFedelta.objects.filter(pk=carte[id_cliente]).update(punti=F("punti") + valore)
+        MovimentoPunti.objects.bulk_create([
+            MovimentoPunti(carta_id=carte[ordine.cliente_id], tipo=MovimentoPunti.ACCREDITO,
+                           punti=int(ordine.totale_scontato), ordine_id=ordine.pk)
+            for ordine in ordini
+        ])
+
+
+# Soglie dei premi ordinate per punti richiesti: il premio per un saldo si trova per bisezione, senza query
+class PremiFedelta:
+    def __init__(self, soglie):
+        self.soglie = sorted(soglie, key=lambda soglia: soglia.punti_richiesti)
+        self._punti = [soglia.punti_richiesti for soglia in self.soglie]
+
+    # Premio più alto raggiunto con questi punti (None se non ne basta nessuno)
+    def premio(self, punti):
+        posizione = bisect_right(self._punti, punti)
+        return self.soglie[posizione - 1] if posizione else None
+
+    # Primo premio non ancora raggiunto (None se sono già tutti raggiunti)
+    def prossimo(self, punti):
+        posizione = bisect_right(self._punti, punti)
+        return self.soglie[posizione] if posizione < len(self.soglie) else None
+
+
+_premi = (None, 0, PremiFedelta([]))  # (versione, scadenza, premi) letti da questo processo
+
+
+# Premi in vigore, tenuti in memoria dal processo. Ad ogni chiamata si legge solo la versione in cache
+# (cambiata dai segnali di SogliaSconto dopo il commit): le soglie vengono rilette dal DB dopo una modifica
+# fatta in questo processo, oppure dopo PREMI_FEDELTA_CACHE_SECONDI (modifiche fatte da altri worker o dalla
+# shell, che non toccano la cache locale di questo processo)
+def premi_fedelta():
+    global _premi
+    versione = versione_soglie()  # Prima della query: una modifica nel mezzo fa rileggere alla prossima chiamata
+    adesso = time.monotonic()
+    if _premi[0] != versione or adesso >= _premi[1]:
+        _premi = (versione, adesso + settings.PREMI_FEDELTA_CACHE_SECONDI, PremiFedelta(SogliaSconto.objects.all()))
+    return _premi[2]
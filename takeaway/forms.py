@@ -1,21 +1,34 @@
 from django import forms
-from django.utils import timezone
+from django.conf import settings
 
-from .models import Ordine, Piatto
+from .fasce import prepara_fasce
+from .models import FasciaRitiro, Ordine, Piatto, SogliaSconto
 
 
 class CheckoutForm(forms.ModelForm):
-    orario_ritiro = forms.DateTimeField(widget=forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'}), label="Orario di ritiro")
+    fascia_ritiro = forms.ModelChoiceField(queryset=FasciaRitiro.objects.none(), label="Orario di ritiro",
+                                           widget=forms.Select(attrs={'class': 'form-select'}))
+    # Chiave di idempotenza generata quando viene mostrata la pagina di checkout
+    chiave = forms.UUIDField(widget=forms.HiddenInput, required=False)
 
     class Meta:
         model = Ordine
-        fields = ['orario_ritiro']
+        fields = ['fascia_ritiro']
 
-    def clean_orario_ritiro(self):
-        orario = self.cleaned_data.get('orario_ritiro')
-        if orario < timezone.now():
-            raise forms.ValidationError("Non puoi scegliere una data/ora nel passato.")
-        return orario
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        prepara_fasce()  # Fasce dei prossimi giorni, se non ci sono ancora
+        campo = self.fields['fascia_ritiro']
+        campo.queryset = FasciaRitiro.objects.disponibili()  # Validazione: fasce future non piene
+        campo.choices = self.prossime_fasce  # Menu a tendina: solo le prime, caricate solo se mostrato
+
+    def prossime_fasce(self):
+        fasce = self.fields['fascia_ritiro'].queryset[:settings.FASCE_RITIRO_MOSTRATE]
+        return [("", "---------")] + [(fascia.pk, f"{fascia} ({fascia.posti_liberi()} posti liberi)") for fascia in fasce]
+
+    def save(self, commit=True):
+        self.instance.orario_ritiro = self.cleaned_data['fascia_ritiro'].inizio
+        return super().save(commit)
 
 
 class PiattoForm(forms.ModelForm):
@@ -25,13 +38,15 @@ class PiattoForm(forms.ModelForm):
 
     def clean_nome(self):
         nome = self.cleaned_data.get('nome')
-        existing_piatto = Piatto.objects.filter(nome=nome)
 
         if not self.instance.pk: # Controllo effettuato solo alla creazione
-            if existing_piatto:
+            if self.nome_presente(nome):
                 raise forms.ValidationError("Piatto già presente nel menu.")
         return nome
 
+    def nome_presente(self, nome):
+        return Piatto.objects.filter(nome=nome).exists()
+
     def clean_prezzo(self):
         prezzo = self.cleaned_data.get('prezzo')
         if prezzo < 0:
@@ -39,12 +54,49 @@ class PiattoForm(forms.ModelForm):
         return prezzo
 
 
+# Validazione di una riga dell'import del menu: stessi controlli di PiattoForm,
+# ma i nomi già presenti sono caricati una volta sola per tutto il file
+class PiattoImportForm(PiattoForm):
+    class Meta(PiattoForm.Meta):
+        fields = ["nome", "descrizione", "prezzo", "portata", "ingredienti"]
+
+    def __init__(self, *args, nomi_presenti=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.nomi_presenti = nomi_presenti
+
+    def nome_presente(self, nome):
+        return nome in self.nomi_presenti
+
+
 class OrdineForm(forms.ModelForm):
     class Meta:
         model = Ordine
         fields = ["stato"]
 
 
-class SogliaScontoForm(forms.Form):
-    punti_richiesti = forms.IntegerField(min_value=0, label="Punti richiesti")
-    valore_buono = forms.DecimalField(min_value=0, max_digits=6, decimal_places=2, label="Valore buono (€)")
\ No newline at end of file
+class SogliaScontoForm(forms.ModelForm):
+    class Meta:
+        model = SogliaSconto
+        fields = ["punti_richiesti", "valore_buono"]
+        labels = {"punti_richiesti": "Punti richiesti", "valore_buono": "Valore buono (€)"}
+
+
+# Tutti i premi in una pagina: una riga per soglia, più una vuota per aggiungerne
+SoglieScontoFormSet = forms.modelformset_factory(SogliaSconto, form=SogliaScontoForm, extra=1, can_delete=True)
+
+
+class EsportazioneOrdiniForm(forms.Form):
+    dal = forms.DateField(label="Ritiro dal", widget=forms.DateInput(format='%Y-%m-%d', attrs={'type': 'date', 'class': 'form-control'}))
+    al = forms.DateField(label="al", widget=forms.DateInput(format='%Y-%m-%d', attrs={'type': 'date', 'class': 'form-control'}))
+    tipo = forms.ChoiceField(choices=[("ordini", "Ordini"), ("righe", "Righe ordine")], required=False,
+                             widget=forms.Select(attrs={'class': 'form-select'}))
+    formato = forms.ChoiceField(choices=[("csv", "CSV"), ("jsonl", "JSON Lines")], required=False,
+                                widget=forms.Select(attrs={'class': 'form-select'}))
+
+    def clean(self):
+        dati = super().clean()
+        if dati.get("dal") and dati.get("al") and dati["dal"] > dati["al"]:
+            raise forms.ValidationError("La data di inizio è successiva a quella di fine.")
+        dati["tipo"] = dati.get("tipo") or "ordini"
+        dati["formato"] = dati.get("formato") or "csv"
+        return dati
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from takeaway.statistiche import aggiorna_statistiche, ricostruisci_statistiche
+
+
+class Command(BaseCommand):
+    help = "Aggiunge alle statistiche di vendita gli ordini chiusi dall'ultimo aggiornamento"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ricostruisci", action="store_true",
+                            help="Ricalcola tutto da zero, compresi gli ordini archiviati")
+        parser.add_argument("--lotto", type=int, default=500, help="Ordini contati per transazione")
+
+    def handle(self, *args, **options):
+        if options["ricostruisci"]:
+            contati = ricostruisci_statistiche(options["lotto"])
+        else:
+            contati = aggiorna_statistiche(options["lotto"])
+        self.stdout.write(self.style.SUCCESS(f"Ordini contati: {contati}."))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from takeaway.archivio import archivia_ordini
+
+
+class Command(BaseCommand):
+    help = "Sposta nell'archivio gli ordini completati o cancellati più vecchi di ARCHIVIO_ORDINI_GIORNI"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--giorni", type=int, default=settings.ARCHIVIO_ORDINI_GIORNI,
+                            help="Archivia gli ordini con ritiro più vecchio di N giorni")
+        parser.add_argument("--lotto", type=int, default=500, help="Ordini spostati per transazione")
+
+    def handle(self, *args, **options):
+        prima_di = timezone.now() - timedelta(days=options["giorni"])
+        archiviati = archivia_ordini(prima_di, options["lotto"])
+        self.stdout.write(self.style.SUCCESS(f"Ordini archiviati: {archiviati}."))
@@ -0,0 +1,41 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from takeaway.coda import esegui_job, prendi_job
+
+
+def esegui_e_chiudi(job):
+    try:
+        esegui_job(job)
+    finally:
+        connection.close()  # Connessione del thread del worker
+
+
+class Command(BaseCommand):
+    help = "Worker della coda dei job: prende i job in attesa dal DB e li esegue in un pool di thread"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--thread", type=int, default=settings.JOB_WORKERS, help="Job eseguiti in parallelo")
+        parser.add_argument("--intervallo", type=float, default=1.0,
+                            help="Secondi di attesa quando la coda è vuota")
+        parser.add_argument("--una-volta", action="store_true",
+                            help="Esegue i job disponibili e termina (es. da cron o nei test)")
+
+    def handle(self, *args, **options):
+        eseguiti = 0
+        with ThreadPoolExecutor(max_workers=options["thread"]) as executor:
+            while True:
+                jobs = prendi_job(options["thread"])
+                if jobs:
+                    list(executor.map(esegui_e_chiudi, jobs))
+                    eseguiti += len(jobs)
+                elif options["una_volta"]:
+                    break
+                else:
+                    time.sleep(options["intervallo"])
+
+        self.stdout.write(self.style.SUCCESS(f"Job eseguiti: {eseguiti}."))
@@ -0,0 +1,37 @@
+import csv
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand
+
+from takeaway.models import Piatto
+
+CAMPI = ["nome", "descrizione", "prezzo", "portata", "ingredienti", "foto"]
+
+
+class Command(BaseCommand):
+    help = "Esporta il menu in CSV o JSON, nello stesso formato letto da importa_menu"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--formato", choices=["csv", "json"], default="csv")
+        parser.add_argument("--output", help="File di destinazione (default: standard output)")
+
+    def handle(self, *args, **options):
+        righe = []
+        for piatto in Piatto.objects.order_by("portata_ordine", "id").values(*CAMPI).iterator(chunk_size=500):
+            piatto["prezzo"] = str(piatto["prezzo"])
+            piatto["foto"] = os.path.basename(piatto["foto"] or "")  # Da ritrovare in --foto-dir all'import
+            righe.append(piatto)
+
+        file = open(options["output"], "w", encoding="utf-8", newline="") if options["output"] else sys.stdout
+        try:
+            if options["formato"] == "json":
+                json.dump(righe, file, ensure_ascii=False, indent=2)
+            else:
+                writer = csv.DictWriter(file, fieldnames=CAMPI)
+                writer.writeheader()
+                writer.writerows(righe)
+        finally:
+            if options["output"]:
+                file.close()
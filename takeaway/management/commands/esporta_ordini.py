@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from takeaway.esportazione import esporta
+
+
+class Command(BaseCommand):
+    help = "Esporta ordini o righe degli ordini (compresi quelli archiviati) con ritiro nel periodo indicato"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dal", type=date.fromisoformat, required=True, help="Prima data di ritiro (AAAA-MM-GG)")
+        parser.add_argument("--al", type=date.fromisoformat, required=True, help="Ultima data di ritiro (compresa)")
+        parser.add_argument("--tipo", choices=["ordini", "righe"], default="ordini")
+        parser.add_argument("--formato", choices=["csv", "jsonl"], default="csv")
+        parser.add_argument("--output", help="File di destinazione (default: standard output)")
+
+    def handle(self, *args, **options):
+        if options["dal"] > options["al"]:
+            raise CommandError("--dal è successiva ad --al.")
+
+        testi = esporta(options["tipo"], options["formato"], options["dal"], options["al"])
+        # Scritto man mano: il file non viene mai tenuto tutto in memoria
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as file:
+                file.writelines(testi)
+        else:
+            for testo in testi:
+                self.stdout.write(testo, ending="")
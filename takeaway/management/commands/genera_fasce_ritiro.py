@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from takeaway.fasce import crea_fasce
+
+
+class Command(BaseCommand):
+    help = "Crea le fasce di ritiro dei prossimi giorni secondo FASCE_RITIRO (le fasce esistenti non vengono toccate)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--giorni", type=int, default=7, help="Numero di giorni da oggi")
+
+    def handle(self, *args, **options):
+        creati = crea_fasce(options["giorni"])
+        self.stdout.write(self.style.SUCCESS(f"Fasce di ritiro create: {creati}."))
@@ -0,0 +1,46 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+
+from takeaway.cache import incrementa_versione_menu
+from takeaway.models import Piatto
+from takeaway.rendition import genera_rendition
+
+
+def _genera(nome_foto):
+    return genera_rendition(nome_foto, Piatto._meta.get_field('foto').storage)
+
+
+class Command(BaseCommand):
+    help = "Genera le rendition (thumb, card, detail in WebP e JPEG) delle foto dei piatti"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tutte", action="store_true", help="Rigenera anche le rendition già presenti")
+        parser.add_argument("--processi", type=int, default=None, help="Numero di processi (default: CPU disponibili)")
+
+    def handle(self, *args, **options):
+        piatti = Piatto.objects.exclude(foto="").exclude(foto__isnull=True)
+        if not options["tutte"]:
+            piatti = piatti.filter(rendition_pronte=False)
+        foto = set(piatti.values_list("foto", flat=True))
+
+        if not foto:
+            self.stdout.write("Nessuna foto da elaborare.")
+            return
+
+        generate = []
+        with ProcessPoolExecutor(max_workers=options["processi"], initializer=django.setup) as executor:
+            futures = {executor.submit(_genera, nome): nome for nome in foto}
+            for future in as_completed(futures):
+                nome = futures[future]
+                try:
+                    future.result()
+                    generate.append(nome)
+                except Exception as e:
+                    self.stderr.write(f"{nome}: {e}")
+
+        Piatto.objects.filter(foto__in=generate).update(rendition_pronte=True)
+        incrementa_versione_menu()  # Nella cache condivisa: arriva anche al web server
+
+        self.stdout.write(self.style.SUCCESS(f"Rendition generate per {len(generate)} foto su {len(foto)}."))
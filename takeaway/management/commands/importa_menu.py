@@ -0,0 +1,118 @@
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from takeaway.cache import incrementa_versione_menu
+from takeaway.forms import PiattoImportForm
+from takeaway.models import Piatto
+from takeaway.ricerca import indicizza_piatti
+
+CAMPI_AGGIORNATI = ["descrizione", "prezzo", "portata", "ingredienti", "foto", "rendition_pronte"]
+
+
+def leggi_righe(percorso, formato):
+    with open(percorso, encoding="utf-8", newline="") as file:
+        if formato == "json":
+            righe = json.load(file)
+        else:
+            righe = list(csv.DictReader(file))
+
+    if not isinstance(righe, list) or not all(isinstance(riga, dict) for riga in righe):
+        raise CommandError("Il file deve contenere un elenco di piatti.")
+    return righe
+
+
+class Command(BaseCommand):
+    help = "Importa il menu da un file CSV o JSON (campi: nome, descrizione, prezzo, portata, ingredienti, foto)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file")
+        parser.add_argument("--formato", choices=["csv", "json"], help="Default: dall'estensione del file")
+        parser.add_argument("--foto-dir", help="Cartella in cui cercare le foto indicate nel campo 'foto'")
+        parser.add_argument("--aggiorna", action="store_true", help="Aggiorna i piatti già presenti invece di segnalarli")
+        parser.add_argument("--thread", type=int, default=4, help="Thread usati per salvare le foto")
+
+    def handle(self, *args, **options):
+        formato = options["formato"] or os.path.splitext(options["file"])[1].lstrip(".").lower()
+        if formato not in ("csv", "json"):
+            raise CommandError("Formato non riconosciuto: usare --formato csv|json.")
+
+        righe = leggi_righe(options["file"], formato)
+        esistenti = {piatto.nome: piatto for piatto in Piatto.objects.all()}
+
+        # Validazione con gli stessi controlli di PiattoForm
+        nuovi, aggiornati, foto_righe, errori = [], [], {}, []
+        nomi_file = set()
+        nomi_presenti = set(esistenti)
+        for numero, riga in enumerate(righe, start=1):
+            nome = (riga.get("nome") or "").strip()
+            if nome in nomi_file:
+                errori.append(f"Riga {numero} ({nome}): piatto ripetuto nel file.")
+                continue
+
+            istanza = esistenti.get(nome) if options["aggiorna"] else None
+            form = PiattoImportForm(data=riga, instance=istanza, nomi_presenti=nomi_presenti)
+
+            if not form.is_valid():
+                for campo, messaggi in form.errors.items():
+                    errori.append(f"Riga {numero} ({nome or '?'}), {campo}: {' '.join(messaggi)}")
+                continue
+            nomi_file.add(nome)
+            nomi_presenti.add(nome)
+
+            (aggiornati if istanza else nuovi).append(form.instance)
+            if riga.get("foto"):
+                foto_righe[form.instance.nome] = riga["foto"]
+
+        if errori:
+            raise CommandError("Import annullato:\n" + "\n".join(errori))
+
+        # Foto salvate in parallelo prima della transazione
+        # (se l'import fallisce i file orfani vengono rimossi da pulisci_media)
+        foto_salvate = self.salva_foto(set(foto_righe.values()), options["foto_dir"], options["thread"])
+
+        for piatto in nuovi + aggiornati:
+            if piatto.nome in foto_righe:
+                nome_foto = foto_salvate[foto_righe[piatto.nome]]
+                if piatto.foto.name != nome_foto:
+                    piatto.foto = nome_foto
+                    piatto.rendition_pronte = False
+
+        with transaction.atomic():
+            Piatto.objects.bulk_create(nuovi, batch_size=500)
+            Piatto.objects.bulk_update(aggiornati, CAMPI_AGGIORNATI, batch_size=500)
+            indicizza_piatti([piatto.pk for piatto in nuovi + aggiornati])
+
+        # bulk_create/bulk_update non inviano segnali. La versione sta nella cache condivisa (VERSIONI_CACHE):
+        # il web server la vede anche se il comando gira in un altro processo
+        incrementa_versione_menu()
+
+        self.stdout.write(self.style.SUCCESS(f"Piatti creati: {len(nuovi)}, aggiornati: {len(aggiornati)}."))
+
+        if foto_salvate:
+            call_command("genera_rendition", stdout=self.stdout, stderr=self.stderr)
+
+    def salva_foto(self, nomi_file, cartella, thread):
+        if not nomi_file:
+            return {}
+        if not cartella:
+            raise CommandError("Il file indica delle foto: specificare --foto-dir.")
+
+        campo = Piatto._meta.get_field("foto")
+
+        def salva(nome_file):
+            percorso = os.path.join(cartella, os.path.basename(nome_file))
+            with open(percorso, "rb") as file:
+                return nome_file, campo.storage.save(campo.generate_filename(None, os.path.basename(nome_file)), File(file))
+
+        try:
+            with ThreadPoolExecutor(max_workers=thread) as executor:
+                return dict(executor.map(salva, nomi_file))
+        except OSError as e:
+            raise CommandError(f"Impossibile leggere la foto: {e}")
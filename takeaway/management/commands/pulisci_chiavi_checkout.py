@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from takeaway.models import ChiaveCheckout
+
+
+class Command(BaseCommand):
+    help = "Elimina le chiavi di checkout scadute (da eseguire periodicamente, es. con cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ore", type=int, default=settings.CHECKOUT_CHIAVE_DURATA_ORE,
+                            help="Elimina le chiavi create più di N ore fa")
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(hours=options["ore"])
+        eliminate, dettaglio = ChiaveCheckout.objects.filter(creato_il__lt=limite).delete()
+        self.stdout.write(self.style.SUCCESS(f"Chiavi di checkout eliminate: {eliminate}."))
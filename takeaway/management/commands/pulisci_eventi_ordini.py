@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from takeaway.models import EventoOrdine
+
+
+class Command(BaseCommand):
+    help = "Elimina gli eventi della bacheca ordini più vecchi di EVENTI_ORDINI_DURATA_ORE"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ore", type=int, default=settings.EVENTI_ORDINI_DURATA_ORE,
+                            help="Elimina gli eventi creati più di N ore fa")
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(hours=options["ore"])
+        eliminati, dettaglio = EventoOrdine.objects.filter(creato_il__lt=limite).delete()
+        self.stdout.write(self.style.SUCCESS(f"Eventi eliminati: {eliminati}."))
@@ -0,0 +1,56 @@
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from takeaway.models import Piatto
+from takeaway.rendition import rimuovi_rendition
+
+
+class Command(BaseCommand):
+    help = "Rimuove le foto dei piatti (e le loro rendition) non più usate da nessun piatto"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--minuti", type=int, default=60,
+                            help="Ignora i file modificati negli ultimi N minuti (upload in corso)")
+        parser.add_argument("--dry-run", action="store_true", help="Mostra i file senza eliminarli")
+
+    def handle(self, *args, **options):
+        campo = Piatto._meta.get_field('foto')
+        storage = campo.storage
+        cartella = campo.upload_to.rstrip('/')
+        limite = timezone.now() - timedelta(minutes=options["minuti"])
+
+        usate = set(Piatto.objects.exclude(foto="").exclude(foto__isnull=True).values_list("foto", flat=True))
+        radici_usate = {os.path.splitext(nome)[0] for nome in usate}
+
+        rimossi = 0
+
+        # Foto originali non più referenziate
+        if storage.exists(cartella):
+            for file in storage.listdir(cartella)[1]:
+                nome = f"{cartella}/{file}"
+                if nome in usate or storage.get_modified_time(nome) > limite:
+                    continue
+                self.stdout.write(f"Rimuovo {nome}")
+                if not options["dry_run"]:
+                    storage.delete(nome)
+                    rimuovi_rendition(nome)
+                rimossi += 1
+
+        # Rendition rimaste senza foto originale
+        cartella_rendition = f"{cartella}/rendition"
+        if default_storage.exists(cartella_rendition):
+            for file in default_storage.listdir(cartella_rendition)[1]:
+                nome = f"{cartella_rendition}/{file}"
+                radice = f"{cartella}/{file.rsplit('_', 1)[0]}"
+                if radice in radici_usate or default_storage.get_modified_time(nome) > limite:
+                    continue
+                self.stdout.write(f"Rimuovo {nome}")
+                if not options["dry_run"]:
+                    default_storage.delete(nome)
+                rimossi += 1
+
+        self.stdout.write(self.style.SUCCESS(f"File orfani rimossi: {rimossi}."))
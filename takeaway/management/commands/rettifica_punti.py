@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from takeaway.models import CartaFedelta, MovimentoPunti
+
+
+class Command(BaseCommand):
+    help = "Aggiunge (o toglie, con un valore negativo) punti alla carta fedeltà di un cliente"
+
+    def add_arguments(self, parser):
+        parser.add_argument("cliente", help="Username del cliente")
+        parser.add_argument("punti", type=int)
+        parser.add_argument("--nota", default="", help="Motivo della rettifica")
+
+    def handle(self, *args, **options):
+        try:
+            cliente = User.objects.get(username=options["cliente"])
+        except User.DoesNotExist:
+            raise CommandError(f"Cliente inesistente: {options['cliente']}")
+
+        carta, created = CartaFedelta.objects.get_or_create(cliente=cliente)
+        try:
+            carta.movimento(options["punti"], MovimentoPunti.RETTIFICA, nota=options["nota"])
+        except IntegrityError:
+            raise CommandError(f"La carta ha solo {carta.punti} punti.")
+        self.stdout.write(self.style.SUCCESS(f"Nuovo saldo di {cliente.username}: {carta.punti} punti."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from takeaway.models import CartaFedelta
+
+
+class Command(BaseCommand):
+    help = "Controlla che il saldo delle carte fedeltà corrisponda alla somma dei loro movimenti"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--correggi", action="store_true", help="Riporta i saldi alla somma dei movimenti")
+
+    def handle(self, *args, **options):
+        errate = CartaFedelta.objects.con_saldo_movimenti().exclude(punti=F("saldo_movimenti"))
+
+        numero = 0
+        for carta in errate.select_related("cliente").only("id", "punti", "cliente__username").iterator():
+            self.stdout.write(f"Carta di {carta.cliente.username}: saldo {carta.punti}, "
+                              f"movimenti {carta.saldo_movimenti} (differenza {carta.punti - carta.saldo_movimenti:+d})")
+            numero += 1
+
+        if not numero:
+            self.stdout.write(self.style.SUCCESS("Tutti i saldi sono corretti."))
+            return
+
+        if options["correggi"]:
+            CartaFedelta.objects.filter(pk__in=errate.values("pk")).ricalcola_saldi()
+            self.stdout.write(self.style.SUCCESS(f"Saldi corretti: {numero}."))
+        else:
+            raise CommandError(f"Carte con saldo errato: {numero} (usare --correggi).")
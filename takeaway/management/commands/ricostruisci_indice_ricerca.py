@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from takeaway.ricerca import crea_indice, ricerca_fts_disponibile, ricostruisci_indice
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce da zero l'indice full-text dei piatti"
+
+    def handle(self, *args, **options):
+        if not ricerca_fts_disponibile():
+            raise CommandError("L'indice full-text è disponibile solo con SQLite.")
+
+        with transaction.atomic():
+            crea_indice()
+            ricostruisci_indice()
+
+        self.stdout.write(self.style.SUCCESS("Indice di ricerca ricostruito."))
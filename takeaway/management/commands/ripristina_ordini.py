@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from takeaway.archivio import ripristina_ordini
+from takeaway.models import OrdineArchiviato
+
+
+class Command(BaseCommand):
+    help = "Riporta degli ordini dall'archivio alle tabelle degli ordini"
+
+    def add_arguments(self, parser):
+        parser.add_argument("ordini", nargs="+", type=int, help="Id degli ordini archiviati")
+
+    def handle(self, *args, **options):
+        mancanti = set(options["ordini"]) - set(
+            OrdineArchiviato.objects.filter(pk__in=options["ordini"]).values_list("pk", flat=True))
+        if mancanti:
+            raise CommandError(f"Ordini non presenti nell'archivio: {', '.join(map(str, sorted(mancanti)))}")
+
+        ripristinati = ripristina_ordini(options["ordini"])
+        self.stdout.write(self.style.SUCCESS(f"Ordini ripristinati: {ripristinati}."))
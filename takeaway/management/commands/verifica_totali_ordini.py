@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from takeaway.models import Ordine
+
+
+class Command(BaseCommand):
+    help = "Controlla che il totale salvato negli ordini corrisponda alla somma delle righe"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--correggi", action="store_true", help="Riscrive i totali sbagliati")
+
+    def handle(self, *args, **options):
+        errati = Ordine.objects.con_totale_righe().exclude(totale=F("totale_righe"))
+
+        numero = 0
+        for ordine in errati.only("id", "totale").iterator():
+            self.stdout.write(f"Ordine #{ordine.pk}: salvato {ordine.totale}, righe {ordine.totale_righe}")
+            numero += 1
+
+        if not numero:
+            self.stdout.write(self.style.SUCCESS("Tutti i totali sono corretti."))
+            return
+
+        if options["correggi"]:
+            Ordine.objects.filter(pk__in=errati.values("pk")).ricalcola_totali()
+            self.stdout.write(self.style.SUCCESS(f"Totali corretti: {numero}."))
+        else:
+            raise CommandError(f"Ordini con totale errato: {numero} (usare --correggi).")
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0008_ordine_sconto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='piatto',
+            name='portata_ordine',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(portata='antipasto', then=models.Value(1)), models.When(portata='primo', then=models.Value(2)), models.When(portata='secondo', then=models.Value(3)), models.When(portata='dessert', then=models.Value(4)), default=models.Value(5)), output_field=models.PositiveSmallIntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='piatto',
+            index=models.Index(fields=['portata_ordine', 'id'], name='piatto_menu_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0009_piatto_portata_ordine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='piatto',
+            name='rendition_pronte',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
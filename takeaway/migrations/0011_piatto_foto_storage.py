@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:04
+
+import takeaway.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0010_piatto_rendition_pronte'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='piatto',
+            name='foto',
+            field=models.ImageField(blank=True, null=True, storage=takeaway.storage.storage_foto, upload_to='piatti/'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# SQL scritto qui e non importato da takeaway.ricerca: la migrazione deve creare sempre lo stesso indice,
+# anche se in futuro il modulo cambia
+
+
+def crea_indice_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':  # FTS5 solo con SQLite
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS takeaway_piatto_fts USING fts5(nome, descrizione, "
+                       "tokenize = 'unicode61 remove_diacritics 2')")
+        cursor.execute("DELETE FROM takeaway_piatto_fts")
+        cursor.execute("INSERT INTO takeaway_piatto_fts (rowid, nome, descrizione) "
+                       "SELECT id, nome, descrizione FROM takeaway_piatto")
+
+
+def elimina_indice_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS takeaway_piatto_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0011_piatto_foto_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(crea_indice_fts, elimina_indice_fts),
+    ]
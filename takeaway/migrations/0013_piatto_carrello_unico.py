@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:09
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+# Prima del vincolo unisco eventuali righe doppie sommando le quantità
+def unisci_righe_doppie(apps, schema_editor):
+    PiattoCarrello = apps.get_model('takeaway', 'PiattoCarrello')
+    doppie = (PiattoCarrello.objects.values('carrello', 'piatto')
+              .annotate(righe=Count('id'), totale=Sum('quantita')).filter(righe__gt=1))
+
+    for doppia in doppie:
+        righe = PiattoCarrello.objects.filter(carrello=doppia['carrello'], piatto=doppia['piatto']).order_by('id')
+        prima = righe.first()
+        righe.exclude(pk=prima.pk).delete()
+        PiattoCarrello.objects.filter(pk=prima.pk).update(quantita=doppia['totale'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0012_piatto_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(unisci_righe_doppie, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='piattocarrello',
+            constraint=models.UniqueConstraint(fields=('carrello', 'piatto'), name='piatto_carrello_unico'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0013_piatto_carrello_unico'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChiaveCheckout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chiave', models.UUIDField(unique=True)),
+                ('creato_il', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('ordine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='chiave_checkout', to='takeaway.ordine')),
+            ],
+        ),
+    ]
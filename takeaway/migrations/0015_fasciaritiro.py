@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0014_chiavecheckout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FasciaRitiro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inizio', models.DateTimeField(unique=True)),
+                ('capienza', models.PositiveIntegerField()),
+                ('prenotati', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['inizio'],
+            },
+        ),
+        migrations.AddField(
+            model_name='ordine',
+            name='fascia_ritiro',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordini', to='takeaway.fasciaritiro'),
+        ),
+    ]
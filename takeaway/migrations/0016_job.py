@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# Agli ordini già completati i punti sono stati assegnati durante la richiesta
+def segna_punti_assegnati(apps, schema_editor):
+    Ordine = apps.get_model('takeaway', 'Ordine')
+    Ordine.objects.filter(stato='completed').update(punti_assegnati=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0015_fasciaritiro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordine',
+            name='punti_assegnati',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(segna_punti_assegnati, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('funzione', models.CharField(max_length=200)),
+                ('argomenti', models.JSONField(default=dict)),
+                ('stato', models.CharField(choices=[('in_attesa', 'In attesa'), ('in_corso', 'In corso'), ('fallito', 'Fallito')], default='in_attesa', max_length=20)),
+                ('tentativi', models.PositiveIntegerField(default=0)),
+                ('eseguire_dopo', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lotto', models.UUIDField(blank=True, null=True)),
+                ('preso_il', models.DateTimeField(blank=True, null=True)),
+                ('errore', models.TextField(blank=True)),
+                ('creato_il', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stato', 'eseguire_dopo'], name='job_da_eseguire_idx')],
+            },
+        ),
+    ]
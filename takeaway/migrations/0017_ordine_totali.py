@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:19
+
+import django.db.models.expressions
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+# Totale degli ordini esistenti calcolato dalle righe, con un solo UPDATE
+def calcola_totali(apps, schema_editor):
+    Ordine = apps.get_model('takeaway', 'Ordine')
+    PiattoOrdine = apps.get_model('takeaway', 'PiattoOrdine')
+    righe = (PiattoOrdine.objects.filter(ordine=OuterRef('pk')).values('ordine')
+             .annotate(somma=Sum(F('prezzo_unitario') * F('quantita'))).values('somma'))
+    Ordine.objects.update(totale=Coalesce(
+        Subquery(righe, output_field=models.DecimalField(max_digits=8, decimal_places=2)), Value(Decimal(0))))
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0016_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordine',
+            name='totale',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=8),
+        ),
+        migrations.RunPython(calcola_totali, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='ordine',
+            name='totale_scontato',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('totale'), '-', models.F('sconto')), output_field=models.DecimalField(decimal_places=2, max_digits=8)),
+        ),
+    ]
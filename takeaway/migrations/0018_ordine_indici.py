@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0017_ordine_totali'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ordine',
+            index=models.Index(fields=['stato', 'orario_ritiro', 'id'], name='ordine_stato_ritiro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordine',
+            index=models.Index(fields=['cliente', 'orario_ritiro', 'id'], name='ordine_cliente_ritiro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordine',
+            index=models.Index(fields=['orario_ritiro', 'id'], name='ordine_ritiro_idx'),
+        ),
+    ]
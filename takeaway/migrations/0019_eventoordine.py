@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0018_ordine_indici'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoOrdine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordine_id', models.PositiveIntegerField()),
+                ('tipo', models.CharField(choices=[('creato', 'Creato'), ('aggiornato', 'Aggiornato'), ('eliminato', 'Eliminato')], max_length=20)),
+                ('dati', models.JSONField(default=dict)),
+                ('creato_il', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:32
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0019_eventoordine'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrdineArchiviato',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('orario_ritiro', models.DateTimeField()),
+                ('stato', models.CharField(choices=[('pending', 'In attesa'), ('completed', 'Completato'), ('cancelled', 'Cancellato')], max_length=20)),
+                ('creato_il', models.DateTimeField()),
+                ('sconto', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+                ('punti_assegnati', models.BooleanField(default=False)),
+                ('totale', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('totale_scontato', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('totale'), '-', models.F('sconto')), output_field=models.DecimalField(decimal_places=2, max_digits=8))),
+                ('archiviato_il', models.DateTimeField(auto_now_add=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('fascia_ritiro', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='takeaway.fasciaritiro')),
+            ],
+            options={
+                'verbose_name_plural': 'Ordini archiviati',
+            },
+        ),
+        migrations.CreateModel(
+            name='PiattoOrdineArchiviato',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantita', models.PositiveIntegerField(default=1)),
+                ('prezzo_unitario', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('ordine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='piatti', to='takeaway.ordinearchiviato')),
+                ('piatto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='takeaway.piatto')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ordinearchiviato',
+            index=models.Index(fields=['cliente', 'orario_ritiro', 'id'], name='archivio_cliente_ritiro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordinearchiviato',
+            index=models.Index(fields=['orario_ritiro', 'id'], name='archivio_ritiro_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Per gli ordini già chiusi l'ora di chiusura non è nota: uso l'orario di ritiro
+def segna_chiusura(apps, schema_editor):
+    for nome in ('Ordine', 'OrdineArchiviato'):
+        modello = apps.get_model('takeaway', nome)
+        modello.objects.filter(stato__in=('completed', 'cancelled')).update(chiuso_il=models.F('orario_ritiro'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0020_archivio_ordini'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvanzamentoStatistiche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chiuso_il', models.DateTimeField(null=True)),
+                ('ordine_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VenditaOra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('giorno', models.DateField()),
+                ('ora', models.PositiveSmallIntegerField()),
+                ('ordini', models.PositiveIntegerField(default=0)),
+                ('incasso', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VenditaPiatto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('giorno', models.DateField()),
+                ('quantita', models.PositiveIntegerField(default=0)),
+                ('incasso', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VenditaPortata',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('giorno', models.DateField()),
+                ('portata', models.CharField(choices=[('antipasto', 'Antipasto'), ('primo', 'Primo'), ('secondo', 'Secondo'), ('dessert', 'Dessert')], max_length=20)),
+                ('quantita', models.PositiveIntegerField(default=0)),
+                ('incasso', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ordine',
+            name='chiuso_il',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ordinearchiviato',
+            name='chiuso_il',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(segna_chiusura, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ordine',
+            index=models.Index(fields=['chiuso_il', 'id'], name='ordine_chiuso_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='venditaora',
+            constraint=models.UniqueConstraint(fields=('giorno', 'ora'), name='vendita_ora_unica'),
+        ),
+        migrations.AddField(
+            model_name='venditapiatto',
+            name='piatto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='takeaway.piatto'),
+        ),
+        migrations.AddConstraint(
+            model_name='venditaportata',
+            constraint=models.UniqueConstraint(fields=('giorno', 'portata'), name='vendita_portata_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='venditapiatto',
+            constraint=models.UniqueConstraint(fields=('giorno', 'piatto'), name='vendita_piatto_unica'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Saldo attuale delle carte come primo movimento, così registro e saldi partono allineati
+def saldo_iniziale(apps, schema_editor):
+    CartaFedelta = apps.get_model('takeaway', 'CartaFedelta')
+    MovimentoPunti = apps.get_model('takeaway', 'MovimentoPunti')
+    MovimentoPunti.objects.bulk_create(
+        [MovimentoPunti(carta_id=id_carta, tipo='rettifica', punti=punti, nota='Saldo iniziale')
+         for id_carta, punti in CartaFedelta.objects.filter(punti__gt=0).values_list('id', 'punti').iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0021_statistiche'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentoPunti',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('accredito', 'Punti ordine'), ('riscatto', 'Buono sconto'), ('rettifica', 'Rettifica')], max_length=10)),
+                ('punti', models.IntegerField()),
+                ('ordine_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('nota', models.CharField(blank=True, max_length=200)),
+                ('creato_il', models.DateTimeField(auto_now_add=True)),
+                ('carta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimenti', to='takeaway.cartafedelta')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['carta', '-creato_il'], name='movimento_carta_idx')],
+            },
+        ),
+        migrations.RunPython(saldo_iniziale, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0022_movimentopunti'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='sogliasconto',
+            options={'ordering': ['punti_richiesti']},
+        ),
+        migrations.AddConstraint(
+            model_name='sogliasconto',
+            constraint=models.UniqueConstraint(fields=('punti_richiesti',), name='soglia_sconto_punti_unici', violation_error_message='Esiste già un premio con questi punti.'),
+        ),
+    ]
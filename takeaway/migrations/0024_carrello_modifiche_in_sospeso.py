@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0023_soglie_sconto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carrello',
+            name='modifiche_in_sospeso',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:22
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0024_carrello_modifiche_in_sospeso'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sogliasconto',
+            name='valore_buono',
+            field=models.DecimalField(decimal_places=2, default=5, max_digits=6, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takeaway', '0025_sogliasconto_valore_minimo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='venditaora',
+            name='vendita_ora_unica',
+        ),
+        migrations.RemoveConstraint(
+            model_name='venditapiatto',
+            name='vendita_piatto_unica',
+        ),
+        migrations.RemoveConstraint(
+            model_name='venditaportata',
+            name='vendita_portata_unica',
+        ),
+        migrations.AddField(
+            model_name='avanzamentostatistiche',
+            name='generazione',
+            field=models.PositiveIntegerField(default=0, unique=True),
+        ),
+        migrations.AddField(
+            model_name='avanzamentostatistiche',
+            name='pronta',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='venditaora',
+            name='generazione',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='venditapiatto',
+            name='generazione',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='venditaportata',
+            name='generazione',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ordinearchiviato',
+            index=models.Index(fields=['chiuso_il', 'id'], name='archivio_chiuso_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='venditaora',
+            constraint=models.UniqueConstraint(fields=('generazione', 'giorno', 'ora'), name='vendita_ora_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='venditapiatto',
+            constraint=models.UniqueConstraint(fields=('generazione', 'giorno', 'piatto'), name='vendita_piatto_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='venditaportata',
+            constraint=models.UniqueConstraint(fields=('generazione', 'giorno', 'portata'), name='vendita_portata_unica'),
+        ),
+    ]
@@ -1,8 +1,17 @@
-import os
+from decimal import Decimal
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.core.validators import MinValueValidator
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Left
+from django.utils import timezone
+
+from takeaway.rendition import genera_in_background
+from takeaway.storage import storage_foto
+
+FOTO_DIFFERITA = object()
 
 ORDINE_PORTATA = {
         'antipasto': 1,
@@ -11,6 +20,14 @@ ORDINE_PORTATA = {
         'dessert': 4,
     }
 
+class PiattoQuerySet(models.QuerySet):
+    def per_menu(self):
+        # Ordinamento per portata fatto dal DB, senza caricare la descrizione completa
+        return (self.only("nome", "prezzo", "portata", "ingredienti", "foto", "rendition_pronte")
+                .annotate(descrizione_breve=Left("descrizione", 41))
+                .order_by("portata_ordine", "id"))
+
+
 class Piatto(models.Model):
     PORTATA_CHOICES = [
         ('antipasto', 'Antipasto'),
@@ -31,43 +48,101 @@ class Piatto(models.Model):
     prezzo = models.DecimalField(max_digits=6, decimal_places=2)
     portata = models.CharField(max_length=20, choices=PORTATA_CHOICES, default='primo')
     ingredienti = models.CharField(max_length=20, choices=INGREDIENTI_CHOICES, default='carne')
-    foto = models.ImageField(upload_to='piatti/', blank=True, null=True)
+    foto = models.ImageField(upload_to='piatti/', storage=storage_foto, blank=True, null=True)
+    rendition_pronte = models.BooleanField(default=False, editable=False)  # Versioni ridimensionate generate
+    # Posizione della portata nel menu, calcolata e salvata dal DB
+    portata_ordine = models.GeneratedField(
+        expression=models.Case(
+            *[models.When(portata=portata, then=models.Value(ordine)) for portata, ordine in ORDINE_PORTATA.items()],
+            default=models.Value(len(ORDINE_PORTATA) + 1),
+        ),
+        output_field=models.PositiveSmallIntegerField(),
+        db_persist=True,
+    )
+
+    objects = PiattoQuerySet.as_manager()
+
+    _foto_db = None  # Foto salvata nel DB (None per un piatto nuovo)
 
     def __str__(self):
         return f"{self.nome} - {self.portata} ({self.prezzo} €)"
 
     class Meta:
         verbose_name_plural = "Piatti"
-
-    @property
-    def portata_ordine(self):
-        return ORDINE_PORTATA[self.portata]
-
-    # Rimozione foto
+        indexes = [
+            models.Index(fields=["portata_ordine", "id"], name="piatto_menu_idx"),
+        ]
+
+    # Mi segno la foto letta dal DB, per capire al salvataggio se è cambiata
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._foto_db = instance.__dict__.get('foto', FOTO_DIFFERITA)
+        return instance
+
+    def foto_cambiata(self):
+        if self._foto_db is FOTO_DIFFERITA:
+            if 'foto' not in self.__dict__:
+                return False  # Foto mai caricata -> non può essere cambiata
+            self._foto_db = Piatto.objects.filter(pk=self.pk).values_list('foto', flat=True).first()
+        return (self.foto.name or '') != (self._foto_db or '')
+
+    # Le foto sostituite non vengono cancellate qui: le rimuove il comando pulisci_media
     def save(self, *args, **kwargs):
-        # Se l'oggetto esiste già
-        try:
-            old_instance = Piatto.objects.get(pk=self.pk)
-            if old_instance.foto and old_instance.foto != self.foto:
-                if os.path.isfile(old_instance.foto.path):
-                    os.remove(old_instance.foto.path)
-        except Piatto.DoesNotExist:
-            pass  # Nuovo oggetto -> niente da cancellare
+        foto_cambiata = self.foto_cambiata()
+        if foto_cambiata:
+            self.rendition_pronte = False
 
         super().save(*args, **kwargs)
+        self._foto_db = self.foto.name
 
-    def delete(self, *args, **kwargs):
-        # Elimina la foto al momento del delete
-        if self.foto and os.path.isfile(self.foto.path):
-            os.remove(self.foto.path)
-        super().delete(*args, **kwargs)
+        # Le rendition della nuova foto vengono generate fuori dalla richiesta
+        if foto_cambiata and self.foto:
+            genera_in_background(self.pk, self.foto.name)
 
 
 class Carrello(models.Model):
     cliente = models.OneToOneField(User, on_delete=models.CASCADE)  # Un carrello per cliente
+    # Modifiche fatte in cache e non ancora salvate nelle righe (vedi carrelli.CacheCarrelloStore)
+    modifiche_in_sospeso = models.PositiveIntegerField(default=0)
 
+    # Righe del carrello con il piatto già caricato
+    def righe(self):
+        return self.piatti.select_related('piatto').order_by('id')
+
+    # Incremento atomico della quantità (doppi click e più schede non perdono aggiunte)
+    def aggiungi(self, id_piatto, quantita=1):
+        if self.piatti.filter(piatto_id=id_piatto).update(quantita=F('quantita') + quantita):
+            return
+        try:
+            with transaction.atomic():
+                self.piatti.create(piatto_id=id_piatto, quantita=quantita)
+        except IntegrityError:
+            # Riga appena creata da un'altra richiesta
+            self.piatti.filter(piatto_id=id_piatto).update(quantita=F('quantita') + quantita)
+
+    # Applica in una transazione un insieme di quantità {id_piatto: quantita} (0 rimuove il piatto)
+    def applica(self, quantita):
+        with transaction.atomic():
+            self.piatti.filter(piatto_id__in=[id_piatto for id_piatto, q in quantita.items() if q < 1]).delete()
+            PiattoCarrello.objects.bulk_create(
+                [PiattoCarrello(carrello=self, piatto_id=id_piatto, quantita=q) for id_piatto, q in quantita.items() if q >= 1],
+                update_conflicts=True, unique_fields=['carrello', 'piatto'], update_fields=['quantita'],
+            )
+
+    # Sostituisce l'intero contenuto del carrello (usato dal carrello in cache)
+    def sostituisci(self, quantita):
+        esistenti = set(Piatto.objects.filter(pk__in=quantita).values_list('pk', flat=True))
+        with transaction.atomic():
+            self.piatti.exclude(piatto_id__in=esistenti).delete()
+            self.applica({id_piatto: q for id_piatto, q in quantita.items() if id_piatto in esistenti})
+
+    # Totale calcolato dal DB con una sola query
     def totale(self):
-        return sum(piatto.subtotale() for piatto in self.piatti.all())
+        return self.piatti.aggregate(totale=Coalesce(
+            Sum(F('quantita') * F('piatto__prezzo'), output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+            0, output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ))['totale']
 
     def __str__(self):
         return f"Carrello di {self.cliente.username}"
@@ -78,10 +153,63 @@ class PiattoCarrello(models.Model):
     piatto = models.ForeignKey(Piatto, on_delete=models.CASCADE)
     quantita = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["carrello", "piatto"], name="piatto_carrello_unico"),
+        ]
+
     def subtotale(self):
         return self.piatto.prezzo * self.quantita
 
 
+class FasciaRitiroQuerySet(models.QuerySet):
+    # Fasce future con posti liberi, dalla più vicina (usa l'indice su inizio)
+    def disponibili(self):
+        return self.filter(inizio__gt=timezone.now(), prenotati__lt=F("capienza")).order_by("inizio")
+
+    # Occupa un posto con un UPDATE condizionato: False se la fascia è piena
+    def prenota(self, id_fascia):
+        return self.filter(pk=id_fascia, prenotati__lt=F("capienza")).update(prenotati=F("prenotati") + 1) == 1
+
+    def libera(self, id_fascia):
+        self.filter(pk=id_fascia, prenotati__gt=0).update(prenotati=F("prenotati") - 1)
+
+
+# Fascia oraria di ritiro con un numero massimo di ordini (capienza).
+# prenotati è un contatore aggiornato al checkout, non un conteggio degli ordini
+class FasciaRitiro(models.Model):
+    inizio = models.DateTimeField(unique=True)
+    capienza = models.PositiveIntegerField()
+    prenotati = models.PositiveIntegerField(default=0)
+
+    objects = FasciaRitiroQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["inizio"]
+
+    def posti_liberi(self):
+        return max(self.capienza - self.prenotati, 0)
+
+    def __str__(self):
+        return f"{timezone.localtime(self.inizio):%d/%m/%Y %H:%M}"
+
+
+class OrdineQuerySet(models.QuerySet):
+    # Totale ricalcolato dalle righe (per controllare i totali salvati)
+    def con_totale_righe(self):
+        return self.annotate(totale_righe=totale_righe())
+
+    def ricalcola_totali(self):
+        return self.update(totale=totale_righe())
+
+
+def totale_righe():
+    righe = (PiattoOrdine.objects.filter(ordine=OuterRef("pk")).values("ordine")
+             .annotate(somma=Sum(F("prezzo_unitario") * F("quantita"))).values("somma"))
+    return Coalesce(Subquery(righe, output_field=models.DecimalField(max_digits=8, decimal_places=2)),
+                    Value(Decimal(0)))
+
+
 class Ordine(models.Model):
     STATUS_CHOICES = [
         ('pending', 'In attesa'),
@@ -91,29 +219,54 @@ class Ordine(models.Model):
 
     cliente = models.ForeignKey(User, on_delete=models.CASCADE)
     orario_ritiro = models.DateTimeField()
+    fascia_ritiro = models.ForeignKey(FasciaRitiro, null=True, blank=True, on_delete=models.SET_NULL, related_name="ordini")
     stato = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     creato_il = models.DateTimeField(auto_now_add=True)
+    chiuso_il = models.DateTimeField(null=True, blank=True, editable=False)  # Passaggio a completed/cancelled
     sconto = models.DecimalField(max_digits=6, decimal_places=2, default=0)
+    punti_assegnati = models.BooleanField(default=False, editable=False)
+    # Totali salvati al checkout: le righe dell'ordine non cambiano (prezzo_unitario è una copia)
+    totale = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    totale_scontato = models.GeneratedField(
+        expression=F("totale") - F("sconto"),
+        output_field=models.DecimalField(max_digits=8, decimal_places=2),
+        db_persist=True,
+    )
 
-    def totale(self):
-        return sum(piatto.subtotale() for piatto in self.piatti.all())
+    objects = OrdineQuerySet.as_manager()
+
+    _stato_db = None  # Stato salvato nel DB (None per un ordine nuovo)
 
-    def totale_scontato(self):
-        return sum(piatto.subtotale() for piatto in self.piatti.all()) - self.sconto
+    class Meta:
+        # Percorsi della lista ordini: per stato (dipendenti) e per cliente, ordinati per ritiro
+        indexes = [
+            models.Index(fields=["stato", "orario_ritiro", "id"], name="ordine_stato_ritiro_idx"),
+            models.Index(fields=["cliente", "orario_ritiro", "id"], name="ordine_cliente_ritiro_idx"),
+            models.Index(fields=["orario_ritiro", "id"], name="ordine_ritiro_idx"),  # Tutti gli stati
+            models.Index(fields=["chiuso_il", "id"], name="ordine_chiuso_idx"),  # Statistiche incrementali
+        ]
 
     def __str__(self):
         return f"Ordine #{self.id} di {self.cliente.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stato_db = instance.__dict__.get('stato')
+        return instance
+
     def clean(self):
-        # Se l'ordine è già salvato e non era più "pending"
-        if self.pk:
-            stato_originale = Ordine.objects.get(pk=self.pk).stato
-            if stato_originale != "pending" and self.stato != stato_originale:
-                raise ValidationError("Lo stato non può essere più modificato.")
+        # Se l'ordine non era più "pending" (confronto con lo stato letto, senza rileggere l'ordine).
+        # I cambi di stato veri e propri passano da takeaway.ordini.cambia_stato_ordine
+        if self._stato_db not in (None, "pending") and self.stato != self._stato_db:
+            raise ValidationError("Lo stato non può essere più modificato.")
 
     def save(self, *args, **kwargs):
         self.full_clean()  # Fa scattare clean() prima di salvare
+        if self.stato != "pending" and self.chiuso_il is None:
+            self.chiuso_il = timezone.now()
         super().save(*args, **kwargs)
+        self._stato_db = self.stato
 
 
 class PiattoOrdine(models.Model):
@@ -129,25 +282,249 @@ class PiattoOrdine(models.Model):
         return f"{self.quantita} × {self.piatto.nome} (Ordine #{self.ordine.id})"
 
 
+# Archivio degli ordini chiusi (vedi takeaway/archivio.py): stessi campi e stesso id di Ordine,
+# così le tabelle degli ordini restano piccole e i link agli ordini archiviati continuano a funzionare
+class OrdineArchiviato(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    orario_ritiro = models.DateTimeField()
+    fascia_ritiro = models.ForeignKey(FasciaRitiro, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    stato = models.CharField(max_length=20, choices=Ordine.STATUS_CHOICES)
+    creato_il = models.DateTimeField()
+    chiuso_il = models.DateTimeField(null=True, blank=True)
+    sconto = models.DecimalField(max_digits=6, decimal_places=2, default=0)
+    punti_assegnati = models.BooleanField(default=False)
+    totale = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    totale_scontato = models.GeneratedField(
+        expression=F("totale") - F("sconto"),
+        output_field=models.DecimalField(max_digits=8, decimal_places=2),
+        db_persist=True,
+    )
+    archiviato_il = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Ordini archiviati"
+        indexes = [
+            models.Index(fields=["cliente", "orario_ritiro", "id"], name="archivio_cliente_ritiro_idx"),
+            models.Index(fields=["orario_ritiro", "id"], name="archivio_ritiro_idx"),
+            models.Index(fields=["chiuso_il", "id"], name="archivio_chiuso_idx"),  # Per ricostruisci_statistiche
+        ]
+
+    def __str__(self):
+        return f"Ordine #{self.id} di {self.cliente.username} (archiviato)"
+
+
+class PiattoOrdineArchiviato(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    ordine = models.ForeignKey(OrdineArchiviato, related_name="piatti", on_delete=models.CASCADE)
+    piatto = models.ForeignKey(Piatto, on_delete=models.CASCADE, related_name="+")
+    quantita = models.PositiveIntegerField(default=1)
+    prezzo_unitario = models.DecimalField(max_digits=6, decimal_places=2)
+
+    def subtotale(self):
+        return self.prezzo_unitario * self.quantita
+
+    def __str__(self):
+        return f"{self.quantita} × {self.piatto.nome} (Ordine #{self.ordine_id})"
+
+
+# Registro delle modifiche agli ordini letto dalla bacheca della cucina (vedi takeaway/bacheca.py).
+# Non è una ForeignKey: l'evento di un ordine eliminato deve restare
+class EventoOrdine(models.Model):
+    TIPO_CHOICES = [
+        ('creato', 'Creato'),
+        ('aggiornato', 'Aggiornato'),
+        ('eliminato', 'Eliminato'),
+    ]
+
+    ordine_id = models.PositiveIntegerField()
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    dati = models.JSONField(default=dict)  # Quello che serve alla bacheca, senza rileggere l'ordine
+    creato_il = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Ordine #{self.ordine_id} {self.tipo}"
+
+
+# Chiave monouso inviata con il form di checkout: un secondo invio con la stessa chiave
+# (es. il cliente ripete il POST) restituisce l'ordine già creato invece di crearne un altro
+class ChiaveCheckout(models.Model):
+    chiave = models.UUIDField(unique=True)
+    cliente = models.ForeignKey(User, on_delete=models.CASCADE)
+    ordine = models.OneToOneField(Ordine, on_delete=models.CASCADE, related_name="chiave_checkout")
+    creato_il = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Chiave {self.chiave} -> Ordine #{self.ordine_id}"
+
+
+# Movimenti della carta fedeltà: si aggiungono e basta, il saldo della carta deve essere la loro somma
+# (controllato da riconcilia_punti)
+class MovimentoPunti(models.Model):
+    ACCREDITO = "accredito"
+    RISCATTO = "riscatto"
+    RETTIFICA = "rettifica"
+    TIPO_CHOICES = [
+        (ACCREDITO, "Punti ordine"),
+        (RISCATTO, "Buono sconto"),
+        (RETTIFICA, "Rettifica"),
+    ]
+
+    carta = models.ForeignKey("CartaFedelta", on_delete=models.CASCADE, related_name="movimenti")
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    punti = models.IntegerField()  # Negativo per i punti tolti
+    ordine_id = models.PositiveBigIntegerField(null=True, blank=True)  # Senza FK: gli ordini vengono archiviati
+    nota = models.CharField(max_length=200, blank=True)
+    creato_il = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["carta", "-creato_il"], name="movimento_carta_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("I movimenti punti non si modificano: registrare una rettifica.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.punti:+d} ({self.carta.cliente.username})"
+
+
+class CartaFedeltaQuerySet(models.QuerySet):
+    # Aggiunge `saldo_movimenti`: la somma dei movimenti di ogni carta, calcolata nel database
+    def con_saldo_movimenti(self):
+        return self.annotate(saldo_movimenti=saldo_movimenti())
+
+    # Riporta il saldo delle carte alla somma dei loro movimenti con un solo UPDATE
+    def ricalcola_saldi(self):
+        return self.update(punti=saldo_movimenti())
+
+
+def saldo_movimenti():
+    movimenti = (MovimentoPunti.objects.filter(carta=OuterRef("pk")).values("carta")
+                 .annotate(somma=Sum("punti")).values("somma"))
+    return Coalesce(Subquery(movimenti, output_field=models.IntegerField()), Value(0))
+
+
 class CartaFedelta(models.Model):
     cliente = models.OneToOneField(User, on_delete=models.CASCADE, related_name="carta_fedelta")
     punti = models.PositiveIntegerField(default=0)
 
-    def aggiungi_punti(self, valore):
-        self.punti += valore
-        self.save()
+    objects = CartaFedeltaQuerySet.as_manager()
 
-    def rimuovi_punti(self, valore):
-        self.punti -= valore
-        self.save()
+    def aggiungi_punti(self, valore, ordine_id=None, tipo=MovimentoPunti.ACCREDITO, nota=""):
+        self.movimento(valore, tipo, ordine_id, nota)
+
+    def rimuovi_punti(self, valore, ordine_id=None, tipo=MovimentoPunti.RISCATTO, nota=""):
+        self.movimento(-valore, tipo, ordine_id, nota)
+
+    # Saldo aggiornato con F() (niente modifiche perse con richieste parallele) e movimento
+    # registrato nella stessa transazione
+    def movimento(self, punti, tipo, ordine_id=None, nota=""):
+        with transaction.atomic():
+            CartaFedelta.objects.filter(pk=self.pk).update(punti=F("punti") + punti)
+            MovimentoPunti.objects.create(carta=self, tipo=tipo, punti=punti, ordine_id=ordine_id, nota=nota)
+        self.refresh_from_db(fields=["punti"])
 
     def __str__(self):
         return f"Carta {self.cliente.username} - {self.punti} punti"
 
 
+# Premi della carta fedeltà: con più soglie vale la più alta raggiunta (vedi fedelta.PremiFedelta)
 class SogliaSconto(models.Model):
     punti_richiesti = models.PositiveIntegerField(default=100)
-    valore_buono = models.DecimalField(max_digits=6, decimal_places=2, default=5)
+    valore_buono = models.DecimalField(max_digits=6, decimal_places=2, default=5, validators=[MinValueValidator(0)])
+
+    class Meta:
+        ordering = ["punti_richiesti"]
+        constraints = [
+            models.UniqueConstraint(fields=["punti_richiesti"], name="soglia_sconto_punti_unici",
+                                    violation_error_message="Esiste già un premio con questi punti."),
+        ]
+
+    def __str__(self):
+        return f"{self.punti_richiesti} punti -> Buono da €{self.valore_buono}"
+
+
+# Lavoro da eseguire in background (vedi takeaway/coda.py e il comando esegui_job).
+# I job completati vengono eliminati, quelli falliti restano per essere controllati
+class Job(models.Model):
+    IN_ATTESA = 'in_attesa'
+    IN_CORSO = 'in_corso'
+    FALLITO = 'fallito'
+    STATO_CHOICES = [
+        (IN_ATTESA, 'In attesa'),
+        (IN_CORSO, 'In corso'),
+        (FALLITO, 'Fallito'),
+    ]
+
+    funzione = models.CharField(max_length=200)  # Percorso della funzione, es. takeaway.fedelta.assegna_punti_ordine
+    argomenti = models.JSONField(default=dict)
+    stato = models.CharField(max_length=20, choices=STATO_CHOICES, default=IN_ATTESA)
+    tentativi = models.PositiveIntegerField(default=0)
+    eseguire_dopo = models.DateTimeField(default=timezone.now)
+    lotto = models.UUIDField(null=True, blank=True)  # Worker che ha preso il job
+    preso_il = models.DateTimeField(null=True, blank=True)
+    errore = models.TextField(blank=True)
+    creato_il = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["stato", "eseguire_dopo"], name="job_da_eseguire_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.punti_richiesti} punti -> Buono da €{self.valore_buono}"
\ No newline at end of file
+        return f"Job #{self.id} {self.funzione} ({self.stato})"
+
+
+
+# Statistiche di vendita precalcolate (vedi takeaway/statistiche.py): la dashboard legge solo queste tabelle.
+# Contano gli ordini completati, per giorno di ritiro. Ogni ricalcolo da zero scrive una nuova generazione,
+# mostrata solo quando è completa
+class VenditaPiatto(models.Model):
+    generazione = models.PositiveIntegerField(default=0)
+    giorno = models.DateField()
+    piatto = models.ForeignKey(Piatto, on_delete=models.CASCADE, related_name="+")
+    quantita = models.PositiveIntegerField(default=0)
+    incasso = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Prima dello sconto
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["generazione", "giorno", "piatto"], name="vendita_piatto_unica"),
+        ]
+
+
+class VenditaPortata(models.Model):
+    generazione = models.PositiveIntegerField(default=0)
+    giorno = models.DateField()
+    portata = models.CharField(max_length=20, choices=Piatto.PORTATA_CHOICES)
+    quantita = models.PositiveIntegerField(default=0)
+    incasso = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Prima dello sconto
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["generazione", "giorno", "portata"], name="vendita_portata_unica"),
+        ]
+
+
+class VenditaOra(models.Model):
+    generazione = models.PositiveIntegerField(default=0)
+    giorno = models.DateField()
+    ora = models.PositiveSmallIntegerField()  # Ora di ritiro (ora locale)
+    ordini = models.PositiveIntegerField(default=0)
+    incasso = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Dopo lo sconto
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["generazione", "giorno", "ora"], name="vendita_ora_unica"),
+        ]
+
+
+# Fin dove sono arrivate le statistiche di una generazione: ultimo ordine chiuso (chiuso_il, id) già contato.
+# La dashboard mostra l'ultima generazione pronta; le altre sono ricalcoli in corso (o interrotti)
+class AvanzamentoStatistiche(models.Model):
+    generazione = models.PositiveIntegerField(unique=True, default=0)
+    pronta = models.BooleanField(default=True)
+    chiuso_il = models.DateTimeField(null=True)
+    ordine_id = models.BigIntegerField(default=0)
@@ -0,0 +1,86 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from takeaway.bacheca import dati_evento, registra_evento, registra_eventi
+from takeaway.coda import accoda
+from takeaway.fedelta import accredita_ordini, assegna_punti_ordine
+from takeaway.models import FasciaRitiro, Ordine
+from takeaway.statistiche import scorpora_ordine
+
+STATI_FINALI = ("completed", "cancelled")
+
+
+# Passaggio di un ordine da "pending" a uno stato finale con un UPDATE condizionato:
+# se due richieste provano a chiudere lo stesso ordine solo una modifica la riga,
+# e solo quella esegue gli effetti collegati. Ritorna False se l'ordine non era più "pending"
+def cambia_stato_ordine(ordine, stato):
+    if stato not in STATI_FINALI:
+        raise ValueError(f"Stato non valido: {stato}")
+
+    with transaction.atomic():
+        if not Ordine.objects.filter(pk=ordine.pk, stato="pending").update(stato=stato, chiuso_il=timezone.now()):
+            return False
+        ordine.stato = ordine._stato_db = stato
+
+        if stato == "completed":
+            accoda(assegna_punti_ordine, id_ordine=ordine.pk)  # Punti assegnati in background
+        elif ordine.fascia_ritiro_id:
+            FasciaRitiro.objects.libera(ordine.fascia_ritiro_id)
+
+        # L'UPDATE non invia segnali: evento per la bacheca scritto qui
+        registra_evento(ordine.pk, "aggiornato", dati_evento(ordine))
+
+    return True
+
+
+# Porta in blocco gli ordini "pending" indicati a "completed" o "cancelled", in un'unica transazione:
+# un UPDATE per gli ordini, uno per ogni carta fedeltà (vedi accredita_ordini)
+# e uno per ogni fascia di ritiro liberata. Ritorna il numero di ordini modificati
+def cambia_stato_ordini(ids, stato):
+    if stato not in STATI_FINALI:
+        raise ValueError(f"Stato non valido: {stato}")
+
+    with transaction.atomic():
+        ordini = list(Ordine.objects.select_for_update().select_related("cliente")
+                      .filter(pk__in=ids, stato="pending"))
+        if not ordini:
+            return 0
+
+        modifiche = {"stato": stato, "chiuso_il": timezone.now()}
+        if stato == "completed":
+            modifiche["punti_assegnati"] = True
+        Ordine.objects.filter(pk__in=[ordine.pk for ordine in ordini], stato="pending").update(**modifiche)
+
+        if stato == "completed":
+            accredita_ordini(ordini)  # 1 punto per ogni euro di ciascun ordine
+        else:
+            liberati = Counter(ordine.fascia_ritiro_id for ordine in ordini if ordine.fascia_ritiro_id)
+            for id_fascia, numero in liberati.items():
+                FasciaRitiro.objects.filter(pk=id_fascia).update(prenotati=Greatest(F("prenotati") - numero, 0))
+
+        # L'UPDATE non invia segnali: gli eventi per la bacheca vengono scritti qui
+        for ordine in ordini:
+            ordine.stato = stato
+        registra_eventi(ordini, "aggiornato")
+
+    return len(ordini)
+
+
+
+# Elimina un ordine: se era ancora "pending" il suo posto nella fascia di ritiro torna libero
+# (come quando viene cancellato), se era già contato nelle statistiche di vendita viene tolto.
+# Ritorna False se l'ordine era già stato eliminato
+def elimina_ordine(ordine):
+    with transaction.atomic():
+        ordine = Ordine.objects.select_for_update().filter(pk=ordine.pk).first()
+        if ordine is None:
+            return False
+        if ordine.stato == "pending" and ordine.fascia_ritiro_id:
+            FasciaRitiro.objects.libera(ordine.fascia_ritiro_id)
+        scorpora_ordine(ordine)
+        ordine.delete()
+    return True
@@ -0,0 +1,42 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import Http404
+
+
+# Paginazione a chiave (keyset) su (campo, id): invece di OFFSET la pagina parte
+# dall'ultima riga vista, quindi la pagina N costa come la prima (usa l'indice su campo, id)
+class PaginaKeyset:
+    def __init__(self, queryset, campo, dimensione, dopo=None, prima=None):
+        self.campo = campo
+
+        if prima:
+            valore, pk = self.decodifica(prima)
+            righe = list(queryset.filter(Q(**{f"{campo}__lt": valore}) | Q(**{campo: valore, "id__lt": pk}))
+                         .order_by(f"-{campo}", "-id")[:dimensione + 1])
+            altre_prima = len(righe) > dimensione
+            self.oggetti = righe[:dimensione][::-1]
+            altre_dopo = True
+        else:
+            if dopo:
+                valore, pk = self.decodifica(dopo)
+                queryset = queryset.filter(Q(**{f"{campo}__gt": valore}) | Q(**{campo: valore, "id__gt": pk}))
+            righe = list(queryset.order_by(campo, "id")[:dimensione + 1])
+            altre_dopo = len(righe) > dimensione
+            self.oggetti = righe[:dimensione]
+            altre_prima = bool(dopo)
+
+        self.precedente = self.codifica(self.oggetti[0]) if altre_prima and self.oggetti else None
+        self.successivo = self.codifica(self.oggetti[-1]) if altre_dopo and self.oggetti else None
+
+    def codifica(self, oggetto):
+        chiave = f"{getattr(oggetto, self.campo).isoformat()}|{oggetto.pk}"
+        return base64.urlsafe_b64encode(chiave.encode()).decode()
+
+    def decodifica(self, cursore):
+        try:
+            valore, pk = base64.urlsafe_b64decode(cursore.encode()).decode().split("|")
+            return datetime.fromisoformat(valore), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise Http404("Pagina non valida")
@@ -0,0 +1,87 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+# Larghezza massima (px) di ogni versione ridimensionata della foto
+DIMENSIONI = {
+    'thumb': 160,
+    'card': 480,
+    'detail': 960,
+}
+
+FORMATI = {
+    'webp': 'WEBP',
+    'jpg': 'JPEG',
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def nome_rendition(nome_foto, dimensione, formato):
+    cartella, file = os.path.split(os.path.splitext(nome_foto)[0])
+    return f"{cartella}/rendition/{file}_{dimensione}.{formato}"
+
+
+def nomi_rendition(nome_foto):
+    return [nome_rendition(nome_foto, dimensione, formato) for dimensione in DIMENSIONI for formato in FORMATI]
+
+
+# Le rendition hanno nomi derivati dalla foto originale: le salvo con lo storage di default
+def genera_rendition(nome_foto, storage):
+    with storage.open(nome_foto) as file:
+        originale = ImageOps.exif_transpose(Image.open(file))
+        originale.load()
+
+    for dimensione, larghezza in DIMENSIONI.items():
+        immagine = originale.copy()
+        immagine.thumbnail((larghezza, larghezza * 4))  # Non ingrandisce mai
+
+        for formato, formato_pil in FORMATI.items():
+            buffer = BytesIO()
+            convertita = immagine.convert('RGB') if formato_pil == 'JPEG' else immagine
+            convertita.save(buffer, formato_pil, quality=80)
+
+            nome = nome_rendition(nome_foto, dimensione, formato)
+            default_storage.delete(nome)  # Sovrascrivo la versione precedente
+            default_storage.save(nome, ContentFile(buffer.getvalue()))
+
+
+def rimuovi_rendition(nome_foto):
+    for nome in nomi_rendition(nome_foto):
+        default_storage.delete(nome)
+
+
+# Genera le rendition fuori dalla richiesta, dopo il commit della transazione
+def genera_in_background(id_piatto, nome_foto):
+    transaction.on_commit(lambda: _get_executor().submit(_genera_e_segna, id_piatto, nome_foto))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.RENDITION_WORKERS, thread_name_prefix="rendition")
+    return _executor
+
+
+def _genera_e_segna(id_piatto, nome_foto):
+    from takeaway.cache import incrementa_versione_menu
+    from takeaway.models import Piatto
+
+    try:
+        genera_rendition(nome_foto, Piatto._meta.get_field('foto').storage)
+        # Se nel frattempo la foto è cambiata non segno nulla
+        if Piatto.objects.filter(pk=id_piatto, foto=nome_foto).update(rendition_pronte=True):
+            incrementa_versione_menu()
+    except Exception:
+        logger.exception("Generazione rendition fallita per %s", nome_foto)
+    finally:
+        connection.close()  # Connessione del thread del pool
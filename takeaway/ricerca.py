@@ -0,0 +1,74 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Indice full-text (FTS5) di nome e descrizione dei piatti, disponibile solo con SQLite
+TABELLA_FTS = "takeaway_piatto_fts"
+TABELLA_PIATTI = "takeaway_piatto"
+
+# Peso di nome e descrizione nel calcolo della rilevanza
+PESI_BM25 = "10.0, 1.0"
+
+
+def ricerca_fts_disponibile(conn=connection):
+    return conn.vendor == 'sqlite'
+
+
+def crea_indice(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELLA_FTS} USING fts5(nome, descrizione, "
+                       f"tokenize = 'unicode61 remove_diacritics 2')")
+
+
+def elimina_indice(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABELLA_FTS}")
+
+
+def ricostruisci_indice(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELLA_FTS}")
+        cursor.execute(f"INSERT INTO {TABELLA_FTS} (rowid, nome, descrizione) "
+                       f"SELECT id, nome, descrizione FROM {TABELLA_PIATTI}")
+
+
+# Aggiornamento incrementale: rileggo i testi dalla tabella dei piatti
+def indicizza_piatti(ids):
+    if not ricerca_fts_disponibile() or not ids:
+        return
+    segnaposto = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELLA_FTS} WHERE rowid IN ({segnaposto})", ids)
+        cursor.execute(f"INSERT INTO {TABELLA_FTS} (rowid, nome, descrizione) "
+                       f"SELECT id, nome, descrizione FROM {TABELLA_PIATTI} WHERE id IN ({segnaposto})", ids)
+
+
+def rimuovi_piatti(ids):
+    if not ricerca_fts_disponibile() or not ids:
+        return
+    segnaposto = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELLA_FTS} WHERE rowid IN ({segnaposto})", ids)
+
+
+# "sushi sal" -> "sushi"* "sal"*  (tutte le parole, anche iniziate)
+def query_fts(testo):
+    return " ".join(f'"{parola}"*' for parola in re.findall(r"\w+", testo.lower()))
+
+
+# Filtra i piatti per testo e li ordina per rilevanza
+def cerca(queryset, testo):
+    query = query_fts(testo)
+    if not query:
+        return queryset
+
+    if not ricerca_fts_disponibile():
+        return queryset.filter(Q(nome__icontains=testo) | Q(descrizione__icontains=testo))
+
+    rilevanza = RawSQL(f"SELECT bm25({TABELLA_FTS}, {PESI_BM25}) FROM {TABELLA_FTS} "
+                       f"WHERE {TABELLA_FTS} MATCH %s AND rowid = {TABELLA_PIATTI}.id", (query,))
+    return (queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {TABELLA_FTS} WHERE {TABELLA_FTS} MATCH %s", (query,)))
+            .annotate(rilevanza=rilevanza)
+            .order_by("rilevanza", "portata_ordine", "id"))
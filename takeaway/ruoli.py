@@ -0,0 +1,84 @@
+from braces.views import GroupRequiredMixin
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+CLIENTI = "Clienti"
+DIPENDENTI = "Dipendenti"
+
+
+def chiave_gruppi(id_utente):
+    return f"takeaway:gruppi:{id_utente}"
+
+
+def cache_ruoli():
+    return caches[settings.RUOLI_CACHE]
+
+
+# Nomi dei gruppi dell'utente: una query la prima volta, poi dalla cache condivisa RUOLI_CACHE (svuotata dai
+# segnali quando cambiano i gruppi). Restano anche sull'oggetto utente: nella stessa richiesta non si rilegge
+# nemmeno la cache
+def gruppi_utente(user):
+    if not user.is_authenticated:
+        return frozenset()
+    gruppi = getattr(user, "_gruppi", None)
+    if gruppi is None:
+        gruppi = cache_ruoli().get(chiave_gruppi(user.pk))
+        if gruppi is None:
+            gruppi = frozenset(user.groups.values_list("name", flat=True))
+            cache_ruoli().set(chiave_gruppi(user.pk), gruppi, settings.RUOLI_CACHE_TIMEOUT)
+        user._gruppi = gruppi
+    return gruppi
+
+
+# Svuota la cache dopo il commit: prima, un'altra richiesta leggerebbe ancora i gruppi vecchi dal DB
+# e li rimetterebbe in cache
+def invalida_gruppi(id_utenti):
+    chiavi = [chiave_gruppi(id_utente) for id_utente in id_utenti]
+    transaction.on_commit(lambda: cache_ruoli().delete_many(chiavi))
+
+
+def ruolo_utente(user):
+    gruppi = gruppi_utente(user)
+    if DIPENDENTI in gruppi:
+        return "dipendente"
+    if CLIENTI in gruppi:
+        return "cliente"
+    return "anonimo"
+
+
+def chiave_id_gruppo(nome):
+    return f"takeaway:gruppo:{nome}"
+
+
+# Id di un gruppo, senza query dopo la prima volta (per aggiungere gli utenti alla registrazione).
+# Nella cache condivisa e con scadenza: un gruppo eliminato e ricreato altrove non lascia un id non valido
+def id_gruppo(nome):
+    return cache_ruoli().get_or_set(chiave_id_gruppo(nome), lambda: Group.objects.get(name=nome).pk,
+                                    settings.RUOLI_CACHE_TIMEOUT)
+
+
+# Con un gruppo rinominato il nome vecchio non è più noto: si svuotano gli id di tutti i gruppi usati
+def invalida_id_gruppi():
+    chiavi = [chiave_id_gruppo(nome) for nome in (CLIENTI, DIPENDENTI)]
+    transaction.on_commit(lambda: cache_ruoli().delete_many(chiavi))
+
+
+# request.ruolo: calcolato alla prima lettura, al più una volta per richiesta
+class RuoloMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        request.ruolo = SimpleLazyObject(lambda: ruolo_utente(request.user))
+
+
+# Context processor: `ruolo` nei template ("cliente", "dipendente" o "anonimo")
+def ruolo(request):
+    return {"ruolo": getattr(request, "ruolo", "anonimo")}
+
+
+# GroupRequiredMixin con i gruppi letti da gruppi_utente invece che con una query
+class GruppoRichiestoMixin(GroupRequiredMixin):
+    def check_membership(self, groups):
+        return self.request.user.is_superuser or bool(set(groups) & gruppi_utente(self.request.user))
@@ -0,0 +1,70 @@
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from takeaway.bacheca import dati_evento, registra_evento
+from takeaway.cache import incrementa_versione_menu, incrementa_versione_soglie
+from takeaway.models import Ordine, Piatto, SogliaSconto
+from takeaway.ricerca import indicizza_piatti, rimuovi_piatti
+from takeaway.ruoli import invalida_gruppi, invalida_id_gruppi
+
+
+# Ogni modifica al menu invalida le griglie in cache
+@receiver(post_save, sender=Piatto)
+@receiver(post_delete, sender=Piatto)
+def invalida_menu(sender, **kwargs):
+    incrementa_versione_menu()
+
+
+# Ogni modifica ai premi fa rileggere le soglie (vedi fedelta.premi_fedelta). Dopo il commit: prima, un'altra
+# richiesta potrebbe leggere la nuova versione insieme alle soglie vecchie e tenerle in memoria
+@receiver(post_save, sender=SogliaSconto)
+@receiver(post_delete, sender=SogliaSconto)
+def invalida_soglie(sender, **kwargs):
+    transaction.on_commit(incrementa_versione_soglie)
+
+
+# Aggiornamento incrementale dell'indice di ricerca
+@receiver(post_save, sender=Piatto)
+def indicizza_piatto(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'nome', 'descrizione'} & set(update_fields):
+        indicizza_piatti([instance.pk])
+
+
+@receiver(post_delete, sender=Piatto)
+def rimuovi_piatto_indice(sender, instance, **kwargs):
+    rimuovi_piatti([instance.pk])
+
+
+# Eventi per la bacheca ordini della cucina
+@receiver(post_save, sender=Ordine)
+def evento_ordine_salvato(sender, instance, created, **kwargs):
+    registra_evento(instance.pk, 'creato' if created else 'aggiornato', dati_evento(instance))
+
+
+@receiver(post_delete, sender=Ordine)
+def evento_ordine_eliminato(sender, instance, **kwargs):
+    registra_evento(instance.pk, 'eliminato', {'id': instance.pk})
+
+
+# Gruppi degli utenti in cache (vedi takeaway/ruoli.py): svuotata quando cambia l'appartenenza ai gruppi,
+# da entrambi i lati (user.groups.add(...) o group.user_set.add(...))
+@receiver(m2m_changed, sender=User.groups.through)
+def invalida_gruppi_utenti(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        invalida_gruppi([instance.pk])
+    elif action == "pre_clear":
+        invalida_gruppi(instance.user_set.values_list("pk", flat=True))
+    else:
+        invalida_gruppi(pk_set)
+
+
+# Gruppo rinominato o eliminato: cambiano i gruppi di tutti i suoi utenti
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalida_gruppo_modificato(sender, instance, **kwargs):
+    invalida_gruppi(instance.user_set.values_list("pk", flat=True))
+    invalida_id_gruppi()
@@ -0,0 +1,144 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Q, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+from takeaway.coda import job
+from takeaway.models import (AvanzamentoStatistiche, Ordine, OrdineArchiviato, PiattoOrdine, PiattoOrdineArchiviato,
+                             VenditaOra, VenditaPiatto, VenditaPortata)
+
+IMPORTO = DecimalField(max_digits=10, decimal_places=2)
+
+
+# Somma le vendite di questi ordini (completati) e delle loro righe alle statistiche della generazione
+# (con segno=-1 le toglie, per gli ordini già contati che vengono eliminati).
+# Le aggregazioni le fa il database; qui si leggono solo le righe già presenti per gli stessi giorni
+def conta_vendite(generazione, ordini, righe, segno=1):
+    fuso = timezone.get_current_timezone()
+    ordini = ordini.filter(stato="completed").annotate(
+        giorno=TruncDate("orario_ritiro", tzinfo=fuso), ora=ExtractHour("orario_ritiro", tzinfo=fuso))
+    righe = righe.filter(ordine__stato="completed").annotate(
+        giorno=TruncDate("ordine__orario_ritiro", tzinfo=fuso), portata=F("piatto__portata"))
+    venduti = {"venduti": Sum("quantita"), "incassato": Sum(F("quantita") * F("prezzo_unitario"), output_field=IMPORTO)}
+    campi_righe = {"quantita": "venduti", "incasso": "incassato"}
+
+    _somma(VenditaOra, generazione, ["giorno", "ora"], {"ordini": "numero", "incasso": "incassato"},
+           ordini.values("giorno", "ora").order_by().annotate(numero=Count("id"), incassato=Sum("totale_scontato")), segno)
+    _somma(VenditaPiatto, generazione, ["giorno", "piatto_id"], campi_righe,
+           righe.values("giorno", "piatto_id").order_by().annotate(**venduti), segno)
+    _somma(VenditaPortata, generazione, ["giorno", "portata"], campi_righe,
+           righe.values("giorno", "portata").order_by().annotate(**venduti), segno)
+
+
+# Aggiunge i valori di `gruppi` ({campo: annotazione}), moltiplicati per `segno`, alle righe di `modello`
+# della generazione con le stesse chiavi (create se mancano), con un solo upsert
+def _somma(modello, generazione, chiavi, valori, gruppi, segno=1):
+    gruppi = list(gruppi)
+    if not gruppi:
+        return
+    esistenti = {tuple(getattr(riga, chiave) for chiave in chiavi): riga
+                 for riga in modello.objects.filter(generazione=generazione,
+                                                    giorno__in={gruppo["giorno"] for gruppo in gruppi})}
+
+    nuove = []
+    for gruppo in gruppi:
+        riga = modello(generazione=generazione, **{chiave: gruppo[chiave] for chiave in chiavi})
+        vecchia = esistenti.get(tuple(gruppo[chiave] for chiave in chiavi))
+        for campo, annotazione in valori.items():
+            setattr(riga, campo, segno * gruppo[annotazione] + (getattr(vecchia, campo) if vecchia else 0))
+        nuove.append(riga)
+
+    campi_unici = ["generazione"] + [modello._meta.get_field(chiave).name for chiave in chiavi]
+    modello.objects.bulk_create(nuove, update_conflicts=True, unique_fields=campi_unici, update_fields=list(valori))
+
+
+# Ordini chiusi già contati nelle statistiche (fino al segnalivello compreso)
+def gia_contati(avanzamento):
+    if avanzamento.chiuso_il is None:
+        return Q(pk__in=[])
+    return Q(chiuso_il__lt=avanzamento.chiuso_il) | Q(chiuso_il=avanzamento.chiuso_il, id__lte=avanzamento.ordine_id)
+
+
+# Generazione mostrata dalla dashboard: l'ultima completata (None se le statistiche non sono mai state calcolate)
+def avanzamento_attivo():
+    return AvanzamentoStatistiche.objects.filter(pronta=True).order_by("-generazione").first()
+
+
+# Conta nella generazione gli ordini chiusi dopo il suo segnalivello (chiuso_il, id), a lotti: ogni ordine viene
+# contato una volta sola. Con archivio=True legge anche gli ordini archiviati, con lo stesso segnalivello: un
+# ordine spostato da una tabella all'altra durante il conteggio mantiene chiuso_il e id e viene contato una volta.
+# Gli ordini chiusi negli ultimi STATISTICHE_MARGINE_SECONDI aspettano il giro successivo, così una transazione
+# che chiude un ordine e fa commit in ritardo non finisce dietro il segnalivello
+def _conta_chiusi(generazione, lotto, archivio=False):
+    limite = timezone.now() - timedelta(seconds=settings.STATISTICHE_MARGINE_SECONDI)
+    tabelle = [(Ordine, PiattoOrdine)] + ([(OrdineArchiviato, PiattoOrdineArchiviato)] if archivio else [])
+    contati = 0
+    while True:
+        with transaction.atomic():
+            avanzamento = AvanzamentoStatistiche.objects.select_for_update().get(generazione=generazione)
+            chiusi = sorted(
+                (chiuso_il, id_ordine, indice)
+                for indice, (modello, _) in enumerate(tabelle)
+                for chiuso_il, id_ordine in modello.objects.filter(chiuso_il__lte=limite)
+                .exclude(gia_contati(avanzamento)).order_by("chiuso_il", "id").values_list("chiuso_il", "id")[:lotto]
+            )[:lotto]
+            if not chiusi:
+                return contati
+
+            for indice, (modello, modello_righe) in enumerate(tabelle):
+                ids = [id_ordine for _, id_ordine, tabella in chiusi if tabella == indice]
+                if ids:
+                    conta_vendite(generazione, modello.objects.filter(pk__in=ids),
+                                  modello_righe.objects.filter(ordine_id__in=ids))
+            avanzamento.chiuso_il, avanzamento.ordine_id, _ = chiusi[-1]
+            avanzamento.save()
+
+        contati += len(chiusi)
+
+
+# Aggiunge alle statistiche mostrate gli ordini chiusi dall'ultimo aggiornamento
+@job
+def aggiorna_statistiche(lotto=500):
+    with transaction.atomic():
+        attivo = avanzamento_attivo() or AvanzamentoStatistiche.objects.get_or_create(generazione=0)[0]
+    return _conta_chiusi(attivo.generazione, lotto)
+
+
+# Toglie dalle statistiche un ordine che sta per essere eliminato, in ogni generazione che lo aveva già contato
+# (da chiamare nella transazione che lo elimina)
+def scorpora_ordine(ordine):
+    for avanzamento in AvanzamentoStatistiche.objects.select_for_update():
+        contato = Ordine.objects.filter(gia_contati(avanzamento), pk=ordine.pk)
+        conta_vendite(avanzamento.generazione, contato, PiattoOrdine.objects.filter(ordine__in=contato), segno=-1)
+
+
+# Elimina le generazioni scelte da `filtro`, a lotti di righe: nessuna transazione lunga
+def _elimina_generazioni(lotto, **filtro):
+    generazioni = AvanzamentoStatistiche.objects.filter(**filtro).values("generazione")
+    for modello in (VenditaOra, VenditaPiatto, VenditaPortata):
+        while modello.objects.filter(
+                pk__in=modello.objects.filter(generazione__in=generazioni).values("pk")[:lotto]).delete()[0]:
+            pass
+    AvanzamentoStatistiche.objects.filter(**filtro).delete()
+
+
+# Ricalcola da zero in una nuova generazione, con transazioni brevi come aggiorna_statistiche: intanto la
+# dashboard mostra la generazione precedente (e il sito continua a scrivere), mai quella parziale.
+# L'ultimo lotto e il passaggio alla nuova generazione sono nella stessa transazione; la vecchia viene
+# eliminata dopo. Le generazioni di un ricalcolo interrotto vengono eliminate da quello successivo
+def ricostruisci_statistiche(lotto=500):
+    _elimina_generazioni(lotto, pronta=False)
+    with transaction.atomic():
+        ultima = AvanzamentoStatistiche.objects.aggregate(ultima=Max("generazione"))["ultima"]
+        generazione = AvanzamentoStatistiche.objects.create(generazione=(ultima or 0) + 1, pronta=False).generazione
+
+    contati = _conta_chiusi(generazione, lotto, archivio=True)
+    with transaction.atomic():
+        contati += _conta_chiusi(generazione, lotto, archivio=True)  # Chiusi nel frattempo
+        AvanzamentoStatistiche.objects.filter(generazione=generazione).update(pronta=True)
+
+    _elimina_generazioni(lotto, generazione__lt=generazione)
+    return contati
@@ -0,0 +1,43 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+# Nomi generati da ContenutoHashStorage (e rendition derivate): il contenuto non cambia mai
+NOME_IMMUTABILE = re.compile(r"(^|/)[0-9a-f]{64}(_[a-z]+)?\.[a-z0-9]+$")
+
+
+# Salva i file con il nome dato dallo sha256 del contenuto: upload identici finiscono
+# nello stesso file e un nome non cambia mai contenuto (cache a lungo termine)
+class ContenutoHashStorage(FileSystemStorage):
+    def __init__(self, **kwargs):
+        # Sovrascrivere un file con lo stesso nome vuol dire riscrivere gli stessi byte
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def nome_contenuto(name, content):
+        sha = hashlib.sha256()
+        for chunk in content.chunks():
+            sha.update(chunk)
+        content.seek(0)
+
+        cartella = os.path.dirname(name)
+        estensione = os.path.splitext(name)[1].lower()
+        return os.path.join(cartella, sha.hexdigest() + estensione)
+
+    def get_available_name(self, name, max_length=None):
+        return name  # Il nome definitivo viene deciso in _save
+
+    def _save(self, name, content):
+        nome = self.nome_contenuto(name, content)
+        if self.exists(nome):
+            # Upload duplicato: aggiorno la data così pulisci_media non lo considera vecchio
+            os.utime(self.path(nome))
+            return nome
+        return super()._save(nome, content)
+
+
+def storage_foto():
+    return ContenutoHashStorage()
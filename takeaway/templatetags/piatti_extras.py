@@ -0,0 +1,21 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from takeaway.rendition import DIMENSIONI, nome_rendition
+
+register = template.Library()
+
+
+# Elenco "url larghezza" delle rendition di una foto, da usare in srcset
+@register.simple_tag
+def srcset(foto, formato='webp'):
+    return ", ".join(
+        f"{default_storage.url(nome_rendition(foto.name, dimensione, formato))} {larghezza}w"
+        for dimensione, larghezza in DIMENSIONI.items()
+    )
+
+
+# Url di una singola rendition
+@register.simple_tag
+def rendition(foto, dimensione='card', formato='jpg'):
+    return default_storage.url(nome_rendition(foto.name, dimensione, formato))
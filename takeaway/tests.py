@@ -1,9 +1,50 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
 from django.contrib.auth.models import User, Group
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
+from takeaway.bacheca import Bacheca, flusso_eventi
+from takeaway.cache import cache_versioni, rileggi_versioni, versione_soglie, CHIAVE_VERSIONE_MENU
+from takeaway import carrelli
+from takeaway.carrelli import cache_carrelli, chiave_carrello, salva_carrelli
+from takeaway.checkout import calcola_sconto
+from takeaway.esportazione import righe_esportazione
+from takeaway.checks import controlla_cache_carrelli, controlla_cache_ruoli, controlla_cache_versioni
+from takeaway.coda import accoda, esegui_job, job, job_in_ritardo, prendi_job
+from takeaway.fedelta import PremiFedelta, assegna_punti_ordine, premi_fedelta
 from takeaway.forms import PiattoForm
-from takeaway.models import Piatto, SogliaSconto, Carrello, PiattoCarrello, CartaFedelta, Ordine, PiattoOrdine
+from takeaway.ordini import cambia_stato_ordine, cambia_stato_ordini, elimina_ordine
+from takeaway.models import Piatto, SogliaSconto, Carrello, PiattoCarrello, CartaFedelta, Ordine, PiattoOrdine, ChiaveCheckout, FasciaRitiro, Job, EventoOrdine, MovimentoPunti, OrdineArchiviato, AvanzamentoStatistiche, VenditaOra, VenditaPiatto, VenditaPortata
+from takeaway.rendition import nomi_rendition
+from takeaway.ruoli import cache_ruoli, chiave_gruppi, id_gruppo
+from takeaway import statistiche
+from takeaway.statistiche import aggiorna_statistiche, avanzamento_attivo, ricostruisci_statistiche
+from takeaway.views import PiattoListView
+from Wasabi.forms import CreaUtenteCliente
+from Wasabi.views import media
+from PIL import Image
 
 
 # Aggiunta piatto
@@ -77,6 +118,9 @@ class CheckoutTest(TestCase):
         # Soglia sconto
         self.soglia = SogliaSconto.objects.create(punti_richiesti=100, valore_buono=5)
 
+        # Fascia di ritiro sempre nel futuro
+        self.fascia = FasciaRitiro.objects.create(inizio=timezone.now() + timedelta(days=1), capienza=10)
+
         # Carrello
         self.carrello = Carrello.objects.create(cliente=self.user)
         PiattoCarrello.objects.create(carrello=self.carrello, piatto=self.piatto1, quantita=1)
@@ -88,7 +132,7 @@ class CheckoutTest(TestCase):
         CartaFedelta.objects.create(cliente=self.user, punti=50)
 
         response = self.client.post(reverse('takeaway:checkout'), data={
-            'orario_ritiro': '2025-09-11T12:00'
+            'fascia_ritiro': self.fascia.pk
         })
 
         self.assertEqual(response.status_code, 302)  # Redirect
@@ -106,7 +150,7 @@ class CheckoutTest(TestCase):
         CartaFedelta.objects.create(cliente=self.user, punti=150)
 
         response = self.client.post(reverse('takeaway:checkout'), data={
-            'orario_ritiro': '2025-09-11T12:00'
+            'fascia_ritiro': self.fascia.pk
         })
 
         self.assertEqual(response.status_code, 302)  # Redirect
@@ -128,13 +172,55 @@ class CheckoutTest(TestCase):
         PiattoCarrello.objects.all().delete()
 
         response = self.client.post(reverse('takeaway:checkout'), data={
-            'orario_ritiro': '2025-09-11T12:00'
+            'fascia_ritiro': self.fascia.pk
         })
 
         # Deve fare redirect al menu perché carrello vuoto
         self.assertEqual(response.status_code, 302)  # Redirect
         self.assertRedirects(response, reverse('takeaway:piatti'))
 
+    # Invio ripetuto con la stessa chiave: un solo ordine e punti scalati una volta
+    def test_checkout_ripetuto(self):
+        CartaFedelta.objects.create(cliente=self.user, punti=150)
+
+        response = self.client.get(reverse('takeaway:checkout'))
+        chiave = response.context['form']['chiave'].value()
+
+        for _ in range(3):
+            response = self.client.post(reverse('takeaway:checkout'), data={
+                'fascia_ritiro': self.fascia.pk,
+                'chiave': chiave,
+            })
+            self.assertRedirects(response, reverse('takeaway:checkout_success'))
+
+        self.assertEqual(Ordine.objects.filter(cliente=self.user).count(), 1)
+        self.assertEqual(PiattoOrdine.objects.count(), 2)
+        self.assertEqual(CartaFedelta.objects.get(cliente=self.user).punti, 150 - self.soglia.punti_richiesti)
+        self.assertEqual(list(MovimentoPunti.objects.values_list('tipo', 'punti', 'ordine_id')),
+                         [('riscatto', -self.soglia.punti_richiesti, Ordine.objects.get(cliente=self.user).pk)])
+
+    # Totali salvati nell'ordine al checkout
+    def test_totali_salvati(self):
+        CartaFedelta.objects.create(cliente=self.user, punti=150)
+        self.client.post(reverse('takeaway:checkout'), data={'fascia_ritiro': self.fascia.pk})
+
+        ordine = Ordine.objects.get(cliente=self.user)
+        self.assertEqual(ordine.totale, 20.50)
+        self.assertEqual(ordine.totale_scontato, 15.50)
+
+    # Le chiavi scadute vengono eliminate, l'ordine resta
+    def test_pulisci_chiavi_checkout(self):
+        self.client.post(reverse('takeaway:checkout'), data={
+            'fascia_ritiro': self.fascia.pk,
+            'chiave': '2f1b6f0e-8c1d-4d5a-9a57-3d2a1c9e7b10',
+        })
+        ChiaveCheckout.objects.update(creato_il=timezone.now() - timedelta(hours=25))
+
+        call_command('pulisci_chiavi_checkout', stdout=StringIO())
+
+        self.assertFalse(ChiaveCheckout.objects.exists())
+        self.assertEqual(Ordine.objects.count(), 1)
+
 
 # Aggiunta piatto diversi gruppi
 class PiattoCreateTest(TestCase):
@@ -194,4 +280,1647 @@ class PiattoCreateTest(TestCase):
 
         self.assertEqual(response.status_code, 302)  # Redirect
         self.assertIn(reverse('login'), response.url)  # Reindirizzamento al login
-        self.assertFalse(Piatto.objects.filter(nome='Ramen').exists())  # Piatto non creato
\ No newline at end of file
+        self.assertFalse(Piatto.objects.filter(nome='Ramen').exists())  # Piatto non creato
+
+# Menu
+class PiattoListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        # Inseriti in ordine diverso da quello del menu
+        Piatto.objects.create(nome="Mochi", descrizione="Dolce di riso", prezzo=4.00, portata="dessert", ingredienti="vegano")
+        Piatto.objects.create(nome="Sushi", descrizione="Pesce fresco", prezzo=4.00, portata="secondo", ingredienti="pesce")
+        Piatto.objects.create(nome="Edamame", descrizione="Fagioli di soia", prezzo=3.50, portata="antipasto", ingredienti="vegano")
+        Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12.50, portata="primo", ingredienti="carne")
+
+    # Piatti ordinati per portata
+    def test_ordinamento_portata(self):
+        response = self.client.get(reverse('takeaway:piatti'))
+        nomi = [piatto.nome for piatto in response.context['object_list']]
+        self.assertEqual(nomi, ["Edamame", "Ramen", "Sushi", "Mochi"])
+
+    # Filtri applicati insieme all'ordinamento
+    def test_filtro_ingrediente(self):
+        response = self.client.get(reverse('takeaway:piatti'), {'ingrediente': 'vegano'})
+        nomi = [piatto.nome for piatto in response.context['object_list']]
+        self.assertEqual(nomi, ["Edamame", "Mochi"])
+
+    # Paginazione
+    def test_paginazione(self):
+        for i in range(PiattoListView.paginate_by):
+            Piatto.objects.create(nome=f"Dessert {i}", descrizione="Dolce", prezzo=3.00, portata="dessert", ingredienti="vegano")
+
+        response = self.client.get(reverse('takeaway:piatti'))
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(response.context['object_list'][0].nome, "Edamame")
+
+        response = self.client.get(reverse('takeaway:piatti'), {'page': 2})
+        self.assertEqual(len(response.context['object_list']), 4)
+
+    # La descrizione completa non viene caricata
+    def test_descrizione_non_caricata(self):
+        response = self.client.get(reverse('takeaway:piatti'))
+        piatto = response.context['object_list'][0]
+        self.assertIn('descrizione', piatto.get_deferred_fields())
+        self.assertEqual(piatto.descrizione_breve, "Fagioli di soia")
+
+
+
+# Cache del menu
+class MenuCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        rileggi_versioni()
+        self.piatto = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo",
+            prezzo=12.50, portata="primo", ingredienti="carne"
+        )
+
+    # Seconda richiesta servita dalla cache senza query
+    def test_menu_in_cache(self):
+        self.client.get(reverse('takeaway:piatti'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('takeaway:piatti'))
+        self.assertContains(response, "Ramen")
+
+    # Filtri diversi -> voci di cache diverse
+    def test_chiave_per_filtri(self):
+        self.client.get(reverse('takeaway:piatti'))
+
+        response = self.client.get(reverse('takeaway:piatti'), {'portata': 'secondo'})
+        self.assertNotContains(response, "Ramen")
+
+    # Modifica e rimozione di un piatto invalidano la cache
+    def test_invalidazione(self):
+        self.client.get(reverse('takeaway:piatti'))
+
+        self.piatto.nome = "Udon"
+        self.piatto.save()
+        response = self.client.get(reverse('takeaway:piatti'))
+        self.assertContains(response, "Udon")
+
+        self.piatto.delete()
+        response = self.client.get(reverse('takeaway:piatti'))
+        self.assertNotContains(response, "Udon")
+
+    # Versione cambiata da un altro processo: l'ETag delle API cambia al più dopo VERSIONI_CACHE_SECONDI,
+    # anche senza segnali in questo processo
+    def test_etag_modifica_da_altro_processo(self):
+        etag = self.client.get(reverse('takeaway:api_piatti'))["ETag"]
+        cache_versioni().set(CHIAVE_VERSIONE_MENU, time.time_ns(), None)
+
+        self.assertEqual(self.client.get(reverse('takeaway:api_piatti'), headers={'if-none-match': etag}).status_code, 304)
+        with mock.patch('takeaway.cache.time.monotonic', return_value=time.monotonic() + settings.VERSIONI_CACHE_SECONDI):
+            response = self.client.get(reverse('takeaway:api_piatti'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    # Le versioni non possono stare in una cache locale al processo
+    def test_cache_locale_rifiutata(self):
+        self.assertEqual(controlla_cache_versioni(None), [])
+        with self.settings(VERSIONI_CACHE='default'):
+            self.assertEqual([errore.id for errore in controlla_cache_versioni(None)], ['takeaway.E003'])
+
+    # I link della griglia in cache non portano i parametri della prima richiesta che non sono nella chiave
+    def test_link_paginazione(self):
+        for numero in range(12):
+            Piatto.objects.create(nome=f"Piatto {numero}", descrizione="Descrizione", prezzo=5,
+                portata="primo", ingredienti="carne")
+
+        self.client.get(reverse('takeaway:piatti'), {'portata': 'primo', 'utm_source': 'newsletter'})
+        response = self.client.get(reverse('takeaway:piatti'), {'portata': 'primo'})
+        self.assertContains(response, 'href="?portata=primo&amp;page=2"')
+        self.assertNotContains(response, 'utm_source')
+
+
+
+# Rendition delle foto
+class RenditionTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(buffer, 'JPEG')
+        self.piatto = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo",
+            prezzo=12.50, portata="primo", ingredienti="carne",
+            foto=SimpleUploadedFile("ramen.jpg", buffer.getvalue(), content_type="image/jpeg")
+        )
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root)
+
+    # Il comando genera tutte le rendition e segna il piatto
+    def test_genera_rendition(self):
+        self.assertFalse(self.piatto.rendition_pronte)
+
+        call_command('genera_rendition', processi=1, stdout=StringIO())
+
+        self.piatto.refresh_from_db()
+        self.assertTrue(self.piatto.rendition_pronte)
+        for nome in nomi_rendition(self.piatto.foto.name):
+            self.assertTrue(self.piatto.foto.storage.exists(nome))
+
+        # Le rendition non superano la larghezza prevista
+        with self.piatto.foto.storage.open(nomi_rendition(self.piatto.foto.name)[0]) as file:
+            self.assertEqual(Image.open(file).width, 160)
+
+    # Eliminando il piatto le rendition vengono rimosse dalla pulizia dei media
+    def test_rimozione_rendition(self):
+        call_command('genera_rendition', processi=1, stdout=StringIO())
+        nomi = nomi_rendition(self.piatto.foto.name)
+
+        self.piatto.delete()
+        call_command('pulisci_media', minuti=0, stdout=StringIO())
+        for nome in nomi:
+            self.assertFalse(self.piatto.foto.storage.exists(nome))
+
+
+# Storage delle foto con nome dato dal contenuto
+class FotoStorageTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+        buffer = BytesIO()
+        Image.new('RGB', (100, 100), 'green').save(buffer, 'JPEG')
+        self.contenuto = buffer.getvalue()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root)
+
+    def crea_piatto(self, nome, nome_file):
+        return Piatto.objects.create(nome=nome, descrizione="Descrizione", prezzo=5, portata="primo",
+            ingredienti="vegano", foto=SimpleUploadedFile(nome_file, self.contenuto, content_type="image/jpeg")
+        )
+
+    # Upload identici -> stesso file
+    def test_deduplica(self):
+        piatto1 = self.crea_piatto("Udon", "udon.jpg")
+        piatto2 = self.crea_piatto("Soba", "soba.JPG")
+
+        self.assertEqual(piatto1.foto.name, piatto2.foto.name)
+        self.assertRegex(piatto1.foto.name, r"^piatti/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, "piatti"))), 1)
+
+    # Il salvataggio non rilegge il piatto dal DB
+    def test_salvataggio_senza_select(self):
+        piatto = Piatto.objects.get(pk=self.crea_piatto("Udon", "udon.jpg").pk)
+        piatto.prezzo = 6
+
+        with CaptureQueriesContext(connection) as queries:
+            piatto.save()
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'takeaway_piatto' in q['sql']])
+
+    # La foto sostituita resta finché non viene eseguita la pulizia
+    def test_pulizia_foto_orfane(self):
+        piatto = self.crea_piatto("Udon", "udon.jpg")
+        vecchia = piatto.foto.name
+
+        buffer = BytesIO()
+        Image.new('RGB', (100, 100), 'blue').save(buffer, 'JPEG')
+        piatto.foto = SimpleUploadedFile("udon2.jpg", buffer.getvalue(), content_type="image/jpeg")
+        piatto.save()
+        self.assertTrue(piatto.foto.storage.exists(vecchia))
+
+        call_command('pulisci_media', minuti=0, stdout=StringIO())
+        self.assertFalse(piatto.foto.storage.exists(vecchia))
+        self.assertTrue(piatto.foto.storage.exists(piatto.foto.name))
+
+    # Le foto vengono servite con cache immutabile
+    @override_settings(DEBUG=True)
+    def test_cache_control_immutabile(self):
+        piatto = self.crea_piatto("Udon", "udon.jpg")
+
+        response = media(RequestFactory().get(piatto.foto.url), piatto.foto.name)
+        self.assertIn("immutable", response["Cache-Control"])
+
+
+# Ricerca full-text
+class RicercaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sushi = Piatto.objects.create(nome="Sushi misto", descrizione="Nigiri di salmone e tonno",
+            prezzo=14.00, portata="secondo", ingredienti="pesce"
+        )
+        self.salmone = Piatto.objects.create(nome="Salmone alla piastra", descrizione="Filetto con verdure",
+            prezzo=16.00, portata="secondo", ingredienti="pesce"
+        )
+        self.edamame = Piatto.objects.create(nome="Edamame", descrizione="Fagioli di soia salati",
+            prezzo=3.50, portata="antipasto", ingredienti="vegano"
+        )
+
+    def cerca(self, **parametri):
+        response = self.client.get(reverse('takeaway:piatti'), parametri)
+        return [piatto.nome for piatto in response.context['object_list']]
+
+    # Ricerca per prefisso, prima i piatti con la parola nel nome
+    def test_ricerca_prefisso_e_rilevanza(self):
+        self.assertEqual(self.cerca(q="salm"), ["Salmone alla piastra", "Sushi misto"])
+
+    # Ricerca combinata con i filtri
+    def test_ricerca_con_filtri(self):
+        self.assertEqual(self.cerca(q="sal", ingrediente="vegano"), ["Edamame"])
+
+    # L'indice segue modifiche e rimozioni
+    def test_indice_aggiornato(self):
+        self.edamame.descrizione = "Fagioli di soia al vapore"
+        self.edamame.save()
+        self.salmone.delete()
+
+        self.assertEqual(self.cerca(q="salm"), ["Sushi misto"])
+        self.assertEqual(self.cerca(q="vapore"), ["Edamame"])
+
+    # Ricostruzione completa dell'indice
+    def test_ricostruzione_indice(self):
+        Piatto.objects.filter(pk=self.edamame.pk).update(nome="Gyoza")  # Nessun segnale
+        call_command('ricostruisci_indice_ricerca', stdout=StringIO())
+
+        self.assertEqual(self.cerca(q="gyoza"), ["Gyoza"])
+
+
+# API JSON del menu
+class ApiPiattiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.piatti = [
+            Piatto.objects.create(nome=f"Piatto {i}", descrizione="Descrizione", prezzo=5, portata=portata, ingredienti="vegano")
+            for i, portata in enumerate(["dessert", "primo", "antipasto", "primo", "secondo"])
+        ]
+
+    # Campi selezionati con fields=
+    def test_campi_selezionati(self):
+        response = self.client.get(reverse('takeaway:api_piatto', args=[self.piatti[0].pk]), {'fields': 'nome,prezzo'})
+        self.assertEqual(response.json(), {'nome': "Piatto 0", 'prezzo': "5.00"})
+
+        response = self.client.get(reverse('takeaway:api_piatti'), {'fields': 'nome,password'})
+        self.assertEqual(response.status_code, 400)
+
+    # Paginazione a cursore in ordine di menu
+    def test_paginazione_cursore(self):
+        nomi = []
+        parametri = {'fields': 'nome', 'limit': 2}
+        while True:
+            dati = self.client.get(reverse('takeaway:api_piatti'), parametri).json()
+            nomi += [piatto['nome'] for piatto in dati['risultati']]
+            if not dati['successivo']:
+                break
+            parametri['cursor'] = dati['successivo']
+
+        self.assertEqual(nomi, ["Piatto 2", "Piatto 1", "Piatto 3", "Piatto 4", "Piatto 0"])
+
+    # ETag: 304 senza query finché il menu non cambia
+    def test_etag(self):
+        response = self.client.get(reverse('takeaway:api_piatti'))
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('takeaway:api_piatti'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.piatti[0].prezzo = 6
+        self.piatti[0].save()
+        response = self.client.get(reverse('takeaway:api_piatti'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+
+# Import/export del menu
+class ImportaMenuTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cartella = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=os.path.join(self.cartella, "media"))
+        self.override.enable()
+        Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12.50, portata="primo", ingredienti="carne")
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.cartella)
+
+    def scrivi(self, nome, contenuto):
+        percorso = os.path.join(self.cartella, nome)
+        with open(percorso, "w", encoding="utf-8") as file:
+            file.write(contenuto)
+        return percorso
+
+    # Import CSV con foto
+    def test_importa_csv(self):
+        os.mkdir(os.path.join(self.cartella, "foto"))
+        Image.new('RGB', (50, 50), 'red').save(os.path.join(self.cartella, "foto", "gyoza.jpg"))
+        percorso = self.scrivi("menu.csv",
+            "nome,descrizione,prezzo,portata,ingredienti,foto\n"
+            "Gyoza,Ravioli alla piastra,6.00,antipasto,carne,gyoza.jpg\n"
+            "Mochi,Dolce di riso,4.50,dessert,vegano,\n"
+        )
+
+        call_command('importa_menu', percorso, foto_dir=os.path.join(self.cartella, "foto"), stdout=StringIO())
+
+        gyoza = Piatto.objects.get(nome="Gyoza")
+        self.assertEqual(gyoza.portata_ordine, 1)
+        self.assertTrue(gyoza.rendition_pronte)
+        self.assertRegex(gyoza.foto.name, r"^piatti/[0-9a-f]{64}\.jpg$")
+        self.assertTrue(Piatto.objects.filter(nome="Mochi", foto="").exists())
+
+        # Piatti importati già cercabili
+        response = self.client.get(reverse('takeaway:piatti'), {'q': 'ravioli'})
+        self.assertEqual([piatto.nome for piatto in response.context['object_list']], ["Gyoza"])
+
+    # Import lanciato da un altro processo: il menu servito dal web server si aggiorna al più dopo
+    # VERSIONI_CACHE_SECONDI, senza aspettare MENU_CACHE_TIMEOUT
+    def test_import_da_altro_processo(self):
+        rileggi_versioni()
+        self.assertContains(self.client.get(reverse('takeaway:piatti')), "Ramen")
+        percorso = self.scrivi("menu.csv",
+            "nome,descrizione,prezzo,portata,ingredienti,foto\n"
+            "Mochi,Dolce di riso,4.50,dessert,vegano,\n"
+        )
+        with mock.patch('takeaway.cache._versioni', {}):  # Copie locali del processo del comando
+            call_command('importa_menu', percorso, stdout=StringIO())
+
+        self.assertNotContains(self.client.get(reverse('takeaway:piatti')), "Mochi")
+        with mock.patch('takeaway.cache.time.monotonic', return_value=time.monotonic() + settings.VERSIONI_CACHE_SECONDI):
+            self.assertContains(self.client.get(reverse('takeaway:piatti')), "Mochi")
+
+    # Stessi controlli di PiattoForm: niente viene importato se una riga non è valida
+    def test_importa_righe_non_valide(self):
+        percorso = self.scrivi("menu.json", json.dumps([
+            {"nome": "Mochi", "descrizione": "Dolce", "prezzo": "4.50", "portata": "dessert", "ingredienti": "vegano"},
+            {"nome": "Ramen", "descrizione": "Doppione", "prezzo": "12", "portata": "primo", "ingredienti": "carne"},
+            {"nome": "Udon", "descrizione": "Spaghetti", "prezzo": "-3", "portata": "primo", "ingredienti": "carne"},
+        ]))
+
+        with self.assertRaisesMessage(CommandError, "Piatto già presente nel menu."):
+            call_command('importa_menu', percorso, stdout=StringIO())
+        self.assertFalse(Piatto.objects.filter(nome="Mochi").exists())
+
+    # Export e reimport con aggiornamento
+    def test_esporta_e_aggiorna(self):
+        percorso = os.path.join(self.cartella, "menu.json")
+        call_command('esporta_menu', formato="json", output=percorso)
+
+        with open(percorso, encoding="utf-8") as file:
+            righe = json.load(file)
+        righe[0]["prezzo"] = "13.00"
+        with open(percorso, "w", encoding="utf-8") as file:
+            json.dump(righe, file)
+
+        call_command('importa_menu', percorso, aggiorna=True, stdout=StringIO())
+        self.assertEqual(Piatto.objects.get(nome="Ramen").prezzo, 13)
+        self.assertEqual(Piatto.objects.count(), 1)
+
+
+
+# Numero di query del carrello indipendente dal numero di righe
+class CarrelloQueryTest(TestCase):
+    def setUp(self):
+        gruppo_clienti, created = Group.objects.get_or_create(name='Clienti')
+        self.user = User.objects.create_user(username='cliente', password='prova123')
+        self.user.groups.add(gruppo_clienti)
+        self.client.login(username='cliente', password='prova123')
+
+        SogliaSconto.objects.create(punti_richiesti=100, valore_buono=5)
+        CartaFedelta.objects.create(cliente=self.user, punti=0)
+        self.carrello = Carrello.objects.create(cliente=self.user)
+
+    def aggiungi_piatti(self, numero):
+        for i in range(numero):
+            piatto = Piatto.objects.create(nome=f"Piatto {i}", descrizione="Descrizione", prezzo=2.50,
+                portata="primo", ingredienti="vegano")
+            PiattoCarrello.objects.create(carrello=self.carrello, piatto=piatto, quantita=2)
+
+    def conta_query(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_costanti(self):
+        self.aggiungi_piatti(1)
+        self.client.get(reverse('takeaway:checkout'))  # Premi fedeltà letti e tenuti in memoria
+        query_carrello = self.conta_query(reverse('takeaway:carrello'))
+        query_checkout = self.conta_query(reverse('takeaway:checkout'))
+
+        self.aggiungi_piatti(5)
+        self.assertEqual(self.conta_query(reverse('takeaway:carrello')), query_carrello)
+        self.assertEqual(self.conta_query(reverse('takeaway:checkout')), query_checkout)
+
+    # Totale calcolato dal DB
+    def test_totale(self):
+        self.aggiungi_piatti(3)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.carrello.totale(), 15)
+
+
+# Modifiche atomiche al carrello
+class CarrelloBatchTest(TestCase):
+    def setUp(self):
+        gruppo_clienti, created = Group.objects.get_or_create(name='Clienti')
+        self.user = User.objects.create_user(username='cliente', password='prova123')
+        self.user.groups.add(gruppo_clienti)
+        self.client.login(username='cliente', password='prova123')
+
+        self.ramen = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12.50, portata="primo", ingredienti="carne")
+        self.sushi = Piatto.objects.create(nome="Sushi", descrizione="Pesce fresco", prezzo=4.00, portata="secondo", ingredienti="pesce")
+
+    # Aggiunte ripetute incrementano la stessa riga
+    def test_aggiunte_ripetute(self):
+        for _ in range(3):
+            self.client.get(reverse('takeaway:carrello_add', args=[self.ramen.pk]))
+
+        riga = PiattoCarrello.objects.get(carrello__cliente=self.user)
+        self.assertEqual(riga.quantita, 3)
+
+    # Più modifiche in una richiesta, risposta con lo stato del carrello
+    def test_batch(self):
+        self.client.get(reverse('takeaway:carrello_add', args=[self.ramen.pk]))
+
+        response = self.client.post(reverse('takeaway:carrello_batch'),
+            data=json.dumps({self.ramen.pk: 0, self.sushi.pk: 3}), content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        dati = response.json()
+        self.assertEqual([(riga['nome'], riga['quantita']) for riga in dati['righe']], [("Sushi", 3)])
+        self.assertEqual(dati['totale'], "12.00")
+
+    # Piatto inesistente -> nessuna modifica
+    def test_batch_piatto_inesistente(self):
+        response = self.client.post(reverse('takeaway:carrello_batch'),
+            data=json.dumps({self.sushi.pk: 2, 9999: 1}), content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PiattoCarrello.objects.exists())
+
+
+# Backend alternativi del carrello
+class CarrelloBackendTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        gruppo_clienti, created = Group.objects.get_or_create(name='Clienti')
+        self.user = User.objects.create_user(username='cliente', password='prova123')
+        self.user.groups.add(gruppo_clienti)
+        self.client.login(username='cliente', password='prova123')
+
+        SogliaSconto.objects.create(punti_richiesti=100, valore_buono=5)
+        self.ramen = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12.50, portata="primo", ingredienti="carne")
+        self.sushi = Piatto.objects.create(nome="Sushi", descrizione="Pesce fresco", prezzo=4.00, portata="secondo", ingredienti="pesce")
+
+    # Il salvataggio in differita programmato dai test non deve partire dopo la fine dei test
+    def tearDown(self):
+        with carrelli._lock:
+            if carrelli._timer is not None:
+                carrelli._timer.cancel()
+                carrelli._timer = None
+
+    def ordina(self):
+        self.client.get(reverse('takeaway:carrello_add', args=[self.ramen.pk]))
+        self.client.get(reverse('takeaway:carrello_add', args=[self.sushi.pk]))
+        self.client.post(reverse('takeaway:carrello_update', args=[self.sushi.pk]), {'quantita': 3})
+
+        response = self.client.get(reverse('takeaway:carrello'))
+        self.assertEqual(response.context['totale'], 24.50)
+
+        fascia = FasciaRitiro.objects.create(inizio=timezone.now() + timedelta(days=1), capienza=10)
+        response = self.client.post(reverse('takeaway:checkout'), {'fascia_ritiro': fascia.pk})
+        self.assertRedirects(response, reverse('takeaway:checkout_success'))
+
+        ordine = Ordine.objects.get(cliente=self.user)
+        self.assertEqual(ordine.totale, 24.50)
+        self.assertFalse(self.client.get(reverse('takeaway:carrello')).context['righe'])  # Carrello svuotato
+
+    @override_settings(CARRELLO_BACKEND='takeaway.carrelli.SessionCarrelloStore')
+    def test_sessione(self):
+        self.ordina()
+        self.assertFalse(PiattoCarrello.objects.exists())  # Nessuna scrittura sulle righe del carrello
+
+    @override_settings(CARRELLO_BACKEND='takeaway.carrelli.CacheCarrelloStore')
+    def test_cache(self):
+        self.ordina()
+        self.assertFalse(PiattoCarrello.objects.exists())
+
+    # Le modifiche in cache vengono salvate nel DB in differita
+    @override_settings(CARRELLO_BACKEND='takeaway.carrelli.CacheCarrelloStore')
+    def test_cache_write_behind(self):
+        self.client.get(reverse('takeaway:carrello_add', args=[self.ramen.pk]))
+        self.client.get(reverse('takeaway:carrello_add', args=[self.ramen.pk]))
+        self.assertFalse(PiattoCarrello.objects.exists())
+
+        salva_carrelli()
+        self.assertEqual(PiattoCarrello.objects.get(carrello__cliente=self.user).quantita, 2)
+
+        # Se la cache si perde il carrello viene riletto dal DB
+        cache_carrelli().clear()
+        response = self.client.get(reverse('takeaway:carrello'))
+        self.assertEqual(response.context['totale'], 25)
+
+    # Un salvataggio fallito lascia il carrello da salvare fino al tentativo successivo
+    @override_settings(CARRELLO_BACKEND='takeaway.carrelli.CacheCarrelloStore')
+    def test_cache_salvataggio_fallito(self):
+        self.client.get(reverse('takeaway:carrello_add', args=[self.ramen.pk]))
+        with mock.patch.object(Carrello, 'sostituisci', side_effect=DatabaseError), self.assertLogs('takeaway.carrelli'):
+            self.assertFalse(salva_carrelli())
+        self.assertEqual(Carrello.objects.get(cliente=self.user).modifiche_in_sospeso, 1)
+
+        self.client.get(reverse('takeaway:carrello_add', args=[self.ramen.pk]))
+        self.assertTrue(salva_carrelli())
+        self.assertEqual(PiattoCarrello.objects.get(carrello__cliente=self.user).quantita, 2)
+        self.assertEqual(Carrello.objects.get(cliente=self.user).modifiche_in_sospeso, 0)
+
+    # I carrelli da salvare sono segnati nel DB: li salva anche un processo che non li ha modificati
+    @override_settings(CARRELLO_BACKEND='takeaway.carrelli.CacheCarrelloStore')
+    def test_cache_altro_processo(self):
+        Carrello.objects.create(cliente=self.user, modifiche_in_sospeso=1)
+        cache_carrelli().set(chiave_carrello(self.user.pk), {str(self.sushi.pk): 3}, None)
+        self.assertTrue(salva_carrelli())
+        self.assertEqual(PiattoCarrello.objects.get(carrello__cliente=self.user).quantita, 3)
+
+    # Una modifica arrivata durante il salvataggio lascia il carrello da salvare
+    @override_settings(CARRELLO_BACKEND='takeaway.carrelli.CacheCarrelloStore')
+    def test_cache_modifica_durante_salvataggio(self):
+        self.client.get(reverse('takeaway:carrello_add', args=[self.ramen.pk]))
+        sostituisci = Carrello.sostituisci
+
+        def sostituisci_e_modifica(carrello, quantita):
+            sostituisci(carrello, quantita)
+            self.client.get(reverse('takeaway:carrello_add', args=[self.sushi.pk]))
+
+        with mock.patch.object(Carrello, 'sostituisci', sostituisci_e_modifica):
+            self.assertFalse(salva_carrelli())
+        self.assertTrue(salva_carrelli())
+        self.assertEqual(dict(PiattoCarrello.objects.filter(carrello__cliente=self.user).values_list('piatto_id', 'quantita')),
+                         {self.ramen.pk: 1, self.sushi.pk: 1})
+
+    # Il carrello in cache non può stare in una cache locale al processo
+    def test_cache_locale_rifiutata(self):
+        with self.settings(CARRELLO_BACKEND='takeaway.carrelli.CacheCarrelloStore'):
+            self.assertEqual(controlla_cache_carrelli(None), [])
+            with self.settings(CARRELLO_CACHE='default'):
+                self.assertEqual([errore.id for errore in controlla_cache_carrelli(None)], ['takeaway.E002'])
+
+    # Un backend senza tutti i metodi non si può creare (errore subito, non alla prima chiamata)
+    def test_backend_incompleto(self):
+        class CarrelloSoloLettura(carrelli.MemoriaCarrelloStore):
+            def leggi(self):
+                return {}
+
+        with self.assertRaises(TypeError):
+            CarrelloSoloLettura(self.user)
+        with self.assertRaises(TypeError):
+            carrelli.CarrelloStore(self.user)
+
+
+
+# Checkout transazionale
+class CheckoutConcorrenteTest(TransactionTestCase):
+    def setUp(self):
+        gruppo_clienti, created = Group.objects.get_or_create(name='Clienti')
+        self.user = User.objects.create_user(username='cliente', password='prova123')
+        self.user.groups.add(gruppo_clienti)
+
+        SogliaSconto.objects.create(punti_richiesti=100, valore_buono=5)
+        CartaFedelta.objects.create(cliente=self.user, punti=150)
+        self.carrello = Carrello.objects.create(cliente=self.user)
+        self.fascia = FasciaRitiro.objects.create(inizio=timezone.now() + timedelta(days=1), capienza=10)
+
+    def aggiungi_piatti(self, numero):
+        for i in range(numero):
+            piatto = Piatto.objects.create(nome=f"Piatto {i}", descrizione="Descrizione", prezzo=10,
+                portata="primo", ingredienti="vegano")
+            PiattoCarrello.objects.create(carrello=self.carrello, piatto=piatto, quantita=1)
+
+    def checkout(self):
+        client = Client()
+        client.force_login(self.user)
+        try:
+            return client.post(reverse('takeaway:checkout'), {'fascia_ritiro': self.fascia.pk})
+        finally:
+            connection.close()
+
+    # Checkout paralleli dello stesso cliente: un solo ordine e punti scalati una volta
+    def test_checkout_paralleli(self):
+        self.aggiungi_piatti(2)
+
+        risposte = []
+        threads = [threading.Thread(target=lambda: risposte.append(self.checkout())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(risposte), 5)
+        self.assertTrue(all(risposta.status_code == 302 for risposta in risposte))
+        self.assertEqual(Ordine.objects.count(), 1)
+        self.assertEqual(PiattoOrdine.objects.count(), 2)
+        self.assertEqual(CartaFedelta.objects.get(cliente=self.user).punti, 50)
+
+    # Carrello nella sessione: ogni richiesta ha la sua copia del carrello, ma lo stesso contenuto
+    # crea un solo ordine, anche con chiavi del form diverse (es. due schede)
+    @override_settings(CARRELLO_BACKEND='takeaway.carrelli.SessionCarrelloStore')
+    def test_checkout_paralleli_sessione(self):
+        self.aggiungi_piatti(2)
+        PiattoCarrello.objects.all().delete()
+        sessione = Client()
+        sessione.force_login(self.user)
+        for piatto in Piatto.objects.all():
+            sessione.get(reverse('takeaway:carrello_add', args=[piatto.pk]))
+
+        def checkout():
+            client = Client()
+            client.cookies = sessione.cookies
+            try:
+                return client.post(reverse('takeaway:checkout'), {'fascia_ritiro': self.fascia.pk, 'chiave': uuid.uuid4()})
+            finally:
+                connection.close()
+
+        risposte = []
+        threads = [threading.Thread(target=lambda: risposte.append(checkout())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(risposta.status_code == 302 for risposta in risposte))
+        self.assertEqual(Ordine.objects.count(), 1)
+        self.assertEqual(PiattoOrdine.objects.count(), 2)
+        self.assertEqual(CartaFedelta.objects.get(cliente=self.user).punti, 50)
+        self.assertFalse(sessione.get(reverse('takeaway:carrello')).context['righe'])
+
+    # Numero di query del checkout indipendente dal numero di righe
+    def test_query_costanti(self):
+        client = Client()
+        client.force_login(self.user)
+
+        def conta_query():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post(reverse('takeaway:checkout'), {'fascia_ritiro': self.fascia.pk})
+            self.assertRedirects(response, reverse('takeaway:checkout_success'))
+            return len(queries)
+
+        self.aggiungi_piatti(1)
+        query = conta_query()
+
+        Piatto.objects.all().delete()
+        self.aggiungi_piatti(6)
+        self.assertEqual(conta_query(), query)
+
+
+
+# Fasce di ritiro (solo quelle create dai test)
+@override_settings(FASCE_RITIRO_GIORNI=0)
+class FasciaRitiroTest(TestCase):
+    def setUp(self):
+        gruppo_clienti, created = Group.objects.get_or_create(name='Clienti')
+        self.user = User.objects.create_user(username='cliente', password='prova123')
+        self.user.groups.add(gruppo_clienti)
+        self.client.login(username='cliente', password='prova123')
+
+        piatto = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12.50,
+            portata="primo", ingredienti="carne")
+        carrello = Carrello.objects.create(cliente=self.user)
+        PiattoCarrello.objects.create(carrello=carrello, piatto=piatto, quantita=1)
+
+        domani = timezone.now() + timedelta(days=1)
+        self.piena = FasciaRitiro.objects.create(inizio=domani, capienza=2, prenotati=2)
+        self.libera = FasciaRitiro.objects.create(inizio=domani + timedelta(minutes=15), capienza=2, prenotati=1)
+        self.passata = FasciaRitiro.objects.create(inizio=timezone.now() - timedelta(hours=1), capienza=2)
+
+    # Nel checkout solo fasce future con posti liberi
+    def test_fasce_proposte(self):
+        response = self.client.get(reverse('takeaway:checkout'))
+        proposte = [valore for valore, etichetta in response.context['form'].fields['fascia_ritiro'].choices if valore]
+        self.assertEqual(proposte, [self.libera.pk])
+
+    # L'ultimo posto va al primo checkout, la fascia piena viene rifiutata
+    def test_capienza(self):
+        response = self.client.post(reverse('takeaway:checkout'), {'fascia_ritiro': self.piena.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Ordine.objects.exists())
+
+        response = self.client.post(reverse('takeaway:checkout'), {'fascia_ritiro': self.libera.pk})
+        self.assertRedirects(response, reverse('takeaway:checkout_success'))
+
+        self.libera.refresh_from_db()
+        self.assertEqual(self.libera.prenotati, 2)
+        ordine = Ordine.objects.get()
+        self.assertEqual(ordine.orario_ritiro, self.libera.inizio)
+        self.assertFalse(FasciaRitiro.objects.prenota(self.libera.pk))
+
+    def test_genera_fasce(self):
+        with self.settings(FASCE_RITIRO=[("12:00", "13:00", 3)], FASCIA_RITIRO_MINUTI=15):
+            call_command('genera_fasce_ritiro', '--giorni', '2', stdout=StringIO())
+            call_command('genera_fasce_ritiro', '--giorni', '2', stdout=StringIO())  # Nessun duplicato
+
+        self.assertEqual(FasciaRitiro.objects.filter(capienza=3).count(), 8)
+
+    # Senza genera_fasce_ritiro il checkout crea da solo le fasce dei prossimi giorni, una volta al giorno
+    def test_fasce_al_bisogno(self):
+        cache.clear()
+        FasciaRitiro.objects.all().delete()
+        with self.settings(FASCE_RITIRO=[("12:00", "13:00", 3)], FASCE_RITIRO_GIORNI=2):
+            response = self.client.get(reverse('takeaway:checkout'))
+            self.assertEqual(FasciaRitiro.objects.count(), 8)
+            self.assertTrue([valore for valore, etichetta in response.context['form'].fields['fascia_ritiro'].choices if valore])
+
+            FasciaRitiro.objects.all().delete()
+            self.client.get(reverse('takeaway:checkout'))
+            self.assertFalse(FasciaRitiro.objects.exists())
+
+
+
+@job
+def job_che_fallisce():
+    raise RuntimeError("Errore")
+
+
+# Coda dei job (TransactionTestCase: il worker usa connessioni separate nei suoi thread)
+class CodaJobTest(TransactionTestCase):
+    def setUp(self):
+        gruppo_dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        dipendente = User.objects.create_user(username='dipendente', password='prova123')
+        dipendente.groups.add(gruppo_dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+        self.cliente = User.objects.create_user(username='cliente', password='prova123')
+        CartaFedelta.objects.create(cliente=self.cliente, punti=10)
+        piatto = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12.50,
+            portata="primo", ingredienti="carne")
+        self.ordine = Ordine.objects.create(cliente=self.cliente, orario_ritiro=timezone.now() + timedelta(hours=1),
+            totale=25)
+        PiattoOrdine.objects.create(ordine=self.ordine, piatto=piatto, quantita=2, prezzo_unitario=12.50)
+
+    # Completare l'ordine mette in coda l'assegnazione dei punti, eseguita dal worker
+    def test_punti_assegnati_dal_worker(self):
+        response = self.client.post(reverse('takeaway:ordine_update', args=[self.ordine.pk]), {'stato': 'completed'})
+        self.assertRedirects(response, reverse('takeaway:ordini'))
+        self.assertEqual(CartaFedelta.objects.get(cliente=self.cliente).punti, 10)  # Non ancora assegnati
+        self.assertEqual(Job.objects.count(), 1)
+
+        call_command('esegui_job', '--una-volta', stdout=StringIO())
+
+        self.assertEqual(CartaFedelta.objects.get(cliente=self.cliente).punti, 35)
+        self.assertFalse(Job.objects.exists())
+
+        assegna_punti_ordine(self.ordine.pk)  # Eseguito di nuovo: nessun effetto
+        self.assertEqual(CartaFedelta.objects.get(cliente=self.cliente).punti, 35)
+
+    # Un job preso da un worker non viene preso da altri
+    def test_job_preso_una_volta(self):
+        accoda(assegna_punti_ordine, id_ordine=self.ordine.pk)
+        self.assertEqual(len(prendi_job(10)), 1)
+        self.assertEqual(prendi_job(10), [])
+
+    # Job in errore: nuovi tentativi con attesa crescente, poi fallito
+    @override_settings(JOB_TENTATIVI=2, JOB_RITARDO_BASE_SECONDI=60)
+    def test_tentativi(self):
+        accoda(job_che_fallisce)
+
+        with self.assertLogs('takeaway.coda', 'ERROR'):
+            esegui_job(prendi_job(1)[0])
+        job_fallito = Job.objects.get()
+        self.assertEqual(job_fallito.stato, Job.IN_ATTESA)
+        self.assertEqual(job_fallito.tentativi, 1)
+        self.assertGreater(job_fallito.eseguire_dopo, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(prendi_job(1), [])  # Da riprovare più tardi
+
+        Job.objects.update(eseguire_dopo=timezone.now())
+        with self.assertLogs('takeaway.coda', 'ERROR'):
+            esegui_job(prendi_job(1)[0])
+        job_fallito.refresh_from_db()
+        self.assertEqual(job_fallito.stato, Job.FALLITO)
+        self.assertIn("RuntimeError", job_fallito.errore)
+
+    # Job fermi in coda (worker non avviato): avviso nel log e nella lista ordini dei dipendenti
+    @override_settings(JOB_ATTESA_MASSIMA_SECONDI=60)
+    def test_job_in_ritardo(self):
+        accoda(assegna_punti_ordine, id_ordine=self.ordine.pk)
+        self.assertEqual(job_in_ritardo(), 0)
+        response = self.client.get(reverse('takeaway:ordini'))
+        self.assertNotContains(response, "esegui_job")
+
+        Job.objects.update(eseguire_dopo=timezone.now() - timedelta(minutes=5))
+        with self.assertLogs('takeaway.coda', 'WARNING'):
+            self.assertEqual(job_in_ritardo(), 1)
+        with self.assertLogs('takeaway.coda', 'WARNING'):
+            response = self.client.get(reverse('takeaway:ordini'))
+        self.assertContains(response, "esegui_job")
+
+
+# Totali degli ordini salvati nella tabella
+class TotaliOrdineTest(TestCase):
+    def setUp(self):
+        gruppo_dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        dipendente = User.objects.create_user(username='dipendente', password='prova123')
+        dipendente.groups.add(gruppo_dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+        self.cliente = User.objects.create_user(username='cliente', password='prova123')
+        self.piatto = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12.50,
+            portata="primo", ingredienti="carne")
+
+    def crea_ordini(self, numero):
+        for _ in range(numero):
+            ordine = Ordine.objects.create(cliente=self.cliente, orario_ritiro=timezone.now() + timedelta(hours=1),
+                totale=25, sconto=5)
+            PiattoOrdine.objects.create(ordine=ordine, piatto=self.piatto, quantita=2, prezzo_unitario=12.50)
+
+    # Numero di query della lista ordini indipendente dal numero di ordini
+    def test_lista_query_costanti(self):
+        self.crea_ordini(1)
+        self.client.get(reverse('takeaway:ordini'))  # Gruppi dell'utente letti e messi in cache
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('takeaway:ordini'))
+        self.assertContains(response, "Totale scontato: 20.00")
+
+        self.crea_ordini(10)
+        with self.assertNumQueries(len(queries)):
+            self.client.get(reverse('takeaway:ordini'))
+
+    def test_verifica_totali(self):
+        self.crea_ordini(2)
+        call_command('verifica_totali_ordini', stdout=StringIO())
+
+        Ordine.objects.filter(pk=Ordine.objects.first().pk).update(totale=99)
+        with self.assertRaises(CommandError):
+            call_command('verifica_totali_ordini', stdout=StringIO())
+
+        call_command('verifica_totali_ordini', '--correggi', stdout=StringIO())
+        self.assertEqual(set(Ordine.objects.values_list('totale', flat=True)), {25})
+
+
+
+# Lista ordini paginata a chiave
+class OrdiniPaginazioneTest(TestCase):
+    def setUp(self):
+        gruppo_dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        dipendente = User.objects.create_user(username='dipendente', password='prova123')
+        dipendente.groups.add(gruppo_dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+        cliente = User.objects.create_user(username='cliente', password='prova123')
+        domani = timezone.now() + timedelta(days=1)
+        # Più ordini con lo stesso orario: l'id separa le pagine
+        Ordine.objects.bulk_create([
+            Ordine(cliente=cliente, orario_ritiro=domani + timedelta(minutes=15 * (i // 3))) for i in range(45)
+        ])
+
+    def test_pagine(self):
+        visti = []
+        url = reverse('takeaway:ordini')
+        cursori = []
+        while url:
+            response = self.client.get(url)
+            visti += [ordine.pk for ordine in response.context['ordini']]
+            successivo = response.context['pagina'].successivo
+            cursori.append(successivo)
+            url = f"{reverse('takeaway:ordini')}?dopo={successivo}" if successivo else None
+
+        attesi = list(Ordine.objects.order_by('orario_ritiro', 'id').values_list('pk', flat=True))
+        self.assertEqual(visti, attesi)  # Tutti, in ordine e senza ripetizioni
+        self.assertEqual(len(cursori), 3)
+
+        # Indietro dalla terza pagina alla seconda
+        response = self.client.get(f"{reverse('takeaway:ordini')}?dopo={cursori[1]}")
+        precedente = response.context['pagina'].precedente
+        response = self.client.get(f"{reverse('takeaway:ordini')}?prima={precedente}")
+        self.assertEqual([ordine.pk for ordine in response.context['ordini']], attesi[20:40])
+
+    # L'ultima pagina costa come la prima
+    def test_query_costanti(self):
+        response = self.client.get(reverse('takeaway:ordini'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('takeaway:ordini'))
+        with self.assertNumQueries(len(queries)):
+            self.client.get(f"{reverse('takeaway:ordini')}?dopo={response.context['pagina'].successivo}")
+
+    def test_cursore_non_valido(self):
+        response = self.client.get(f"{reverse('takeaway:ordini')}?dopo=xyz")
+        self.assertEqual(response.status_code, 404)
+
+    def test_indice(self):
+        piano = Ordine.objects.filter(stato='pending', orario_ritiro__gt=timezone.now()).order_by('orario_ritiro', 'id').explain()
+        self.assertIn('ordine_stato_ritiro_idx', piano)
+
+
+
+# Bacheca ordini in tempo reale
+class BachecaTest(TransactionTestCase):
+    def setUp(self):
+        gruppo_dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        dipendente = User.objects.create_user(username='dipendente', password='prova123')
+        dipendente.groups.add(gruppo_dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+        self.cliente = User.objects.create_user(username='cliente', password='prova123')
+
+    def crea_ordine(self):
+        return Ordine.objects.create(cliente=self.cliente, orario_ritiro=timezone.now() + timedelta(hours=1), totale=20)
+
+    def test_eventi_registrati(self):
+        ordine = self.crea_ordine()
+        ordine.stato = 'cancelled'
+        ordine.save()
+        pk = ordine.pk
+        ordine.delete()
+
+        eventi = list(EventoOrdine.objects.order_by('id').values_list('ordine_id', 'tipo'))
+        self.assertEqual(eventi, [(pk, 'creato'), (pk, 'aggiornato'), (pk, 'eliminato')])
+
+    # Eventi persi alla riconnessione, poi quelli nuovi appena salvati
+    async def test_flusso(self):
+        ordine = await sync_to_async(self.crea_ordine)()
+
+        flusso = flusso_eventi(0)
+        try:
+            primo = await anext(flusso)
+            self.assertIn('"tipo": "creato"', primo)
+
+            ordine.stato = 'completed'
+            await sync_to_async(ordine.save)()
+            secondo = await asyncio.wait_for(anext(flusso), 5)
+            self.assertIn('"stato": "completed"', secondo)
+            self.assertTrue(secondo.startswith("id: "))
+        finally:
+            await flusso.aclose()
+
+    # Il thread che legge gli eventi parte dal client più indietro, non dall'ultimo evento salvato
+    async def test_thread_dal_cursore(self):
+        ordine = await sync_to_async(self.crea_ordine)()
+        bacheca = Bacheca()
+        coda = bacheca.iscrivi(0)
+        thread = bacheca._thread
+        try:
+            bacheca.notifica()
+            evento = await asyncio.wait_for(coda.get(), 5)
+            self.assertEqual(evento.ordine_id, ordine.pk)
+        finally:
+            bacheca.disiscrivi(coda)
+
+        # Senza iscritti il thread si ferma, e il prossimo client ne avvia uno nuovo
+        bacheca.notifica()
+        await sync_to_async(thread.join)(5)
+        self.assertIsNone(bacheca._thread)
+        coda = bacheca.iscrivi(ordine.pk)
+        self.assertIsNot(bacheca._thread, thread)
+        bacheca.disiscrivi(coda)
+        bacheca.notifica()
+
+    def test_pagina(self):
+        ordine = self.crea_ordine()
+        response = self.client.get(reverse('takeaway:bacheca'))
+        self.assertContains(response, f'id="ordine-{ordine.pk}"')
+        self.assertEqual(response.context['ultimo_id'], EventoOrdine.objects.get().pk)
+
+    def test_solo_dipendenti(self):
+        self.client.login(username='cliente', password='prova123')
+        response = self.client.get(reverse('takeaway:bacheca_eventi'))
+        self.assertEqual(response.status_code, 403)
+
+    # Con WSGI la risposta finisce: prima gli eventi dopo `dopo`, altrimenti dopo l'attesa massima
+    @override_settings(BACHECA_ATTESA_WSGI_SECONDI=0)
+    def test_long_polling_wsgi(self):
+        ordine = self.crea_ordine()
+        response = self.client.get(reverse('takeaway:bacheca_eventi'))
+        self.assertFalse(response.is_async)
+        testo = b"".join(response.streaming_content).decode()
+        self.assertTrue(testo.startswith("retry: "))
+        self.assertIn(f'"id": {ordine.pk}', testo)
+
+        ultimo = EventoOrdine.objects.get().pk
+        response = self.client.get(reverse('takeaway:bacheca_eventi'), headers={'last-event-id': str(ultimo)})
+        self.assertEqual(b"".join(response.streaming_content).decode(), "retry: 1000\n\n")
+
+
+
+# Cambio di stato di più ordini insieme
+class AzioneOrdiniTest(TestCase):
+    def setUp(self):
+        gruppo_dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        dipendente = User.objects.create_user(username='dipendente', password='prova123')
+        dipendente.groups.add(gruppo_dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+        self.mario = User.objects.create_user(username='mario', password='prova123')
+        self.luigi = User.objects.create_user(username='luigi', password='prova123')
+        CartaFedelta.objects.create(cliente=self.mario, punti=10)
+        self.fascia = FasciaRitiro.objects.create(inizio=timezone.now() + timedelta(hours=1), capienza=5, prenotati=3)
+
+        orario = timezone.now() + timedelta(hours=1)
+        self.ordini = [
+            Ordine.objects.create(cliente=self.mario, orario_ritiro=orario, totale=20.50, fascia_ritiro=self.fascia),
+            Ordine.objects.create(cliente=self.mario, orario_ritiro=orario, totale=10, sconto=5, fascia_ritiro=self.fascia),
+            Ordine.objects.create(cliente=self.luigi, orario_ritiro=orario, totale=8, fascia_ritiro=self.fascia),
+        ]
+        self.completato = Ordine.objects.create(cliente=self.luigi, orario_ritiro=orario, totale=50, stato='completed')
+
+    def azione(self, stato, ordini):
+        return self.client.post(reverse('takeaway:ordini_azione'), {
+            'stato': stato, 'ordini': [ordine.pk for ordine in ordini], 'next': reverse('takeaway:ordini') + '?stato=tutti'
+        })
+
+    # Punti sommati per cliente, un UPDATE per carta; gli ordini già chiusi non cambiano
+    def test_completa(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.azione('completed', self.ordini + [self.completato])
+        aggiornamenti = [query for query in queries if query['sql'].startswith('UPDATE "takeaway_ordine"')]
+        self.assertEqual(len(aggiornamenti), 1)
+        self.assertRedirects(response, reverse('takeaway:ordini') + '?stato=tutti')
+
+        self.assertEqual(Ordine.objects.filter(stato='completed').count(), 4)
+        self.assertFalse(Ordine.objects.filter(stato='completed', punti_assegnati=False).exclude(pk=self.completato.pk).exists())
+        self.assertEqual(CartaFedelta.objects.get(cliente=self.mario).punti, 10 + 20 + 5)
+        self.assertEqual(CartaFedelta.objects.get(cliente=self.luigi).punti, 8)  # Carta creata
+        self.assertEqual(EventoOrdine.objects.filter(tipo='aggiornato').count(), 3)
+
+    # Cancellando gli ordini si liberano i posti nella fascia di ritiro
+    def test_cancella(self):
+        self.azione('cancelled', self.ordini[:2])
+
+        self.assertEqual(Ordine.objects.filter(stato='cancelled').count(), 2)
+        self.fascia.refresh_from_db()
+        self.assertEqual(self.fascia.prenotati, 1)
+        self.assertEqual(CartaFedelta.objects.get(cliente=self.mario).punti, 10)
+
+    def test_stato_non_valido(self):
+        response = self.azione('pending', self.ordini)
+        self.assertEqual(response.status_code, 400)
+
+
+
+# Cambio di stato di un ordine
+class StatoOrdineTest(TestCase):
+    def setUp(self):
+        gruppo_dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        dipendente = User.objects.create_user(username='dipendente', password='prova123')
+        dipendente.groups.add(gruppo_dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+        cliente = User.objects.create_user(username='cliente', password='prova123')
+        self.fascia = FasciaRitiro.objects.create(inizio=timezone.now() + timedelta(hours=1), capienza=5, prenotati=1)
+        self.ordine = Ordine.objects.create(cliente=cliente, orario_ritiro=self.fascia.inizio, totale=20,
+            fascia_ritiro=self.fascia)
+
+    def modifica(self, stato):
+        return self.client.post(reverse('takeaway:ordine_update', args=[self.ordine.pk]), {'stato': stato})
+
+    # Due richieste "completed": solo la prima cambia lo stato e mette in coda i punti
+    def test_completato_una_volta(self):
+        copia = Ordine.objects.get(pk=self.ordine.pk)  # Letto prima della prima richiesta
+
+        self.assertTrue(cambia_stato_ordine(self.ordine, 'completed'))
+        self.assertFalse(cambia_stato_ordine(copia, 'completed'))
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_cancellato_libera_fascia(self):
+        response = self.modifica('cancelled')
+        self.assertRedirects(response, reverse('takeaway:ordini'), fetch_redirect_response=False)
+
+        self.fascia.refresh_from_db()
+        self.assertEqual(self.fascia.prenotati, 0)
+
+        # Uno stato finale non cambia più
+        response = self.modifica('completed')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Ordine.objects.get(pk=self.ordine.pk).stato, 'cancelled')
+        self.assertFalse(Job.objects.exists())
+
+    # Eliminando un ordine in attesa si libera il posto nella fascia di ritiro (una volta sola)
+    def test_eliminato_libera_fascia(self):
+        response = self.client.post(reverse('takeaway:ordine_delete', args=[self.ordine.pk]))
+        self.assertRedirects(response, reverse('takeaway:ordini'), fetch_redirect_response=False)
+        self.assertFalse(Ordine.objects.filter(pk=self.ordine.pk).exists())
+
+        self.fascia.refresh_from_db()
+        self.assertEqual(self.fascia.prenotati, 0)
+        self.assertFalse(elimina_ordine(self.ordine))
+
+    # Un ordine già cancellato ha già liberato il suo posto
+    def test_eliminato_dopo_cancellazione(self):
+        self.modifica('cancelled')
+        self.fascia.prenotati = 1  # Posto preso da un altro ordine
+        self.fascia.save()
+        self.assertTrue(elimina_ordine(self.ordine))
+
+        self.fascia.refresh_from_db()
+        self.assertEqual(self.fascia.prenotati, 1)
+
+    # Il controllo dello stato non rilegge l'ordine
+    def test_clean_senza_query(self):
+        ordine = Ordine.objects.get(pk=self.ordine.pk)
+        ordine.stato = 'completed'
+        with self.assertNumQueries(0):
+            ordine.clean()
+
+
+
+# Archivio degli ordini chiusi
+@override_settings(STATISTICHE_MARGINE_SECONDI=0)
+class ArchivioOrdiniTest(TestCase):
+    def setUp(self):
+        gruppo_clienti, created = Group.objects.get_or_create(name='Clienti')
+        self.user = User.objects.create_user(username='cliente', password='prova123')
+        self.user.groups.add(gruppo_clienti)
+        self.client.login(username='cliente', password='prova123')
+
+        piatto = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12.50,
+            portata="primo", ingredienti="carne")
+        vecchio = timezone.now() - timedelta(days=60)
+        self.vecchi = []
+        for stato in ['completed', 'cancelled', 'pending']:
+            ordine = Ordine.objects.create(cliente=self.user, orario_ritiro=vecchio, stato=stato, totale=25)
+            PiattoOrdine.objects.create(ordine=ordine, piatto=piatto, quantita=2, prezzo_unitario=12.50)
+            self.vecchi.append(ordine)
+        self.recente = Ordine.objects.create(cliente=self.user, orario_ritiro=timezone.now() - timedelta(days=1),
+            stato='completed', totale=10)
+
+    # Solo gli ordini chiusi e vecchi lasciano le tabelle attive
+    def test_archivia(self):
+        call_command('archivia_ordini', '--giorni', '30', '--lotto', '1', stdout=StringIO())
+
+        archiviati = {self.vecchi[0].pk, self.vecchi[1].pk}
+        self.assertEqual(set(OrdineArchiviato.objects.values_list('pk', flat=True)), archiviati)
+        self.assertEqual(set(Ordine.objects.values_list('pk', flat=True)), {self.vecchi[2].pk, self.recente.pk})
+        self.assertEqual(PiattoOrdine.objects.count(), 1)
+        self.assertFalse(EventoOrdine.objects.filter(tipo='eliminato').exists())  # Niente sulla bacheca
+
+    # Dettaglio e storico leggono anche dall'archivio
+    def test_lettura_archivio(self):
+        call_command('archivia_ordini', stdout=StringIO())
+        archiviato = self.vecchi[0]
+
+        response = self.client.get(reverse('takeaway:ordine', args=[archiviato.pk]))
+        self.assertContains(response, "Ordine archiviato")
+        self.assertEqual(response.context['ordine'].totale_scontato, 25)
+        self.assertEqual(len(response.context['ordine'].piatti.all()), 1)
+
+        response = self.client.get(reverse('takeaway:ordini') + '?data=archiviati&stato=pending')
+        self.assertEqual({ordine.pk for ordine in response.context['ordini']}, {self.vecchi[0].pk, self.vecchi[1].pk})
+
+    def test_ripristina(self):
+        call_command('archivia_ordini', stdout=StringIO())
+        ordine = self.vecchi[0]
+
+        call_command('ripristina_ordini', str(ordine.pk), stdout=StringIO())
+
+        ripristinato = Ordine.objects.get(pk=ordine.pk)
+        self.assertEqual(ripristinato.creato_il, ordine.creato_il)
+        self.assertEqual(ripristinato.stato, 'completed')
+        self.assertEqual(ripristinato.piatti.count(), 1)
+        self.assertFalse(OrdineArchiviato.objects.filter(pk=ordine.pk).exists())
+
+        with self.assertRaises(CommandError):
+            call_command('ripristina_ordini', str(ordine.pk), stdout=StringIO())
+
+
+@override_settings(STATISTICHE_MARGINE_SECONDI=0)
+class StatisticheTest(TestCase):
+    def setUp(self):
+        gruppo_dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        dipendente = User.objects.create_user(username='dipendente', password='prova123')
+        dipendente.groups.add(gruppo_dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+        cliente = User.objects.create_user(username='cliente', password='prova123')
+        self.ramen = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12,
+            portata="primo", ingredienti="carne")
+        self.mochi = Piatto.objects.create(nome="Mochi", descrizione="Dolce di riso", prezzo=4,
+            portata="dolce", ingredienti="riso")
+
+        self.ritiro = timezone.localtime().replace(hour=13, minute=15, second=0, microsecond=0)
+        self.ordini = []
+        for stato in ['completed', 'cancelled', 'pending']:
+            ordine = Ordine.objects.create(cliente=cliente, orario_ritiro=self.ritiro, stato=stato, totale=28, sconto=3)
+            PiattoOrdine.objects.create(ordine=ordine, piatto=self.ramen, quantita=2, prezzo_unitario=12)
+            PiattoOrdine.objects.create(ordine=ordine, piatto=self.mochi, quantita=1, prezzo_unitario=4)
+            self.ordini.append(ordine)
+
+    # Ogni ordine chiuso viene contato una sola volta; i cancellati chiudono ma non vendono
+    def test_aggiornamento_incrementale(self):
+        self.assertEqual(aggiorna_statistiche(), 2)
+        self.assertEqual(aggiorna_statistiche(), 0)
+
+        giorno = self.ritiro.date()
+        self.assertEqual(VenditaPiatto.objects.get(giorno=giorno, piatto=self.ramen).quantita, 2)
+        ora = VenditaOra.objects.get(giorno=giorno, ora=13)
+        self.assertEqual((ora.ordini, ora.incasso), (1, 25))
+
+        cambia_stato_ordine(self.ordini[2], 'completed')
+        self.assertEqual(aggiorna_statistiche(), 1)
+
+        ramen = VenditaPiatto.objects.get(giorno=giorno, piatto=self.ramen)
+        self.assertEqual((ramen.quantita, ramen.incasso), (4, 48))
+        self.assertEqual(VenditaPortata.objects.get(giorno=giorno, portata='dolce').quantita, 2)
+        self.assertEqual(VenditaOra.objects.get(giorno=giorno, ora=13).ordini, 2)
+
+    # Gli ordini appena chiusi aspettano il margine prima di essere contati
+    @override_settings(STATISTICHE_MARGINE_SECONDI=60)
+    def test_margine(self):
+        self.assertEqual(aggiorna_statistiche(), 0)
+
+    # Ricalcolo da zero: stessi numeri anche con gli ordini già archiviati
+    def test_ricostruisci(self):
+        cambia_stato_ordine(self.ordini[2], 'completed')
+        Ordine.objects.filter(pk=self.ordini[0].pk).update(orario_ritiro=self.ritiro - timedelta(days=60))
+        call_command('archivia_ordini', stdout=StringIO())
+        self.assertTrue(OrdineArchiviato.objects.filter(pk=self.ordini[0].pk).exists())
+        prima = list(VenditaPiatto.objects.order_by('giorno', 'piatto').values_list('giorno', 'piatto', 'quantita'))
+
+        call_command('aggiorna_statistiche', '--ricostruisci', stdout=StringIO())
+
+        dopo = list(VenditaPiatto.objects.order_by('giorno', 'piatto').values_list('giorno', 'piatto', 'quantita'))
+        self.assertEqual(dopo, prima)
+        self.assertEqual(len(dopo), 4)  # Ramen e Mochi in due giorni diversi
+
+    # Il ricalcolo scrive una nuova generazione a lotti: fino alla fine la dashboard vede le statistiche di prima,
+    # mai quelle parziali; un ricalcolo interrotto viene scartato da quello successivo
+    def test_ricostruisci_nuova_generazione(self):
+        aggiorna_statistiche()
+        prima = list(VenditaPiatto.objects.order_by('piatto').values_list('piatto', 'quantita'))
+
+        conta_vendite = statistiche.conta_vendite
+        def conta_una_volta(*args, **kwargs):
+            if conta_una_volta.chiamate:
+                raise DatabaseError
+            conta_una_volta.chiamate += 1
+            conta_vendite(*args, **kwargs)
+        conta_una_volta.chiamate = 0
+
+        with mock.patch('takeaway.statistiche.conta_vendite', conta_una_volta):
+            with self.assertRaises(DatabaseError):
+                ricostruisci_statistiche(lotto=1)
+        self.assertTrue(VenditaPiatto.objects.filter(generazione=1).exists())  # Lotto già scritto, non mostrato
+        attive = VenditaPiatto.objects.filter(generazione=avanzamento_attivo().generazione)
+        self.assertEqual(list(attive.order_by('piatto').values_list('piatto', 'quantita')), prima)
+        response = self.client.get(reverse('takeaway:statistiche'))
+        self.assertEqual(response.context['totali']['ordini'], 1)
+
+        self.assertEqual(ricostruisci_statistiche(lotto=1), 2)
+        self.assertEqual(list(VenditaPiatto.objects.order_by('piatto').values_list('piatto', 'quantita')), prima)
+        self.assertEqual(list(AvanzamentoStatistiche.objects.values_list('generazione', 'pronta')), [(1, True)])
+
+    # Eliminando un ordine già contato le sue vendite vengono tolte; uno non ancora contato non cambia nulla
+    def test_eliminazione(self):
+        aggiorna_statistiche()
+        cambia_stato_ordine(self.ordini[2], 'completed')
+        elimina_ordine(self.ordini[2])
+        elimina_ordine(self.ordini[0])
+        self.assertEqual(aggiorna_statistiche(), 0)
+
+        giorno = self.ritiro.date()
+        ora = VenditaOra.objects.get(giorno=giorno, ora=13)
+        self.assertEqual((ora.ordini, ora.incasso), (0, 0))
+        ramen = VenditaPiatto.objects.get(giorno=giorno, piatto=self.ramen)
+        self.assertEqual((ramen.quantita, ramen.incasso), (0, 0))
+        self.assertEqual(VenditaPortata.objects.get(giorno=giorno, portata='dolce').quantita, 0)
+
+    def test_dashboard(self):
+        aggiorna_statistiche()
+
+        with CaptureQueriesContext(connection) as query:
+            response = self.client.get(reverse('takeaway:statistiche') + '?giorni=7')
+        tabelle = " ".join(q['sql'] for q in query.captured_queries)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['totali'], {'ordini': 1, 'incasso': 25})
+        self.assertContains(response, "Ramen")
+        self.assertNotIn('"takeaway_ordine"', tabelle)  # Solo tabelle precalcolate
+
+        self.client.logout()
+        response = self.client.get(reverse('takeaway:statistiche'))
+        self.assertEqual(response.status_code, 302)
+
+
+class EsportazioneOrdiniTest(TestCase):
+    def setUp(self):
+        gruppo_dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        dipendente = User.objects.create_user(username='dipendente', password='prova123')
+        dipendente.groups.add(gruppo_dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+        cliente = User.objects.create_user(username='cliente', password='prova123')
+        piatto = Piatto.objects.create(nome="Ramen", descrizione="Spaghetti in brodo", prezzo=12.50,
+            portata="primo", ingredienti="carne")
+        self.giorno = timezone.localdate() - timedelta(days=3)
+        ritiro = timezone.make_aware(timezone.datetime.combine(self.giorno, timezone.datetime.min.time()))
+        self.ordini = []
+        for ore in [12, 20, 48]:  # L'ultimo cade fuori dal periodo esportato
+            ordine = Ordine.objects.create(cliente=cliente, orario_ritiro=ritiro + timedelta(hours=ore), totale=25)
+            PiattoOrdine.objects.create(ordine=ordine, piatto=piatto, quantita=2, prezzo_unitario=12.50)
+            self.ordini.append(ordine)
+        OrdineArchiviato.objects.create(id=1000, cliente=cliente, orario_ritiro=ritiro + timedelta(hours=1),
+            stato='completed', creato_il=ritiro, totale=9)
+
+    def url(self, **parametri):
+        parametri = {'dal': self.giorno.isoformat(), 'al': self.giorno.isoformat(), **parametri}
+        return reverse('takeaway:ordini_esporta') + '?' + '&'.join(f'{k}={v}' for k, v in parametri.items())
+
+    # Risposta in streaming, ordini archiviati compresi (in ordine di ritiro)
+    def test_csv(self):
+        response = self.client.get(self.url())
+        self.assertTrue(response.streaming)
+        righe = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(righe[0].split(',')[:3], ['id', 'cliente', 'stato'])
+        self.assertEqual([riga.split(',')[0] for riga in righe[1:]],
+                         ['1000', str(self.ordini[0].pk), str(self.ordini[1].pk)])
+        self.assertIn('attachment; filename="ordini_', response['Content-Disposition'])
+
+    def test_jsonl_righe(self):
+        response = self.client.get(self.url(tipo='righe', formato='jsonl'))
+        righe = [json.loads(riga) for riga in b"".join(response.streaming_content).decode().splitlines()]
+
+        self.assertEqual(len(righe), 2)
+        self.assertEqual(righe[0]['piatto'], 'Ramen')
+        self.assertEqual(righe[0]['subtotale'], '25.00')
+
+    def test_non_valida(self):
+        self.assertEqual(self.client.get(self.url(al='2000-01-01')).status_code, 400)
+        self.assertEqual(self.client.get(self.url(formato='xls')).status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url()).status_code, 302)
+
+    def test_comando(self):
+        output = StringIO()
+        call_command('esporta_ordini', '--dal', self.giorno.isoformat(), '--al', self.giorno.isoformat(),
+                     '--formato', 'jsonl', stdout=output)
+
+        ids = [json.loads(riga)['id'] for riga in output.getvalue().splitlines()]
+        self.assertEqual(ids, [1000, self.ordini[0].pk, self.ordini[1].pk])
+
+    # Con ASGI la risposta è un flusso asincrono, letto a blocchi
+    async def test_asgi(self):
+        await self.async_client.aforce_login(await User.objects.aget(username='dipendente'))
+        with mock.patch('takeaway.esportazione.RIGHE_PER_LETTURA', 2):
+            response = await self.async_client.get(self.url(formato='jsonl'))
+            self.assertTrue(response.is_async)
+            ids = [json.loads(riga)['id'] async for riga in response.streaming_content]
+        self.assertEqual(ids, [1000, self.ordini[0].pk, self.ordini[1].pk])
+
+    # Ordini correnti e archiviati letti con un'unica SELECT: un ordine archiviato durante
+    # l'esportazione (da un'altra connessione) non può comparire due volte né mancare
+    def test_una_lettura(self):
+        with mock.patch('takeaway.esportazione.RIGHE_PER_LETTURA', 1), \
+                CaptureQueriesContext(connection) as queries:
+            ids = [riga[0] for riga in righe_esportazione("ordini", self.giorno, self.giorno)]
+        self.assertEqual(ids, [1000, self.ordini[0].pk, self.ordini[1].pk])
+        self.assertEqual(len(queries), 1)
+        self.assertIn("UNION ALL", queries[0]['sql'])
+
+
+class MovimentiPuntiTest(TestCase):
+    def setUp(self):
+        self.mario = User.objects.create_user(username='mario', password='prova123')
+        self.luigi = User.objects.create_user(username='luigi', password='prova123')
+        self.carta = CartaFedelta.objects.create(cliente=self.mario)
+
+    # Due copie della stessa carta lette prima delle modifiche: nessun punto perso
+    def test_modifiche_concorrenti(self):
+        altra_copia = CartaFedelta.objects.get(pk=self.carta.pk)
+        self.carta.aggiungi_punti(5)
+        altra_copia.aggiungi_punti(7)
+        altra_copia.rimuovi_punti(2)
+
+        self.carta.refresh_from_db()
+        self.assertEqual(self.carta.punti, 10)
+        self.assertEqual(altra_copia.punti, 10)
+        self.assertEqual(self.carta.movimenti.count(), 3)
+
+    # Chiusura in blocco: un movimento per ordine, saldi uguali alla somma dei movimenti
+    def test_ordini_completati(self):
+        orario = timezone.now() + timedelta(hours=1)
+        ordini = [
+            Ordine.objects.create(cliente=self.mario, orario_ritiro=orario, totale=20.50),
+            Ordine.objects.create(cliente=self.mario, orario_ritiro=orario, totale=10, sconto=5),
+            Ordine.objects.create(cliente=self.luigi, orario_ritiro=orario, totale=8),
+        ]
+        cambia_stato_ordini([ordine.pk for ordine in ordini], 'completed')
+
+        self.assertEqual(sorted(MovimentoPunti.objects.values_list('ordine_id', 'punti')),
+                         [(ordini[0].pk, 20), (ordini[1].pk, 5), (ordini[2].pk, 8)])
+        self.assertFalse(CartaFedelta.objects.con_saldo_movimenti().exclude(punti=F('saldo_movimenti')).exists())
+
+    def test_movimento_non_modificabile(self):
+        self.carta.aggiungi_punti(5)
+        movimento = self.carta.movimenti.get()
+        movimento.punti = 50
+        with self.assertRaises(ValueError):
+            movimento.save()
+
+    def test_riconcilia(self):
+        self.carta.aggiungi_punti(30)
+        CartaFedelta.objects.filter(pk=self.carta.pk).update(punti=45)  # Saldo modificato a mano
+
+        output = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('riconcilia_punti', stdout=output)
+        self.assertIn("differenza +15", output.getvalue())
+
+        call_command('riconcilia_punti', '--correggi', stdout=StringIO())
+        self.carta.refresh_from_db()
+        self.assertEqual(self.carta.punti, 30)
+
+    def test_rettifica(self):
+        call_command('rettifica_punti', 'luigi', '12', '--nota', 'Reclamo', stdout=StringIO())
+        carta = CartaFedelta.objects.get(cliente=self.luigi)
+        self.assertEqual(carta.punti, 12)
+        self.assertEqual(carta.movimenti.get().tipo, 'rettifica')
+
+        with self.assertRaises(CommandError):
+            call_command('rettifica_punti', 'luigi', '-20', stdout=StringIO())
+        self.assertEqual(carta.movimenti.count(), 1)
+
+
+class PremiFedeltaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        rileggi_versioni()
+        gruppo_dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        dipendente = User.objects.create_user(username='dipendente', password='prova123')
+        dipendente.groups.add(gruppo_dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+        self.base = SogliaSconto.objects.create(punti_richiesti=100, valore_buono=5)
+        self.oro = SogliaSconto.objects.create(punti_richiesti=250, valore_buono=15)
+
+    def test_premio(self):
+        premi = PremiFedelta([self.oro, self.base])
+        self.assertIsNone(premi.premio(99))
+        self.assertEqual(premi.premio(100), self.base)
+        self.assertEqual(premi.premio(300), self.oro)
+        self.assertEqual(premi.prossimo(120), self.oro)
+        self.assertIsNone(premi.prossimo(250))
+
+    # Letti una volta, poi solo dalla memoria finché una soglia non cambia
+    def test_cache(self):
+        premi_fedelta()
+        with self.assertNumQueries(0):
+            self.assertEqual(premi_fedelta().soglie, [self.base, self.oro])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('takeaway:soglia_sconto_update'), {
+                'form-TOTAL_FORMS': 3, 'form-INITIAL_FORMS': 2,
+                'form-0-id': self.base.pk, 'form-0-punti_richiesti': 100, 'form-0-valore_buono': 5, 'form-0-DELETE': 'on',
+                'form-1-id': self.oro.pk, 'form-1-punti_richiesti': 250, 'form-1-valore_buono': 20,
+                'form-2-punti_richiesti': 500, 'form-2-valore_buono': 50,
+            })
+        self.assertRedirects(response, reverse('takeaway:soglia_sconto'))
+
+        self.assertEqual([(soglia.punti_richiesti, soglia.valore_buono) for soglia in premi_fedelta().soglie],
+                         [(250, 20), (500, 50)])
+
+    # La versione cambia solo dopo il commit: chi legge prima tiene le soglie vecchie con la versione vecchia
+    def test_versione_dopo_commit(self):
+        versione = versione_soglie()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                SogliaSconto.objects.create(punti_richiesti=500, valore_buono=50)
+                self.assertEqual(versione_soglie(), versione)
+        self.assertNotEqual(versione_soglie(), versione)
+        self.assertEqual(len(premi_fedelta().soglie), 3)
+
+    # Modifiche che non passano dai segnali di questo processo (altri worker, shell) arrivano dopo la scadenza
+    def test_scadenza(self):
+        premi_fedelta()
+        SogliaSconto.objects.filter(pk=self.oro.pk).update(valore_buono=20)
+        self.assertEqual(premi_fedelta().premio(300).valore_buono, 15)
+        with mock.patch('takeaway.fedelta.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(premi_fedelta().premio(300).valore_buono, 20)
+
+    def test_punti_duplicati(self):
+        response = self.client.post(reverse('takeaway:soglia_sconto_update'), {
+            'form-TOTAL_FORMS': 3, 'form-INITIAL_FORMS': 2,
+            'form-0-id': self.base.pk, 'form-0-punti_richiesti': 100, 'form-0-valore_buono': 5,
+            'form-1-id': self.oro.pk, 'form-1-punti_richiesti': 250, 'form-1-valore_buono': 15,
+            'form-2-punti_richiesti': 100, 'form-2-valore_buono': 8,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(SogliaSconto.objects.count(), 2)
+
+    # Un buono negativo farebbe pagare al cliente più del totale
+    def test_valore_negativo(self):
+        response = self.client.post(reverse('takeaway:soglia_sconto_update'), {
+            'form-TOTAL_FORMS': 2, 'form-INITIAL_FORMS': 2,
+            'form-0-id': self.base.pk, 'form-0-punti_richiesti': 100, 'form-0-valore_buono': '-5',
+            'form-1-id': self.oro.pk, 'form-1-punti_richiesti': 250, 'form-1-valore_buono': 15,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.base.refresh_from_db()
+        self.assertEqual(self.base.valore_buono, 5)
+
+    # Al checkout vale il premio più alto raggiunto
+    def test_checkout(self):
+        self.assertEqual(calcola_sconto(Decimal(30), 260, premi_fedelta()), (15, 250))
+        self.assertEqual(calcola_sconto(Decimal(30), 120, premi_fedelta()), (5, 100))
+        self.assertEqual(calcola_sconto(Decimal(3), 120, premi_fedelta()), (3, 100))
+        self.assertEqual(calcola_sconto(Decimal(30), 50, premi_fedelta()), (0, 0))
+
+    def test_pagine(self):
+        self.assertContains(self.client.get(reverse('takeaway:soglia_sconto')), "250")
+        self.assertEqual(self.client.get(reverse('takeaway:soglia_sconto_update')).status_code, 200)
+
+        gruppo_clienti, created = Group.objects.get_or_create(name='Clienti')
+        cliente = User.objects.create_user(username='cliente', password='prova123')
+        cliente.groups.add(gruppo_clienti)
+        CartaFedelta.objects.create(cliente=cliente, punti=120)
+        self.client.login(username='cliente', password='prova123')
+
+        response = self.client.get(reverse('takeaway:carta_fedelta'))
+        self.assertContains(response, "premio di 5")
+        self.assertContains(response, "Ti mancano 130 punti")
+
+
+class RuoliTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache_ruoli().clear()
+        self.dipendenti, created = Group.objects.get_or_create(name='Dipendenti')
+        self.clienti, created = Group.objects.get_or_create(name='Clienti')
+        self.user = User.objects.create_user(username='dipendente', password='prova123')
+        self.user.groups.add(self.dipendenti)
+        self.client.login(username='dipendente', password='prova123')
+
+    def query_gruppi(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query for query in queries.captured_queries if 'auth_user_groups' in query['sql']]
+
+    # Gruppi letti una volta e poi presi dalla cache, per controlli, viste e template
+    def test_gruppi_in_cache(self):
+        response, query = self.query_gruppi(reverse('takeaway:ordini'))
+        self.assertEqual(len(query), 1)
+        self.assertEqual(response.context['ruolo'], 'dipendente')
+
+        response, query = self.query_gruppi(reverse('takeaway:ordini'))
+        self.assertEqual(query, [])
+        self.assertContains(response, "Bacheca")  # Menu dei dipendenti
+
+    # Cambiare i gruppi, da un lato o dall'altro, svuota la cache
+    def test_invalidazione(self):
+        self.assertEqual(self.client.get(reverse('takeaway:bacheca')).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.dipendenti)
+        self.assertEqual(self.client.get(reverse('takeaway:bacheca')).status_code, 302)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clienti.user_set.add(self.user)
+        response = self.client.get(reverse('takeaway:ordini'))
+        self.assertEqual(response.context['ruolo'], 'cliente')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clienti.user_set.clear()
+        self.assertEqual(self.client.get(reverse('takeaway:ordini')).status_code, 302)
+
+    # Gruppo tolto dentro una transazione (come fa l'admin): una richiesta che nel frattempo rimette in cache
+    # i gruppi vecchi non conserva l'accesso dopo il commit
+    def test_invalidazione_dopo_commit(self):
+        self.assertEqual(self.client.get(reverse('takeaway:bacheca')).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.user.groups.remove(self.dipendenti)
+                cache_ruoli().set(chiave_gruppi(self.user.pk), frozenset(['Dipendenti']))
+            self.assertIsNotNone(cache_ruoli().get(chiave_gruppi(self.user.pk)))
+        self.assertIsNone(cache_ruoli().get(chiave_gruppi(self.user.pk)))
+        self.assertEqual(self.client.get(reverse('takeaway:bacheca')).status_code, 302)
+
+    # I ruoli non possono stare in una cache locale al processo
+    def test_cache_locale_rifiutata(self):
+        self.assertEqual(controlla_cache_ruoli(None), [])
+        with self.settings(RUOLI_CACHE='default'):
+            self.assertEqual([errore.id for errore in controlla_cache_ruoli(None)], ['takeaway.E001'])
+
+    # Utente in entrambi i gruppi: la lista ordini lo tratta da cliente (solo i suoi ordini)
+    def test_cliente_e_dipendente(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.clienti)
+        altro = User.objects.create_user(username='altro', password='prova123')
+        orario = timezone.now() + timedelta(hours=1)
+        mio = Ordine.objects.create(cliente=self.user, orario_ritiro=orario, totale=10)
+        Ordine.objects.create(cliente=altro, orario_ritiro=orario, totale=10)
+
+        response = self.client.get(reverse('takeaway:ordini'))
+        self.assertEqual([ordine.pk for ordine in response.context['ordini']], [mio.pk])
+
+    # Gruppo eliminato e ricreato: l'id in cache viene rinnovato
+    def test_gruppo_ricreato(self):
+        self.assertEqual(id_gruppo('Clienti'), self.clienti.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clienti.delete()
+        clienti = Group.objects.create(name='Clienti')
+        self.assertEqual(id_gruppo('Clienti'), clienti.pk)
+
+    # Registrazione: il gruppo viene cercato solo la prima volta
+    def test_registrazione(self):
+        for numero in range(2):
+            form = CreaUtenteCliente({'username': f'nuovo{numero}', 'password1': 'Prova.12345', 'password2': 'Prova.12345'})
+            self.assertTrue(form.is_valid())
+            with CaptureQueriesContext(connection) as queries:
+                utente = form.save()
+            ricerche_gruppo = [query for query in queries.captured_queries if 'FROM "auth_group"' in query['sql']]
+            self.assertEqual(len(ricerche_gruppo), 1 - numero)
+            self.assertEqual(list(utente.groups.values_list('name', flat=True)), ['Clienti'])
@@ -1,5 +1,6 @@
 from django.urls import path
 
+from .api import api_piatti, api_piatto
 from .views import *
 
 app_name = "takeaway"
@@ -7,11 +8,14 @@ app_name = "takeaway"
 urlpatterns = [
     path("piatto/<int:pk>", PiattoDetail.as_view(), name="piatto"),
     path("piatti/", PiattoListView.as_view(), name="piatti"),
+    path("api/piatti/", api_piatti, name="api_piatti"),
+    path("api/piatti/<int:pk>", api_piatto, name="api_piatto"),
 
     path("carrello/", visualizza_carrello, name="carrello"),
     path("carrello/aggiungi/<int:id_piatto>", aggiungi_al_carrello, name="carrello_add"),
     path("carrello/rimuovi/<int:id_piatto>", rimuovi_dal_carrello, name="carrello_remove"),
     path("carrello/aggiorna/<int:id_piatto>", aggiorna_nel_carrello, name="carrello_update"),
+    path("carrello/batch", aggiorna_carrello_batch, name="carrello_batch"),
     path("carrello/checkout", checkout, name="checkout"),
     path('carrello/checkout_success/', checkout_success, name='checkout_success'),
 
@@ -23,6 +27,11 @@ urlpatterns = [
     path('ordini/', OrdiniListView.as_view(), name='ordini'),
     path('ordini/rimuovi/<int:pk>', OrdineDelete.as_view(), name='ordine_delete'),
     path('ordini/modifica/<int:pk>', OrdineUpdate.as_view(), name='ordine_update'),
+    path('ordini/azione', azione_ordini, name='ordini_azione'),
+    path('ordini/bacheca/', bacheca_ordini, name='bacheca'),
+    path('ordini/bacheca/eventi', bacheca_eventi, name='bacheca_eventi'),
+    path('statistiche/', statistiche, name='statistiche'),
+    path('ordini/esporta', esporta_ordini, name='ordini_esporta'),
 
     path('carta_fedelta/', visualizza_carta_fedelta, name='carta_fedelta'),
     path('soglia_sconto/', visualizza_soglia_buono, name='soglia_sconto'),
@@ -1,22 +1,51 @@
-from django.core.exceptions import PermissionDenied
-from braces.views import GroupRequiredMixin
+import json
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Sum
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, QueryDict, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.urls import reverse_lazy
 
-from takeaway.forms import CheckoutForm, PiattoForm, OrdineForm, SogliaScontoForm
+from takeaway.bacheca import eventi_long_polling, flusso_eventi, ultimo_evento
+from takeaway.cache import chiave_menu, parametri_menu
+from takeaway.carrelli import get_carrello
+from takeaway.checkout import calcola_sconto, conferma_ordine, ordine_gia_confermato
+from takeaway.coda import job_in_ritardo
+from takeaway.esportazione import esporta, esporta_async
+from takeaway.fedelta import premi_fedelta
+from takeaway.forms import CheckoutForm, EsportazioneOrdiniForm, PiattoForm, OrdineForm, SoglieScontoFormSet
 from takeaway.models import *
+from takeaway.ordini import STATI_FINALI, cambia_stato_ordine, cambia_stato_ordini, elimina_ordine
+from takeaway.paginazione import PaginaKeyset
+from takeaway.ricerca import cerca
+from takeaway.ruoli import CLIENTI, DIPENDENTI, GruppoRichiestoMixin, gruppi_utente, ruolo_utente
+from takeaway.statistiche import avanzamento_attivo
 
 
+# Gruppi letti con gruppi_utente: in cache, non una query per ogni controllo
 def clienti_group(user):
-    return user.groups.filter(name='Clienti').exists()
+    return CLIENTI in gruppi_utente(user)
 
 def dipendenti_group(user):
-    return user.groups.filter(name='Dipendenti').exists()
+    return DIPENDENTI in gruppi_utente(user)
 
 
 class PiattoDetail(DetailView):
@@ -27,9 +56,31 @@ class PiattoDetail(DetailView):
 class PiattoListView(ListView):
     model = Piatto
     template_name = "takeaway/piatto/piatto_list.html"
+    paginate_by = 12
+    template_griglia = "takeaway/piatto/piatto_griglia.html"
+
+    def get(self, request, *args, **kwargs):
+        ruolo = ruolo_utente(request.user)
+
+        # La griglia dei dipendenti contiene i form con il token CSRF -> non va condivisa
+        chiave = chiave_menu(ruolo, request.GET) if ruolo != "dipendente" else None
+        griglia = cache.get(chiave) if chiave else None
+
+        if griglia is None:
+            self.object_list = self.get_queryset()
+            griglia = render_to_string(self.template_griglia, self.get_context_data(), request)
+            if chiave:
+                cache.set(chiave, griglia, settings.MENU_CACHE_TIMEOUT)
+
+        return render(request, self.template_name, {
+            'griglia': mark_safe(griglia),
+            'portata_selezionata': request.GET.get('portata', 'tutti'),
+            'ingrediente_selezionato': request.GET.get('ingrediente', 'tutti'),
+            'ricerca': request.GET.get('q', ''),
+        })
 
     def get_queryset(self):
-        queryset = Piatto.objects.all()
+        queryset = Piatto.objects.per_menu()
 
         portata = self.request.GET.get('portata')
         ingrediente = self.request.GET.get('ingrediente')
@@ -40,17 +91,25 @@ class PiattoListView(ListView):
         if ingrediente and ingrediente != 'tutti':
             queryset = queryset.filter(ingredienti=ingrediente)
 
-        return sorted(queryset, key=lambda p: p.portata_ordine)
+        testo = self.request.GET.get('q', '').strip()
+        if testo:
+            queryset = cerca(queryset, testo)
 
-    # Per mantenere selezionate le opzioni nel menu
+        return queryset
+
+    # I link della paginazione usano solo i parametri della chiave in cache: la griglia salvata è la stessa
+    # per tutti quelli che hanno quei parametri, qualunque altro parametro ci sia nell'URL
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['portata_selezionata'] = self.request.GET.get('portata', 'tutti')
-        context['ingrediente_selezionato'] = self.request.GET.get('ingrediente', 'tutti')
+        parametri = QueryDict(mutable=True)
+        for nome, valore in parametri_menu(self.request.GET).items():
+            if nome != 'page' and valore not in ('tutti', ''):
+                parametri[nome] = valore
+        context['parametri_menu'] = parametri
         return context
 
 
-class PiattoCreate(GroupRequiredMixin, CreateView):
+class PiattoCreate(GruppoRichiestoMixin, CreateView):
     group_required = ["Dipendenti"]
     model = Piatto
     form_class = PiattoForm
@@ -58,13 +117,13 @@ class PiattoCreate(GroupRequiredMixin, CreateView):
     success_url = reverse_lazy("takeaway:piatti")
 
 
-class PiattoDelete(GroupRequiredMixin, DeleteView):
+class PiattoDelete(GruppoRichiestoMixin, DeleteView):
     group_required = ["Dipendenti"]
     model = Piatto
     success_url = reverse_lazy("takeaway:piatti")
 
 
-class PiattoUpdate(GroupRequiredMixin, UpdateView):
+class PiattoUpdate(GruppoRichiestoMixin, UpdateView):
     group_required = ["Dipendenti"]
     model = Piatto
     form_class = PiattoForm
@@ -75,14 +134,10 @@ class PiattoUpdate(GroupRequiredMixin, UpdateView):
 # Aggiunge un piatto al carrello
 @user_passes_test(clienti_group)
 def aggiungi_al_carrello(request, id_piatto):
-    piatto = get_object_or_404(Piatto, id=id_piatto)
-    carrello, created = Carrello.objects.get_or_create(cliente=request.user)
+    piatto = get_object_or_404(Piatto.objects.only('id'), id=id_piatto)
 
     # Se il piatto è già nel carrello -> incremento quantità
-    piatto, created = PiattoCarrello.objects.get_or_create(carrello=carrello, piatto=piatto)
-    if not created:
-        piatto.quantita += 1
-        piatto.save()
+    get_carrello(request).aggiungi(piatto.pk)
 
     return redirect("takeaway:carrello")
 
@@ -90,10 +145,9 @@ def aggiungi_al_carrello(request, id_piatto):
 # Rimuove un piatto dal carrello
 @user_passes_test(clienti_group)
 def rimuovi_dal_carrello(request, id_piatto):
-    piatto = get_object_or_404(Piatto, id=id_piatto)
-    carrello = get_object_or_404(Carrello, cliente=request.user)
+    piatto = get_object_or_404(Piatto.objects.only('id'), id=id_piatto)
 
-    PiattoCarrello.objects.filter(carrello=carrello, piatto=piatto).delete()
+    get_carrello(request).rimuovi(piatto.pk)
 
     return redirect("takeaway:carrello")
 
@@ -102,15 +156,10 @@ def rimuovi_dal_carrello(request, id_piatto):
 @user_passes_test(clienti_group)
 def aggiorna_nel_carrello(request, id_piatto):
     if request.method == "POST":
-        piatto_carrello = get_object_or_404(PiattoCarrello, id=id_piatto, carrello__cliente=request.user)
+        piatto = get_object_or_404(Piatto.objects.only('id'), id=id_piatto)
         try:
-            quantita = int(request.POST.get("quantita", 1))
-            if quantita < 1:
-                # Se la quantità inserita è <1, rimuovi il piatto dal carrello
-                piatto_carrello.delete()
-            else:
-                piatto_carrello.quantita = quantita
-                piatto_carrello.save()
+            # Se la quantità inserita è <1, il piatto viene rimosso dal carrello
+            get_carrello(request).applica({piatto.pk: int(request.POST.get("quantita", 1))})
         except ValueError:
             # Se non è un numero valido -> ignoro
             pass
@@ -118,62 +167,80 @@ def aggiorna_nel_carrello(request, id_piatto):
     return redirect("takeaway:carrello")
 
 
+# Stato del carrello in JSON
+def stato_carrello(righe):
+    return {
+        "righe": [{
+            "piatto": riga.piatto_id,
+            "nome": riga.piatto.nome,
+            "prezzo": riga.piatto.prezzo,
+            "quantita": riga.quantita,
+            "subtotale": riga.subtotale(),
+        } for riga in righe],
+        "totale": sum(riga.subtotale() for riga in righe),
+    }
+
+
+# Applica più modifiche al carrello in una sola richiesta: {id_piatto: quantita}
+@require_POST
+@user_passes_test(clienti_group)
+def aggiorna_carrello_batch(request):
+    try:
+        dati = json.loads(request.body)
+        quantita = {int(id_piatto): int(q) for id_piatto, q in dati.items()}
+    except (ValueError, AttributeError, TypeError):
+        return JsonResponse({"errore": "Formato non valido: atteso {id_piatto: quantita}."}, status=400)
+
+    mancanti = set(quantita) - set(Piatto.objects.filter(pk__in=quantita).values_list('pk', flat=True))
+    if mancanti:
+        return JsonResponse({"errore": f"Piatti inesistenti: {sorted(mancanti)}"}, status=400)
+
+    carrello = get_carrello(request)
+    carrello.applica(quantita)
+
+    return JsonResponse(stato_carrello(carrello.righe()))
+
+
 # Mostra il carrello
 @user_passes_test(clienti_group)
 def visualizza_carrello(request):
-    carrello, created = Carrello.objects.get_or_create(cliente=request.user)
-    return render(request, "takeaway/carrello/carrello.html", {"carrello": carrello})
+    righe = get_carrello(request).righe()
+    totale = sum(riga.subtotale() for riga in righe)
+
+    return render(request, "takeaway/carrello/carrello.html", {"righe": righe, "totale": totale})
 
 
 @user_passes_test(clienti_group)
 def checkout(request):
+    form = CheckoutForm(request.POST or None, initial={'chiave': uuid.uuid4()})
+
     # Prendo il carrello dell'utente
-    carrello = get_object_or_404(Carrello, cliente=request.user)
-    piatti_carrello = PiattoCarrello.objects.filter(carrello=carrello)
+    carrello = get_carrello(request)
 
-    carta_fedelta, created = CartaFedelta.objects.get_or_create(cliente=request.user)
-    soglia_sconto = SogliaSconto.objects.first()
+    if request.method == 'POST' and form.is_valid():
+        # Invio ripetuto (stessa chiave) -> risultato del primo invio, senza rifare il checkout
+        if ordine_gia_confermato(request.user, carrello, form.cleaned_data['chiave']) is not None:
+            return redirect('takeaway:checkout_success')
 
-    # Controllo se è possibile applicare lo sconto
-    if carta_fedelta.punti >= soglia_sconto.punti_richiesti:
-        sconto = soglia_sconto.valore_buono
-        if sconto > carrello.totale():
-            sconto = carrello.totale()
-    else:
-        sconto = 0
+    piatti_carrello = carrello.righe()
 
-    if not piatti_carrello.exists():
+    if not piatti_carrello:
         # Carrello vuoto
         return redirect('takeaway:piatti')
 
-    if request.method == 'POST':
-        form = CheckoutForm(request.POST)
-        if form.is_valid():
-            ordine = form.save(commit=False) # Non salvo subito
-            ordine.cliente = request.user
-            ordine.sconto = sconto
-            ordine.save()
-
-            if sconto > 0:
-                carta_fedelta.rimuovi_punti(soglia_sconto.punti_richiesti)
-
-            # Copia piatti dal carrello all'ordine
-            for piatto in piatti_carrello:
-                PiattoOrdine.objects.create(
-                    ordine=ordine,
-                    piatto=piatto.piatto,
-                    quantita=piatto.quantita,
-                    prezzo_unitario=piatto.piatto.prezzo
-                )
-
-            # Svuota il carrello
-            piatti_carrello.delete()
-
+    if request.method == 'POST' and form.is_valid():
+        try:
+            ordine = conferma_ordine(request.user, carrello, form, form.cleaned_data['chiave'])
+        except ValidationError as e:
+            form.add_error('fascia_ritiro', e)  # Fascia riempita nel frattempo
+        else:
+            if ordine is None:
+                return redirect('takeaway:piatti')  # Carrello svuotato da un altro checkout
             return redirect('takeaway:checkout_success')
-    else:
-        form = CheckoutForm()
 
-    totale = carrello.totale()
+    totale = sum(piatto.subtotale() for piatto in piatti_carrello)
+    carta_fedelta, created = CartaFedelta.objects.get_or_create(cliente=request.user)
+    sconto, punti_usati = calcola_sconto(totale, carta_fedelta.punti, premi_fedelta())
     totale_scontato = totale - sconto
 
     return render(request, 'takeaway/carrello/checkout.html', {
@@ -191,32 +258,47 @@ def checkout_success(request):
 
 
 # Dettaglio ordine
-class OrdineDetailView(GroupRequiredMixin, DetailView):
+class OrdineDetailView(GruppoRichiestoMixin, DetailView):
     group_required = ["Clienti", "Dipendenti"]
     model = Ordine
     template_name = 'takeaway/ordine/ordine_detail.html'
     context_object_name = 'ordine'
+    queryset = Ordine.objects.select_related('cliente').prefetch_related('piatti__piatto')
+
+    # Se l'ordine non è più tra quelli attivi lo cerco nell'archivio
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            archiviati = OrdineArchiviato.objects.select_related('cliente').prefetch_related('piatti__piatto')
+            return get_object_or_404(archiviati, pk=self.kwargs['pk'])
 
 
 # Lista ordini
-class OrdiniListView(GroupRequiredMixin, ListView):
+class OrdiniListView(GruppoRichiestoMixin, ListView):
     group_required = ["Clienti", "Dipendenti"]
     model = Ordine
     template_name = 'takeaway/ordine/ordine_list.html'
     context_object_name = 'ordini'
+    ordini_per_pagina = 20
 
     def get_queryset(self):
         data = self.request.GET.get('data', 'futuri')
         stato = self.request.GET.get('stato', 'pending')
 
-        print(data, stato)
+        # Gli ordini archiviati sono in una tabella a parte e sono tutti chiusi
+        modello = OrdineArchiviato if data == 'archiviati' else Ordine
+        if data == 'archiviati' and stato == 'pending':
+            stato = 'tutti'
+        self.stato = stato
 
-        if self.request.user.groups.filter(name="Clienti").exists():
+        # Prima il gruppo Clienti: chi è in entrambi i gruppi vede solo i suoi ordini
+        if clienti_group(self.request.user):
             # Se è un cliente -> mostro solo i suoi ordini
-            queryset = Ordine.objects.filter(cliente=self.request.user)
-        elif self.request.user.groups.filter(name="Dipendenti").exists():
+            queryset = modello.objects.filter(cliente=self.request.user)
+        elif dipendenti_group(self.request.user):
             # Se è un dipendente -> mostro tutti gli ordini
-            queryset = Ordine.objects.filter().order_by('orario_ritiro')
+            queryset = modello.objects.all()
         else:
             raise PermissionDenied("Non hai accesso a questi ordini.")
 
@@ -224,29 +306,143 @@ class OrdiniListView(GroupRequiredMixin, ListView):
             queryset = queryset.filter(orario_ritiro__gt=timezone.now())
         elif data == 'passati':
             queryset = queryset.filter(orario_ritiro__lt=timezone.now())
-        else:
-            queryset = queryset.filter()
 
         if stato != 'tutti':
             queryset = queryset.filter(stato=stato)
 
-        return queryset.order_by('orario_ritiro')
+        # Pagine a chiave su (orario_ritiro, id), vedi gli indici di Ordine
+        self.pagina = PaginaKeyset(queryset, 'orario_ritiro', self.ordini_per_pagina,
+                                   dopo=self.request.GET.get('dopo'), prima=self.request.GET.get('prima'))
+        return self.pagina.oggetti
 
     # Per mantenere selezionate le opzioni nel menu
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['portata_selezionata'] = self.request.GET.get('data', 'futuri')
-        context['stato_selezionato'] = self.request.GET.get('stato', 'pending')
+        context['stato_selezionato'] = self.stato
+        context['dipendente'] = dipendenti_group(self.request.user)
+        context['pagina'] = self.pagina
+        # Senza il worker i punti fedeltà degli ordini completati non vengono mai assegnati
+        if context['dipendente'] and job_in_ritardo():
+            messages.warning(self.request, "Ci sono operazioni in attesa da troppo tempo: "
+                                           "controlla che il worker (esegui_job) sia avviato.")
         return context
 
 
-class OrdineDelete(GroupRequiredMixin, DeleteView):
+# Cambio di stato di più ordini in una volta (es. a fine serata)
+@require_POST
+@user_passes_test(dipendenti_group)
+def azione_ordini(request):
+    stato = request.POST.get('stato')
+    if stato not in STATI_FINALI:
+        return HttpResponseBadRequest("Stato non valido")
+
+    ids = [int(pk) for pk in request.POST.getlist('ordini') if pk.isdigit()]
+    modificati = cambia_stato_ordini(ids, stato)
+    messages.success(request, f"Ordini aggiornati: {modificati}.")
+
+    successivo = request.POST.get('next')
+    if successivo and url_has_allowed_host_and_scheme(successivo, allowed_hosts={request.get_host()}):
+        return redirect(successivo)
+    return redirect('takeaway:ordini')
+
+
+# Bacheca ordini per la cucina: ordini in attesa aggiornati in tempo reale
+@user_passes_test(dipendenti_group)
+def bacheca_ordini(request):
+    ultimo_id = ultimo_evento()  # Prima della lista: gli eventi successivi arrivano dal flusso
+    ordini = (Ordine.objects.filter(stato='pending', orario_ritiro__gte=timezone.now() - timedelta(hours=2))
+              .select_related('cliente').order_by('orario_ritiro', 'id')[:100])
+    return render(request, 'takeaway/ordine/bacheca.html', {'ordini': ordini, 'ultimo_id': ultimo_id})
+
+
+# Statistiche di vendita: legge solo le tabelle precalcolate da aggiorna_statistiche
+@user_passes_test(dipendenti_group)
+def statistiche(request):
+    try:
+        giorni = int(request.GET.get('giorni', 30))
+    except ValueError:
+        giorni = 30
+    if giorni not in settings.STATISTICHE_PERIODI_GIORNI:
+        giorni = 30
+    dal = timezone.localdate() - timedelta(days=giorni - 1)
+
+    # Generazione completa più recente: un ricalcolo in corso (ricostruisci_statistiche) non si vede
+    attivo = avanzamento_attivo()
+    generazione = attivo.generazione if attivo else 0
+    vendite_ora = VenditaOra.objects.filter(generazione=generazione, giorno__gte=dal)
+    vendite_piatto = VenditaPiatto.objects.filter(generazione=generazione, giorno__gte=dal)
+    portate = dict(Piatto.PORTATA_CHOICES)
+
+    context = {
+        'giorni': giorni,
+        'periodi': settings.STATISTICHE_PERIODI_GIORNI,
+        'dal': dal,
+        'aggiornato_il': attivo.chiuso_il if attivo else None,
+        'totali': vendite_ora.aggregate(ordini=Sum('ordini'), incasso=Sum('incasso')),
+        'per_giorno': vendite_ora.values('giorno').annotate(ordini=Sum('ordini'), totale=Sum('incasso')).order_by('-giorno'),
+        'per_ora': vendite_ora.values('ora').annotate(ordini=Sum('ordini'), totale=Sum('incasso')).order_by('ora'),
+        'piatti': (vendite_piatto.values('piatto_id', 'piatto__nome')
+                   .annotate(venduti=Sum('quantita'), totale=Sum('incasso')).order_by('-venduti', 'piatto__nome')[:20]),
+        'portate': [
+            dict(riga, nome=portate.get(riga['portata'], riga['portata']))
+            for riga in VenditaPortata.objects.filter(generazione=generazione, giorno__gte=dal).values('portata')
+            .annotate(venduti=Sum('quantita'), totale=Sum('incasso')).order_by('-venduti')
+        ],
+        'esportazione': EsportazioneOrdiniForm(initial={'dal': dal, 'al': timezone.localdate()}),
+    }
+    return render(request, 'takeaway/ordine/statistiche.html', context)
+
+
+# Esportazione di ordini o righe (anche archiviati) per data di ritiro, inviata mentre viene letta dal DB
+@user_passes_test(dipendenti_group)
+def esporta_ordini(request):
+    form = EsportazioneOrdiniForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    dati = form.cleaned_data
+    # Con ASGI lo streaming richiede un generatore asincrono (vedi esportazione.esporta_async)
+    genera = esporta_async if isinstance(request, ASGIRequest) else esporta
+    response = StreamingHttpResponse(
+        genera(dati['tipo'], dati['formato'], dati['dal'], dati['al']),
+        content_type='text/csv; charset=utf-8' if dati['formato'] == 'csv' else 'application/x-ndjson; charset=utf-8',
+    )
+    nome = f"{dati['tipo']}_{dati['dal']:%Y-%m-%d}_{dati['al']:%Y-%m-%d}.{dati['formato']}"
+    response['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return response
+
+
+# Flusso Server-Sent Events della bacheca (vista asincrona: un client collegato non occupa un thread con ASGI)
+async def bacheca_eventi(request):
+    user = await request.auser()
+    if not await sync_to_async(dipendenti_group)(user):
+        raise PermissionDenied
+
+    try:
+        ultimo_id = int(request.headers.get('Last-Event-ID') or request.GET.get('dopo', 0))
+    except ValueError:
+        ultimo_id = 0
+
+    # Flusso continuo solo con ASGI; con WSGI una risposta per volta (vedi bacheca.eventi_long_polling)
+    eventi = flusso_eventi(ultimo_id) if isinstance(request, ASGIRequest) else eventi_long_polling(ultimo_id)
+    response = StreamingHttpResponse(eventi, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Niente buffering nei proxy (nginx)
+    return response
+
+
+class OrdineDelete(GruppoRichiestoMixin, DeleteView):
     group_required = ["Dipendenti"]
     model = Ordine
     success_url = reverse_lazy("takeaway:ordini")
 
+    def form_valid(self, form):
+        elimina_ordine(self.object)  # Libera anche il posto nella fascia di ritiro
+        return redirect(self.get_success_url())
+
 
-class OrdineUpdate(GroupRequiredMixin, UpdateView):
+class OrdineUpdate(GruppoRichiestoMixin, UpdateView):
     group_required = ["Dipendenti"]
     model = Ordine
     form_class = OrdineForm
@@ -254,52 +450,42 @@ class OrdineUpdate(GroupRequiredMixin, UpdateView):
     success_url = reverse_lazy("takeaway:ordini")
 
     def form_valid(self, form):
-        ordine = form.save(commit=False)
+        stato = form.cleaned_data['stato']
+        if stato != "pending" and not cambia_stato_ordine(self.object, stato):
+            # Chiuso da un'altra richiesta dopo che il form è stato validato
+            form.add_error('stato', "Lo stato non può essere più modificato.")
+            return self.form_invalid(form)
 
-        # se lo stato diventa 'completed' assegna punti
-        if ordine.stato == "completed":
-            punti = int(ordine.totale_scontato())  # 1 punto per ogni euro
-            carta, created = CartaFedelta.objects.get_or_create(cliente=ordine.cliente)
-            carta.aggiungi_punti(punti)
-
-        ordine.save()
         return redirect("takeaway:ordini")
 
 
 @user_passes_test(clienti_group)
 def visualizza_carta_fedelta(request):
     carta_fedelta, created = CartaFedelta.objects.get_or_create(cliente=request.user)
-    soglia_sconto = SogliaSconto.objects.first()
-    punti_rimanenti = soglia_sconto.punti_richiesti - carta_fedelta.punti
+    premi = premi_fedelta()
+    premio = premi.premio(carta_fedelta.punti)
+    prossimo_premio = premi.prossimo(carta_fedelta.punti)
+    punti_mancanti = prossimo_premio.punti_richiesti - carta_fedelta.punti if prossimo_premio else 0
+    movimenti = carta_fedelta.movimenti.order_by('-creato_il', '-id')[:10]
 
     return render(request, "takeaway/carta_fedelta/carta_fedelta_detail.html", {"carta_fedelta": carta_fedelta,
-                                                                                "soglia_sconto": soglia_sconto, "punti_rimanenti": punti_rimanenti})
+                                                                                "premio": premio, "prossimo_premio": prossimo_premio,
+                                                                                "punti_mancanti": punti_mancanti, "movimenti": movimenti})
 
 
-# Dettaglio soglia sconto
+# Elenco premi (soglie sconto)
 @user_passes_test(dipendenti_group)
 def visualizza_soglia_buono(request):
-    soglia, created = SogliaSconto.objects.get_or_create()  # Unica soglia
-    return render(request, 'takeaway/carta_fedelta/soglia_sconto_detail.html', {'soglia': soglia})
+    return render(request, 'takeaway/carta_fedelta/soglia_sconto_detail.html', {'soglie': premi_fedelta().soglie})
 
 
-# Modifica soglia sconto
+# Modifica premi: le soglie salvate o eliminate invalidano la cache dei premi (segnali)
 @user_passes_test(dipendenti_group)
 def aggiorna_soglia_buono(request):
-    soglia = SogliaSconto.objects.first()  # unica soglia
-
-    if request.method == 'POST':
-        form = SogliaScontoForm(request.POST)
-        if form.is_valid():
-            soglia.punti_richiesti = form.cleaned_data['punti_richiesti']
-            soglia.valore_buono = form.cleaned_data['valore_buono']
-            soglia.save()
-            return redirect('takeaway:soglia_sconto')
-    else:
-        # Precompilo i campi
-        form = SogliaScontoForm(initial={
-            'punti_richiesti': soglia.punti_richiesti,
-            'valore_buono': soglia.valore_buono
-        })
+    formset = SoglieScontoFormSet(request.POST or None, queryset=SogliaSconto.objects.all())
+    if request.method == 'POST' and formset.is_valid():
+        with transaction.atomic():
+            formset.save()
+        return redirect('takeaway:soglia_sconto')
 
-    return render(request, 'takeaway/carta_fedelta/soglia_sconto_update.html', {'form': form})
\ No newline at end of file
+    return render(request, 'takeaway/carta_fedelta/soglia_sconto_update.html', {'formset': formset})